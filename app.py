@@ -1,12 +1,20 @@
 
 import streamlit as st
 import os
-import time
 import random
 from datetime import datetime
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 from dotenv import load_dotenv
+from search_engine import SearchEngine, broad_genre_terms
+from query_planner import sharded
+from rate_limiter import AdaptiveRateLimiter
+from search_cache import SearchCache, slim_track
+from catalog import TrackCatalog
+from yield_stats import TermYieldStore
+from pipeline import MixPipeline
+from sessions import spotify_client
+from streamlit.runtime.scriptrunner import add_script_run_ctx
 
 # Configurações de Página (Deve ser a primeira chamada Streamlit)
 st.set_page_config(
@@ -26,8 +34,10 @@ MAX_TRACKS = 100000
 PLAYLIST_LIMIT = 10000
 TRACKS_PER_REQUEST = 50
 SEARCH_LIMIT = 20
-SAFE_MODE_DELAY_MIN = 3
-SAFE_MODE_DELAY_MAX = 5
+RATE_LIMIT_START = 1.0
+RATE_LIMIT_MIN = 0.2
+RATE_LIMIT_MAX = 5.0
+SEARCH_WORKERS = 4
 
 AVAILABLE_GENRES = [
     "acoustic", "afrobeat", "alt-rock", "alternative", "alternative-metal", "ambient", "anime",
@@ -198,6 +208,20 @@ class SpotifyMegaMixerApp:
             st.session_state.auth_token = ''
         if 'logs' not in st.session_state:
             st.session_state.logs = []
+        if 'rate_limiter' not in st.session_state:
+            # Limitador adaptativo (429/Retry-After) compartilhado pelas chamadas desta sessão
+            st.session_state.rate_limiter = AdaptiveRateLimiter(
+                rate=RATE_LIMIT_START, min_rate=RATE_LIMIT_MIN, max_rate=RATE_LIMIT_MAX
+            )
+        if 'search_cache' not in st.session_state:
+            # Cache local das buscas (TTL + LRU) em disco
+            st.session_state.search_cache = SearchCache()
+        if 'track_catalog' not in st.session_state:
+            # Catálogo local: mixes repetidos saem do disco, não da API
+            st.session_state.track_catalog = TrackCatalog()
+        if 'term_yields' not in st.session_state:
+            # Histórico de rendimento por termo (ordena os termos nas próximas buscas)
+            st.session_state.term_yields = TermYieldStore()
 
     def log(self, message):
         """Adiciona log ao estado para renderizar na UI"""
@@ -207,10 +231,6 @@ class SpotifyMegaMixerApp:
         if len(st.session_state.logs) > 50:
             st.session_state.logs.pop(0)
 
-    def smart_sleep(self):
-        delay = random.uniform(SAFE_MODE_DELAY_MIN, SAFE_MODE_DELAY_MAX)
-        time.sleep(delay)
-
     def authenticate_with_token(self, token):
         """Tenta autenticar com o token fornecido"""
         try:
@@ -221,10 +241,9 @@ class SpotifyMegaMixerApp:
             clean_token = clean_token.replace("'", "").replace('"', "").replace("\\", "").strip()
             
             # Configurar com timeout curto e SEM retries para evitar travamento em caso de bloqueio (429)
-            self.sp = spotipy.Spotify(
+            self.sp = spotify_client(
                 auth=clean_token,
-                requests_timeout=10,
-                status_retries=0
+                requests_timeout=10
             )
             
             # Testar conexão
@@ -284,54 +303,63 @@ class SpotifyMegaMixerApp:
             st.error(f"Erro inesperado: {e}")
             return False
 
-    def search_tracks(self, genres, target_count, progress_bar, status_text):
-        """Busca músicas pelos gêneros"""
+    def cached_playlist_ids(self, genre):
+        """IDs das playlists encontradas para o gênero (via cache quando possível)"""
         sp = st.session_state.sp_instance
-        track_uris = set()
-        tracks_per_genre = int(target_count / len(genres)) + 1
-        
+        limiter = st.session_state.rate_limiter
+
+        def load():
+            results = limiter.call(sp.search, q=genre, type='playlist', limit=5)
+            return [p['id'] for p in results.get('playlists', {}).get('items', []) if p and p.get('id')]
+        playlist_ids, _ = st.session_state.search_cache.fetch('playlist_search', genre, 0, 5, None, load)
+        return playlist_ids
+
+    def cached_playlist_tracks(self, playlist_id):
+        """Primeiras músicas de uma playlist (via cache quando possível)"""
+        sp = st.session_state.sp_instance
+        limiter = st.session_state.rate_limiter
+
+        def load():
+            results = limiter.call(sp.playlist_tracks, playlist_id, limit=30)
+            return [slim_track(item['track']) for item in results.get('items', []) if item.get('track')]
+        tracks, _ = st.session_state.search_cache.fetch('playlist_tracks', playlist_id, 0, 30, None, load)
+        return tracks
+
+    def search_tracks(self, genres, target_count, progress_bar, status_text, on_tracks=None):
+        """Busca músicas pelos gêneros (on_tracks recebe as novas assim que aparecem)"""
+        sp = st.session_state.sp_instance
+        limiter = st.session_state.rate_limiter
         self.log(f"Iniciando busca para: {', '.join(genres)}")
         
-        for idx, genre in enumerate(genres):
-            status_text.text(f"🔍 Processando gênero: {genre} ({idx+1}/{len(genres)})")
-            
-            genre_tracks = set()
-            
-            # --- Estratégia 1: Recomendações ---
-            if genre in AVAILABLE_GENRES:
-                try:
-                    results = sp.recommendations(seed_genres=[genre], limit=TRACKS_PER_REQUEST, min_popularity=0)
-                    for track in results.get('tracks', []):
-                        if track.get('uri'): genre_tracks.add(track['uri'])
-                    self.smart_sleep()
-                except Exception: pass
-            
-            # --- Estratégia 2: Busca por termos ---
-            search_terms = [f"genre:\"{genre}\"", f"tag:{genre}", f"{genre} playlist", f"{genre} mix", genre]
-            
-            for term in search_terms:
-                if len(genre_tracks) >= tracks_per_genre: break
-                
-                offset = 0
-                while offset < 100 and len(genre_tracks) < tracks_per_genre:
-                    try:
-                        results = sp.search(q=term, type='track', limit=SEARCH_LIMIT, offset=offset)
-                        items = results.get('tracks', {}).get('items', [])
-                        if not items: break
-                        
-                        for track in items:
-                            if track.get('uri'): genre_tracks.add(track['uri'])
-                        
-                        offset += SEARCH_LIMIT
-                        self.smart_sleep()
-                    except Exception: break
-            
-            self.log(f"Encontradas {len(genre_tracks)} músicas para '{genre}'")
-            track_uris.update(genre_tracks)
-            
-            # Atualizar barra de progresso (0-50% reservada para busca de faixas diretas)
-            current_progress = int((idx + 1) / len(genres) * 50)
-            progress_bar.progress(current_progress)
+        status_text.text(f"🔍 Processando {len(genres)} gêneros em paralelo...")
+        finished = []
+
+        def genre_done(genre, count):
+            # Chamado na thread do script (coordenador), seguro para o Streamlit
+            finished.append(genre)
+            self.log(f"Encontradas {count} músicas para '{genre}'")
+            status_text.text(f"🔍 Gênero concluído: {genre} ({len(finished)}/{len(genres)})")
+
+        # --- Estratégias 1 e 2: Recomendações + busca por termos (em paralelo) ---
+        engine = SearchEngine(
+            sp,
+            limiter=limiter,
+            max_workers=SEARCH_WORKERS,
+            search_limit=SEARCH_LIMIT,
+            max_offset=100,
+            rec_quota=TRACKS_PER_REQUEST,
+            seed_genres=AVAILABLE_GENRES,
+            terms=sharded(broad_genre_terms),  # + fatias year:/tag: para mixes grandes
+            on_genre_done=genre_done,
+            log=self.log,
+            cache=st.session_state.search_cache,
+            catalog=st.session_state.track_catalog,
+            catalog_first=True,
+            yield_store=st.session_state.term_yields,
+            on_tracks=on_tracks,
+        )
+        track_uris = set(engine.search(genres, target_count))
+        self.log(f"Cache: {engine.stats['cache_hits']} acertos / {engine.stats['cache_misses']} falhas")
 
         # --- Estratégia 3: Buscar em Playlists (Complementar) ---
         if len(track_uris) < target_count:
@@ -340,94 +368,70 @@ class SpotifyMegaMixerApp:
                 if len(track_uris) >= target_count: break
                 
                 try:
-                    playlist_results = sp.search(q=genre, type='playlist', limit=5)
-                    self.smart_sleep()
-                    
-                    for playlist in playlist_results.get('playlists', {}).get('items', []):
+                    for playlist_id in self.cached_playlist_ids(genre):
                         if len(track_uris) >= target_count: break
-                        if playlist and playlist.get('id'):
-                            try:
-                                playlist_tracks = sp.playlist_tracks(playlist['id'], limit=30)
-                                for item in playlist_tracks.get('items', []):
-                                    track = item.get('track')
-                                    if track and track.get('uri') and not track['uri'].startswith('spotify:local:'):
-                                        track_uris.add(track['uri'])
-                                self.smart_sleep()
-                            except Exception: continue
+                        try:
+                            fresh = []
+                            for track in self.cached_playlist_tracks(playlist_id):
+                                uri = track.get('uri')
+                                if uri and not uri.startswith('spotify:local:') and uri not in track_uris:
+                                    track_uris.add(uri)
+                                    fresh.append(uri)
+                            if fresh and on_tracks: on_tracks(fresh)
+                        except Exception: continue
                 except Exception: pass
-                
-                # Atualizar barra (50-70%)
-                current_progress = 50 + int((idx + 1) / len(genres) * 20)
-                progress_bar.progress(current_progress)
 
         track_list = list(track_uris)
         random.shuffle(track_list)
         return track_list[:target_count]
 
-    def create_and_fill_playlists(self, genres, all_tracks, progress_bar, status_text):
+    def playlist_details(self, genres, vol_num, total_vols, count, timestamp):
+        """Nome e descrição de um volume"""
+        title_genres = ", ".join(genres[:2]).title()
+        if len(genres) > 2: title_genres += " & More"
+        
+        name = f"🎵 {title_genres} Mix"
+        if total_vols > 1: name += f" - Vol. {vol_num}/{total_vols}"
+        
+        desc = f"Super Mix gerado com: {', '.join(genres)}. {count} músicas. Criado em {timestamp}."
+        if total_vols > 1: desc += f" (Parte {vol_num}/{total_vols})"
+        return name, desc
+
+    def create_and_fill_playlists(self, genres, target_count, progress_bar, status_text):
+        """Busca e grava ao mesmo tempo: o Volume 1 é criado assim que a primeira janela de músicas chega"""
         sp = st.session_state.sp_instance
+        limiter = st.session_state.rate_limiter
         user_id = st.session_state.user_info['id']
+        timestamp = datetime.now().strftime("%Y-%m-%d")
         
-        total_found = len(all_tracks)
-        total_vols = (total_found // PLAYLIST_LIMIT) + (1 if total_found % PLAYLIST_LIMIT > 0 else 0)
+        def on_volume(volume):
+            self.log(f"Playlist criada: {volume['name']}")
+            status_text.text(f"💾 Volume {volume['num']} criado, adicionando músicas...")
         
-        links = []
+        def on_batch(volume):
+            # Progresso geral pela quantidade já gravada
+            progress_bar.progress(min(100, int(pipeline.written / target_count * 100)))
+            status_text.text(f"📥 Adicionando músicas ao Vol. {volume['num']}: {volume['written']}")
         
-        for i in range(0, total_found, PLAYLIST_LIMIT):
-            vol_tracks = all_tracks[i : i + PLAYLIST_LIMIT]
-            vol_num = (i // PLAYLIST_LIMIT) + 1
-            
-            # Detalhes da Playlist
-            timestamp = datetime.now().strftime("%Y-%m-%d")
-            title_genres = ", ".join(genres[:2]).title()
-            if len(genres) > 2: title_genres += " & More"
-            
-            name = f"🎵 {title_genres} Mix"
-            if total_vols > 1: name += f" - Vol. {vol_num}/{total_vols}"
-            
-            desc = f"Super Mix gerado com: {', '.join(genres)}. {len(vol_tracks)} músicas. Criado em {timestamp}."
-            if total_vols > 1: desc += f" (Parte {vol_num}/{total_vols})"
-            
-            status_text.text(f"💾 Criando Playlist Volume {vol_num}...")
-            
-            try:
-                # Criar
-                playlist = sp.user_playlist_create(
-                    user=user_id,
-                    name=name,
-                    public=True,
-                    description=desc
-                )
-                playlist_id = playlist['id']
-                playlist_url = playlist['external_urls']['spotify']
-                links.append((name, playlist_url))
-                
-                self.log(f"Playlist criada: {name}")
-                
-                # Adicionar Músicas
-                added_count = 0
-                for j in range(0, len(vol_tracks), TRACKS_PER_REQUEST):
-                    batch = vol_tracks[j:j + TRACKS_PER_REQUEST]
-                    try:
-                        sp.playlist_add_items(playlist_id, batch)
-                        added_count += len(batch)
-                        self.smart_sleep()
-                        
-                        # Progresso do Volume (70-100%)
-                        overall_completion = 70 + int((vol_num / total_vols) * 30 * ((j + len(batch)) / len(vol_tracks)))
-                        if overall_completion > 100: overall_completion = 100
-                        progress_bar.progress(overall_completion)
-                        
-                        status_text.text(f"📥 Adicionando músicas ao Vol. {vol_num}: {added_count}/{len(vol_tracks)}")
-                        
-                    except Exception as e:
-                        self.log(f"Erro ao adicionar lote: {e}")
-                
-            except Exception as e:
-                self.log(f"Erro crítico ao criar playlist: {e}")
-                st.error(f"Erro ao criar playlist: {e}")
+        pipeline = MixPipeline(
+            sp, user_id, target_count,
+            lambda vol_num, total_vols, count: self.playlist_details(genres, vol_num, total_vols, count, timestamp),
+            limiter,
+            batch_size=TRACKS_PER_REQUEST,
+            playlist_limit=PLAYLIST_LIMIT,
+            on_volume=on_volume,
+            on_batch=on_batch,
+            # A thread de gravação atualiza a UI: precisa do contexto do script
+            prepare_thread=add_script_run_ctx,
+            log=lambda message: self.log(f"Erro ao adicionar lote: {message}"),
+        )
+        try:
+            pipeline.run(lambda feed: self.search_tracks(genres, target_count, progress_bar, status_text, on_tracks=feed))
+        except Exception as e:
+            self.log(f"Erro crítico ao criar playlist: {e}")
+            st.error(f"Erro ao criar playlist: {e}")
         
-        return links
+        return [(link['name'], link['url']) for link in pipeline.links], pipeline
 
 # ==========================================
 # INTERFACE DO USUÁRIO
@@ -535,21 +539,22 @@ def main():
                 progress_bar = st.progress(0)
                 
                 with st.spinner("Iniciando os motores..."):
-                    # 1. Buscar
-                    all_tracks = app.search_tracks(selected_genres, track_count, progress_bar, status_box)
+                    # 1. Buscar + 2. Criar (em paralelo: as playlists enchem durante a busca)
+                    links, pipeline = app.create_and_fill_playlists(selected_genres, track_count, progress_bar, status_box)
+                    all_tracks = pipeline.tracks
                     
                     if not all_tracks:
                         st.error("Nenhuma música encontrada com esses critérios. Tente termos mais populares.")
                     else:
-                        # 2. Criar
-                        links = app.create_and_fill_playlists(selected_genres, all_tracks, progress_bar, status_box)
-                        
                         # 3. Sucesso
                         progress_bar.progress(100)
                         status_box.empty()
                         
                         st.balloons()
                         st.success("✅ Processo concluído com sucesso!")
+                        stats = st.session_state.rate_limiter.stats()
+                        st.caption(f"{stats['api_calls']} chamadas à API ({stats['api_calls'] / len(all_tracks):.3f} por música) · {stats['throttled_seconds']:.1f}s em espera · {stats['throttle_events']} bloqueios 429")
+                        st.caption(f"Primeira playlist criada em {pipeline.time_to_first_playlist:.1f}s")
                         
                         st.markdown("### 🔗 Suas Novas Playlists:")
                         for title, url in links:
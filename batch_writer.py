@@ -0,0 +1,110 @@
+"""
+Failure-isolating playlist writer.
+
+`playlist_add_items` used to be all-or-nothing per batch: one bad URI or one
+transient 5xx dropped the whole batch. BatchWriter retries transient errors
+(5xx, timeouts, connection resets) with exponential backoff; when an error
+persists, or Spotify rejects the request (e.g. 400 for a malformed URI), it
+bisects the batch so the good URIs are still written in order and only the
+bad ones are reported, each with its error. Errors no URI can cause (a
+deleted playlist's 404, a full playlist's 400) are raised at once instead:
+bisecting them would cost ~2n calls and fail every one.
+
+Batches use the API maximum (100 URIs) while the rate budget is healthy and
+fall back to `batch_size` while it is throttled, so a 10k volume takes ~100
+write calls instead of 200.
+"""
+import time
+
+MAX_ITEMS_PER_CALL = 100
+TRANSIENT_STATUSES = (500, 502, 503, 504)
+FATAL_STATUSES = (401, 403, 404, 429)  # Token/permission problems, a gone playlist, long lockouts
+SIZE_LIMIT_MESSAGE = "size limit"  # 400 "Playlist size limit reached"
+
+
+def retries_exhausted(e):
+    """
+    spotipy's "Max Retries" error: a 429 with code -1 and no headers, raised
+    when its own session gave up on a 429 *or* a 5xx. Not a real lockout.
+    """
+    return getattr(e, 'http_status', None) == 429 and getattr(e, 'code', None) == -1 \
+        and not getattr(e, 'headers', None)
+
+
+def is_transient(e):
+    status = getattr(e, 'http_status', None)
+    if status is None:
+        return isinstance(e, OSError)  # requests' ConnectionError/Timeout are IOErrors
+    return status in TRANSIENT_STATUSES or retries_exhausted(e)
+
+
+def is_fatal(e):
+    """Errors about the request or playlist as a whole: splitting the batch can't help."""
+    status = getattr(e, 'http_status', None)
+    if status == 400:
+        return SIZE_LIMIT_MESSAGE in str(getattr(e, 'msg', e)).lower()
+    return status in FATAL_STATUSES and not retries_exhausted(e)
+
+
+class WriteResult:
+    def __init__(self):
+        self.written = []
+        self.failures = []  # (uri, error message)
+        self.snapshot_id = None
+        self.calls = 0
+
+
+class BatchWriter:
+    def __init__(self, sp, limiter, batch_size=50, max_batch=MAX_ITEMS_PER_CALL,
+                 retries=3, backoff=1.0, log=None):
+        self.sp = sp
+        self.limiter = limiter
+        self.batch_size = batch_size
+        self.max_batch = max_batch
+        self.retries = retries
+        self.backoff = backoff
+        self.log = log or (lambda message: None)
+
+    def next_size(self):
+        """URIs per call right now: the API maximum unless the budget is throttled."""
+        return self.max_batch if self.limiter.healthy else self.batch_size
+
+    def write(self, playlist_id, uris):
+        """
+        Appends `uris` (one call, split only on errors) to the playlist, in
+        order. Raises on errors of the whole request (token, permission, gone
+        or full playlist) so the caller can stop (and resume later); every
+        other failure is isolated per URI.
+        """
+        result = WriteResult()
+        self._write(playlist_id, list(uris), result)
+        return result
+
+    def _write(self, playlist_id, uris, result):
+        error = None
+        for attempt in range(self.retries + 1):
+            try:
+                result.calls += 1
+                response = self.limiter.call(self.sp.playlist_add_items, playlist_id, uris)
+            except Exception as e:
+                if is_fatal(e):
+                    raise
+                error = e
+                if not is_transient(e) or attempt == self.retries:
+                    break
+                delay = self.backoff * 2 ** attempt
+                self.log(f"Transient error adding {len(uris)} tracks ({e}); retrying in {delay:.0f}s")
+                time.sleep(delay)
+                continue
+            result.written.extend(uris)
+            result.snapshot_id = (response or {}).get('snapshot_id') or result.snapshot_id
+            return
+
+        if len(uris) == 1:
+            result.failures.append((uris[0], str(error)))
+            self.log(f"Could not add {uris[0]}: {error}")
+            return
+        # The same error keeps coming back: isolate the URIs that cause it
+        middle = len(uris) // 2
+        self._write(playlist_id, uris[:middle], result)
+        self._write(playlist_id, uris[middle:], result)
@@ -0,0 +1,296 @@
+"""
+End-to-end benchmark of mix creation against the local Spotify stand-in.
+
+    python bench.py                                   # 1k/10k/100k x 1/5/20 genres, both paths
+    python bench.py --scales 1000,10000 --genres 5 --out bench.json
+    python bench.py --baseline bench.json --tolerance 0.15    # exit 1 on regressions
+
+Each scenario (path x track count x genre count) runs in its own process
+with an empty MIXER_DATA_DIR (cold caches/catalog, memory rate budget), so
+peak RSS and timings don't leak between scenarios. Paths:
+
+- `logic`: server.search_tracks_logic + server.create_playlists_logic
+- `execute`: POST /execute through the ASGI app (no HTTP server in between)
+
+Reported per scenario: wall time, tracks delivered, API calls per delivered
+track, time sleeping in the rate limiter vs. inside Spotify calls (summed
+over threads), peak RSS and time to the first written playlist, plus the
+stand-in's own call/429/5xx counts. Results are JSON so runs can be diffed;
+with --baseline, a metric worse than the baseline by more than --tolerance
+fails the run.
+
+fake_spotify.py is started on a free port unless --api-base points at a
+running instance (its config is then left as is).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BENCH_TOKEN = "bench-token"
+BENCH_GENRES = ["phonk", "rock", "pop", "techno", "jazz", "hip-hop", "ambient", "metal", "house",
+                "synthwave", "lo-fi", "trance", "punk", "funk", "disco", "blues", "reggae", "drill",
+                "shoegaze", "vaporwave"]
+# Metric -> True when higher is better; the rest are compared lower-is-better
+COMPARED_METRICS = {"wall_seconds": False, "calls_per_track": False, "peak_rss_mb": False,
+                    "time_to_first_playlist": False, "delivered": True}
+
+
+# ==========================================
+# SCENARIO (runs in a child process)
+# ==========================================
+def asgi_request(app, method, path, body=None):
+    """Minimal in-process ASGI client: (status, parsed JSON body)."""
+    payload = json.dumps(body).encode() if body is not None else b""
+
+    async def run():
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+            "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+            "client": ("127.0.0.1", 0), "server": ("bench", 80),
+        }
+        messages = [{"type": "http.request", "body": payload, "more_body": False}]
+        never = asyncio.Event()
+        response = {"status": None, "body": b""}
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await never.wait()  # The client never disconnects
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["body"] += message.get("body", b"")
+
+        await app(scope, receive, send)
+        return response["status"], json.loads(response["body"] or b"null")
+
+    return asyncio.run(run())
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_scenario(scenario):
+    import server
+
+    if scenario.get("max_rate"):
+        server.RATE_LIMITER.max_rate = scenario["max_rate"]
+    genres = BENCH_GENRES[:scenario["genres"]]
+    target = scenario["tracks"]
+    started = time.monotonic()
+
+    if scenario["path"] == "execute":
+        status, body = asgi_request(server.app, "POST", "/execute", {
+            "token": BENCH_TOKEN, "genres": genres, "track_count": target, "playlist_name": "Bench",
+        })
+        wall = time.monotonic() - started
+        if status != 200 or body.get("status") != "success":
+            return {"error": f"HTTP {status}: {body}"}
+        delivered = body["total_tracks"]
+        stats = body
+        first_playlist = body.get("time_to_first_playlist")
+    else:
+        sp = server.SPOTIFY_SESSIONS.client(BENCH_TOKEN)
+        limiter = server.RATE_LIMITER.scoped()
+        user = server.SPOTIFY_SESSIONS.profile(BENCH_TOKEN, limiter)
+        first_write = []
+
+        def on_batch(vol_num, written, total):
+            if not first_write:
+                first_write.append(time.monotonic() - started)
+        tracks = server.search_tracks_logic(sp, genres, target, limiter)
+        server.create_playlists_logic(sp, user['id'], genres, tracks, "Bench", None, limiter, on_batch=on_batch)
+        wall = time.monotonic() - started
+        delivered = len(tracks)
+        stats = limiter.stats()
+        first_playlist = round(first_write[0], 2) if first_write else None
+
+    return {
+        "delivered": delivered,
+        "wall_seconds": round(wall, 2),
+        "api_calls": stats["api_calls"],
+        "calls_per_track": round(stats["api_calls"] / delivered, 4) if delivered else None,
+        "sleep_seconds": stats["throttled_seconds"],
+        "network_seconds": stats["network_seconds"],
+        "throttle_events": stats["throttle_events"],
+        "peak_rss_mb": peak_rss_mb(),
+        "time_to_first_playlist": first_playlist,
+    }
+
+
+# ==========================================
+# HARNESS (parent process)
+# ==========================================
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def fake_request(api_base, path, body=None):
+    url = api_base.rstrip("/").rsplit("/v1", 1)[0] + path
+    data = json.dumps(body).encode() if body is not None else (b"" if path.endswith("reset") else None)
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def start_fake(args):
+    port = free_port()
+    command = [sys.executable, os.path.join(HERE, "fake_spotify.py"), "--port", str(port),
+               "--seed", str(args.seed), "--latency", args.latency, "--rate-limit", str(args.rate_limit),
+               "--error-rate", str(args.error_rate), "--genre-size", str(args.genre_size)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    api_base = f"http://127.0.0.1:{port}/v1/"
+    for _ in range(100):
+        try:
+            fake_request(api_base, "/_fake/config")
+            return process, api_base
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("fake_spotify.py did not start")
+
+
+def run_child(scenario, api_base, verbose):
+    with tempfile.TemporaryDirectory(prefix="bench-") as data_dir:
+        result_path = os.path.join(data_dir, "result.json")
+        env = dict(os.environ, SPOTIFY_API_BASE=api_base, MIXER_DATA_DIR=data_dir, RATE_BUDGET="memory")
+        command = [sys.executable, os.path.abspath(__file__), "--scenario", json.dumps(scenario),
+                   "--result-file", result_path]
+        output = None if verbose else subprocess.DEVNULL
+        code = subprocess.call(command, env=env, cwd=HERE, stdout=output, stderr=output)
+        if code != 0 or not os.path.exists(result_path):
+            return {"error": f"scenario process exited with {code}"}
+        with open(result_path) as f:
+            return json.load(f)
+
+
+def scenario_key(result):
+    return f"{result['path']}/{result['tracks']}/{result['genres']}"
+
+
+def compare(results, baseline, tolerance):
+    """Regression messages: metrics worse than the baseline by more than `tolerance`."""
+    previous = {scenario_key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        old = previous.get(scenario_key(result))
+        if not old or "error" in old:
+            continue
+        if "error" in result:
+            regressions.append(f"{scenario_key(result)}: {result['error']}")
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            new_value, old_value = result.get(metric), old.get(metric)
+            if new_value is None or not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{scenario_key(result)}: {metric} {old_value} -> {new_value} ({change:+.0%})")
+    return regressions
+
+
+def print_table(results):
+    columns = ["path", "tracks", "genres", "delivered", "wall_seconds", "calls_per_track", "sleep_seconds",
+               "network_seconds", "peak_rss_mb", "time_to_first_playlist"]
+    print(" | ".join(columns))
+    for result in results:
+        if "error" in result:
+            print(f"{result['path']} | {result['tracks']} | {result['genres']} | ERROR: {result['error']}")
+        else:
+            print(" | ".join(str(result.get(column)) for column in columns))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Mix creation benchmark (against fake_spotify.py)")
+    parser.add_argument("--scales", default="1000,10000,100000", help="Track counts")
+    parser.add_argument("--genres", default="1,5,20", help="Genre counts")
+    parser.add_argument("--paths", default="logic,execute", help="logic and/or execute")
+    parser.add_argument("--api-base", help="Use a running stand-in (e.g. http://127.0.0.1:8900/v1/)")
+    parser.add_argument("--latency", default="search=0.08,recommendations=0.1,default=0.05",
+                        help="Stand-in latency per endpoint")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Stand-in calls/s before 429s (0: off)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Stand-in share of 5xx answers")
+    parser.add_argument("--genre-size", type=int, default=100000, help="Stand-in tracks per genre")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-rate", type=float, help="Override the server limiter's max calls/s")
+    parser.add_argument("--out", help="Write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression")
+    parser.add_argument("--verbose", action="store_true", help="Show the scenarios' own output")
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.scenario:
+        result = run_scenario(json.loads(args.scenario))
+        with open(args.result_file, "w") as f:
+            json.dump(result, f)
+        return 0
+
+    fake, api_base = (None, args.api_base) if args.api_base else start_fake(args)
+    results = []
+    try:
+        for path in args.paths.split(","):
+            for tracks in [int(n) for n in args.scales.split(",")]:
+                for genres in [int(n) for n in args.genres.split(",")]:
+                    scenario = {"path": path, "tracks": tracks, "genres": genres, "max_rate": args.max_rate}
+                    print(f"▶ {path}: {tracks} tracks, {genres} genre(s)...", flush=True)
+                    fake_request(api_base, "/_fake/reset")
+                    result = run_child(scenario, api_base, args.verbose)
+                    result.update(path=path, tracks=tracks, genres=genres,
+                                  api=fake_request(api_base, "/_fake/stats"))
+                    result["api"].pop("endpoints", None)
+                    results.append(result)
+    finally:
+        if fake:
+            fake.terminate()
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {key: getattr(args, key) for key in
+                   ("latency", "rate_limit", "error_rate", "genre_size", "seed", "max_rate")},
+        "results": results,
+    }
+    print_table(results)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.out}")
+
+    failed = any("error" in r for r in results)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Local track catalog: every track the search engine sees, indexed by genre tag,
+artist and popularity, plus the query that found it.
+
+Repeat mixes read their quota from here first and only ask Spotify for the
+shortfall, so a genre that was already harvested fills in seconds.
+"""
+import threading
+import time
+
+from storage import connect, data_path
+
+RECOMMENDATIONS_QUERY = "recommendations"
+
+
+def _release_year(track):
+    date = (track.get('album') or {}).get('release_date') or ''
+    return int(date[:4]) if date[:4].isdigit() else None
+
+
+class TrackCatalog:
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._conn = connect(path or data_path("catalog.sqlite3"))
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tracks (
+                uri TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                artist TEXT NOT NULL,
+                artist_id TEXT,
+                popularity INTEGER,
+                release_year INTEGER,
+                seen REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS track_tags (
+                uri TEXT NOT NULL,
+                genre TEXT NOT NULL,
+                query TEXT NOT NULL,
+                PRIMARY KEY (uri, genre, query)
+            );
+            CREATE INDEX IF NOT EXISTS track_tags_genre ON track_tags (genre, query);
+            CREATE INDEX IF NOT EXISTS tracks_artist ON tracks (artist);
+            CREATE INDEX IF NOT EXISTS tracks_popularity ON tracks (popularity);
+            """
+        )
+
+    def record(self, tracks, genre, query):
+        """Stores tracks (full or slim Spotify objects) found by `query` for `genre`."""
+        now = time.time()
+        rows, tags = [], []
+        for track in tracks:
+            if not track or not track.get('uri'):
+                continue
+            artists = track.get('artists') or [{}]
+            rows.append((
+                track['uri'], track.get('name', ''), artists[0].get('name', ''),
+                artists[0].get('id'), track.get('popularity'), _release_year(track), now,
+            ))
+            tags.append((track['uri'], genre, query))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO tracks (uri, name, artist, artist_id, popularity, release_year, seen)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT(uri) DO UPDATE SET popularity = excluded.popularity, seen = excluded.seen",
+                    rows,
+                )
+                self._conn.executemany("INSERT OR IGNORE INTO track_tags (uri, genre, query) VALUES (?, ?, ?)",
+                                       tags)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def tracks_for_genre(self, genre, limit, queries=None, min_popularity=None):
+        """
+        Random sample of up to `limit` catalog tracks tagged with `genre`.
+        `queries` restricts the sample to tracks found by those queries (so the
+        server's strict `genre:` mixes never pick up tracks from broad terms).
+        Returns slim track dicts (uri, name, popularity, artists).
+        """
+        sql = ("SELECT DISTINCT t.uri, t.name, t.artist, t.artist_id, t.popularity FROM track_tags g"
+               " JOIN tracks t ON t.uri = g.uri WHERE g.genre = ?")
+        params = [genre]
+        if queries:
+            sql += f" AND g.query IN ({', '.join('?' * len(queries))})"
+            params.extend(queries)
+        if min_popularity is not None:
+            sql += " AND t.popularity >= ?"
+            params.append(min_popularity)
+        sql += " ORDER BY RANDOM() LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            {'uri': uri, 'name': name, 'popularity': popularity,
+             'artists': [{'id': artist_id, 'name': artist}]}
+            for uri, name, artist, artist_id, popularity in rows
+        ]
+
+    def count(self, genre=None):
+        with self._lock:
+            if genre is None:
+                return self._conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+            return self._conn.execute(
+                "SELECT COUNT(DISTINCT uri) FROM track_tags WHERE genre = ?", (genre,)
+            ).fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            tracks = self._conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+            genres = self._conn.execute("SELECT COUNT(DISTINCT genre) FROM track_tags").fetchone()[0]
+        return {"tracks": tracks, "genres": genres}
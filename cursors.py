@@ -0,0 +1,113 @@
+"""
+Per-mix search cursors for incremental refreshes.
+
+A recurring mix (same user and genres, or the same synced playlist) used to
+page every `genre:"x"` term from offset 0 again and mostly collect tracks it
+had already delivered. The cursor of a mix remembers, per genre and term, how
+far the term was paged (and whether it ran dry), plus every URI the mix has
+delivered. A refresh run (SearchEngine(cursor=..., refresh=True)) then only
+fetches new material: the fresh shards (`tag:new`, the most recent `year:`
+shards, see query_planner.fresh_terms) from the top, then the other terms
+from their first unvisited offset, skipping dead ones; delivered URIs are
+never accepted again.
+"""
+import threading
+import time
+
+from storage import connect, data_path
+
+
+def cursor_key(user_id, genres, playlist_id=None):
+    """Identity of a recurring mix: its synced playlist, else the user's genre set."""
+    if playlist_id:
+        return f"playlist:{playlist_id}"
+    return f"user:{user_id}:{'+'.join(sorted(genres))}"
+
+
+class CursorStore:
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._conn = connect(path or data_path("cursors.sqlite3"))
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS search_cursors (
+                mix_key TEXT NOT NULL,
+                genre TEXT NOT NULL,
+                term TEXT NOT NULL,
+                next_offset INTEGER NOT NULL,
+                exhausted INTEGER NOT NULL DEFAULT 0,
+                updated REAL NOT NULL,
+                PRIMARY KEY (mix_key, genre, term)
+            );
+            CREATE TABLE IF NOT EXISTS delivered_tracks (
+                mix_key TEXT NOT NULL,
+                uri TEXT NOT NULL,
+                delivered REAL NOT NULL,
+                PRIMARY KEY (mix_key, uri)
+            );
+            """
+        )
+
+    def cursor(self, mix_key):
+        """The stored cursor of `mix_key` (empty for a mix never run)."""
+        with self._lock:
+            terms = self._conn.execute(
+                "SELECT genre, term, next_offset, exhausted FROM search_cursors WHERE mix_key = ?", (mix_key,)
+            ).fetchall()
+            delivered = self._conn.execute(
+                "SELECT uri FROM delivered_tracks WHERE mix_key = ?", (mix_key,)
+            ).fetchall()
+        return MixCursor(self, mix_key, terms, {uri for (uri,) in delivered})
+
+    def _save_terms(self, mix_key, rows):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO search_cursors (mix_key, genre, term, next_offset, exhausted, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(mix_key, genre, term) DO UPDATE SET"
+                " next_offset = MAX(next_offset, excluded.next_offset),"
+                " exhausted = MAX(exhausted, excluded.exhausted), updated = excluded.updated",
+                [(mix_key, genre, term, offset, int(exhausted), now) for genre, term, offset, exhausted in rows],
+            )
+
+    def _save_delivered(self, mix_key, uris):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO delivered_tracks (mix_key, uri, delivered) VALUES (?, ?, ?)",
+                [(mix_key, uri, now) for uri in uris],
+            )
+
+
+class MixCursor:
+    """Cursor of one mix; `delivered` is the set of URIs it already delivered."""
+
+    def __init__(self, store, mix_key, terms, delivered):
+        self.store = store
+        self.key = mix_key
+        self._offsets = {(genre, term): offset for genre, term, offset, _ in terms}
+        self._exhausted = {(genre, term) for genre, term, _, exhausted in terms if exhausted}
+        self.delivered = delivered
+
+    def offset(self, genre, term):
+        """First offset of `term` not harvested yet."""
+        return self._offsets.get((genre, term), 0)
+
+    def exhausted(self, genre, term):
+        return (genre, term) in self._exhausted
+
+    def save_terms(self, rows):
+        """Records (genre, term, next_offset, exhausted) rows; offsets only move forward."""
+        rows = list(rows)
+        for genre, term, offset, exhausted in rows:
+            self._offsets[(genre, term)] = max(offset, self._offsets.get((genre, term), 0))
+            if exhausted:
+                self._exhausted.add((genre, term))
+        if rows:
+            self.store._save_terms(self.key, rows)
+
+    def add_delivered(self, uris):
+        fresh = [uri for uri in dict.fromkeys(uris) if uri not in self.delivered]
+        self.delivered.update(fresh)
+        if fresh:
+            self.store._save_delivered(self.key, fresh)
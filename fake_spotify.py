@@ -0,0 +1,501 @@
+"""
+Local stand-in for the Spotify Web API, for offline runs and repeatable benchmarks.
+
+    python fake_spotify.py --port 8900 --latency search=0.08,default=0.03 \\
+        --rate-limit 20 --burst-every 60 --burst-seconds 5 --error-rate 0.01
+    SPOTIFY_API_BASE=http://127.0.0.1:8900/v1/ uvicorn server:app
+    SPOTIFY_API_BASE=http://127.0.0.1:8900/v1/ python spotify_filler.py   (token mode, any token)
+
+Covers what the entry points call: /me, /me/tracks, /me/playlists, /search
+(tracks and playlists), /recommendations, /users/{id}/playlists,
+/playlists/{id} and /playlists/{id}/tracks (also /items: read, add, remove).
+Any bearer token is accepted and maps to its own user, so several tokens act
+as several users.
+
+Catalogs are deterministic for a `--seed`: a query at an offset always
+returns the same tracks, a genre's terms overlap like real search results,
+year:/tag: shards have seeded sizes (some empty) and offset + limit is capped
+at 1,000 per query.
+
+Faults (all live-adjustable with POST /_fake/config, JSON body):
+- `latency`: seconds per endpoint ("search", "recommendations", "me",
+  "playlists", "playlist_tracks", ...; "default" for the rest)
+- `rate_limit`: sustained calls/s (token bucket of one second's worth);
+  over it, 429 with Retry-After: `retry_after`
+- `burst_every` / `burst_seconds`: a 429 lockout window at the start of every
+  period, Retry-After set to the rest of the window
+- `error_rate`: share of calls answered with a 500/502/503
+
+GET /_fake/stats returns calls, 429s and 5xx per endpoint; POST /_fake/reset
+clears playlists and stats.
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+BASE62 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+MAX_RESULTS = 1000         # Spotify's offset + limit ceiling per query
+PLAYLIST_LIMIT = 10000
+URI_PATTERN = re.compile(r"^spotify:(track|episode):[A-Za-z0-9]{22}$")
+
+CONFIG = {
+    "seed": 42,
+    "latency": {"default": 0.0},
+    "rate_limit": 0.0,     # 0: unlimited
+    "retry_after": 2,
+    "burst_every": 0.0,    # 0: no lockouts
+    "burst_seconds": 0.0,
+    "error_rate": 0.0,
+    "saved_tracks": 500,   # Per user, for /me/tracks
+    "genre_size": 20000,   # Tracks per genre catalog
+}
+
+app = FastAPI(title="Fake Spotify Web API")
+
+
+# ==========================================
+# DETERMINISTIC CATALOG
+# ==========================================
+def _hash(*parts):
+    digest = hashlib.blake2b(":".join(str(p) for p in (CONFIG["seed"],) + parts).encode(), digest_size=16).digest()
+    return int.from_bytes(digest, "big")
+
+
+def _spotify_id(*parts):
+    value = _hash(*parts)
+    chars = []
+    for _ in range(22):
+        value, rem = divmod(value, 62)
+        chars.append(BASE62[rem])
+    return "".join(chars)
+
+
+def _genre_of(query):
+    match = re.search(r'genre:"([^"]+)"', query) or re.search(r"tag:(\S+)", query)
+    return match.group(1) if match else (query.split() or ["unknown"])[0].lower()
+
+
+def _track(genre, idx):
+    track_id = _spotify_id("track", genre, idx)
+    artist = idx % 500
+    year = datetime.now().year - _hash("year", genre, idx) % 60
+    title = genre.replace("-", " ").title()
+    return {
+        "id": track_id,
+        "uri": f"spotify:track:{track_id}",
+        "name": f"{title} Track {idx}",
+        "artists": [{"id": _spotify_id("artist", genre, artist), "name": f"{title} Artist {artist}"}],
+        "popularity": _hash("popularity", genre, idx) % 101,
+        "album": {"release_date": f"{year}-01-01"},
+        "type": "track",
+    }
+
+
+def _track_for_uri(uri):
+    return _TRACKS.get(uri) or {"uri": uri, "id": uri.rsplit(":", 1)[-1], "name": "", "artists": []}
+
+
+def _query_total(query):
+    """Results a query has: a full window for plain terms, seeded sizes (some empty) for shards."""
+    if "year:" in query or len(re.findall(r"tag:", query)) > (0 if 'genre:"' in query else 1):
+        return _hash("total", query) % (MAX_RESULTS + 1) if _hash("alive", query) % 5 else 0
+    return MAX_RESULTS
+
+
+def _results(query, offset, limit):
+    genre = _genre_of(query)
+    total = _query_total(query)
+    start = _hash("start", query) % CONFIG["genre_size"]
+    step = 7919  # Prime, so a query walks its genre without repeats unless the size is a multiple of it
+    size = CONFIG["genre_size"]
+    tracks = [_track(genre, (start + i * step) % size) for i in range(offset, min(offset + limit, total))]
+    return tracks, total
+
+
+# ==========================================
+# STATE (playlists, users, stats, fault injection)
+# ==========================================
+_lock = threading.Lock()
+_TRACKS = {}           # uri -> track object, for tracks served so far
+_PLAYLISTS = {}        # id -> {"id", "name", "description", "public", "owner", "items", "snapshot"}
+_STATS = {}            # endpoint -> {"calls", "throttled", "errors"}
+_bucket = {"tokens": 0.0, "time": 0.0}
+_rng = random.Random(CONFIG["seed"])
+_ids = itertools.count(1)
+
+
+def _remember(tracks):
+    with _lock:
+        for track in tracks:
+            _TRACKS[track["uri"]] = track
+    return tracks
+
+
+def _user_of(request):
+    auth = request.headers.get("authorization", "")
+    token = auth.split(" ", 1)[-1].strip()
+    return f"user{_hash('user', token) % 10 ** 8:08d}" if token else None
+
+
+def _endpoint(method, path):
+    path = path[len("/v1"):].rstrip("/")
+    path = re.sub(r"^/playlists/[^/]+", "/playlists/{id}", path)
+    path = re.sub(r"^/users/[^/]+", "/users/{id}", path)
+    return f"{method} {path.replace('/items', '/tracks')}"
+
+
+def _latency_key(endpoint):
+    path = endpoint.split(" ", 1)[1]
+    if path.startswith("/playlists/{id}/tracks"):
+        return "playlist_tracks"
+    return path.strip("/").split("/")[0] or "default"
+
+
+def _fault(endpoint, now):
+    """(status, retry_after) to inject for this call, or None."""
+    if CONFIG["burst_every"] and now % CONFIG["burst_every"] < CONFIG["burst_seconds"]:
+        return 429, math.ceil(CONFIG["burst_seconds"] - now % CONFIG["burst_every"])
+    if CONFIG["rate_limit"]:
+        rate = CONFIG["rate_limit"]
+        elapsed = now - _bucket["time"]
+        _bucket["tokens"] = min(rate, _bucket["tokens"] + elapsed * rate)
+        _bucket["time"] = now
+        if _bucket["tokens"] < 1:
+            return 429, CONFIG["retry_after"]
+        _bucket["tokens"] -= 1
+    if CONFIG["error_rate"] and _rng.random() < CONFIG["error_rate"]:
+        return _rng.choice((500, 502, 503)), None
+    return None
+
+
+def _error(status, message, headers=None):
+    return JSONResponse({"error": {"status": status, "message": message}}, status_code=status, headers=headers)
+
+
+@app.middleware("http")
+async def inject_faults(request, call_next):
+    if not request.url.path.startswith("/v1"):
+        return await call_next(request)
+    endpoint = _endpoint(request.method, request.url.path)
+    latency = CONFIG["latency"]
+    await asyncio.sleep(latency.get(_latency_key(endpoint), latency.get("default", 0.0)))
+    with _lock:
+        stats = _STATS.setdefault(endpoint, {"calls": 0, "throttled": 0, "errors": 0})
+        stats["calls"] += 1
+        fault = _fault(endpoint, time.time())
+        if fault:
+            stats["throttled" if fault[0] == 429 else "errors"] += 1
+    if _user_of(request) is None:
+        return _error(401, "No token provided")
+    if fault:
+        status, retry_after = fault
+        if status == 429:
+            return _error(429, "API rate limit exceeded", {"Retry-After": str(retry_after)})
+        return _error(status, "Injected server error")
+    return await call_next(request)
+
+
+# ==========================================
+# WEB API
+# ==========================================
+def _page(items, offset, limit, total, url):
+    return {
+        "items": items, "total": total, "limit": limit, "offset": offset,
+        "next": f"{url}?offset={offset + limit}&limit={limit}" if offset + limit < total else None,
+        "previous": None,
+    }
+
+
+def _playlist_object(playlist, full=False):
+    result = {
+        "id": playlist["id"], "name": playlist["name"], "description": playlist["description"],
+        "public": playlist["public"], "owner": {"id": playlist["owner"]},
+        "snapshot_id": str(playlist["snapshot"]), "uri": f"spotify:playlist:{playlist['id']}",
+        "external_urls": {"spotify": f"https://open.spotify.com/playlist/{playlist['id']}"},
+        "tracks": {"total": len(playlist["items"])},
+    }
+    if full:
+        result["tracks"] = _page([{"track": _track_for_uri(uri)} for uri in playlist["items"][:100]],
+                                 0, 100, len(playlist["items"]), f"/v1/playlists/{playlist['id']}/tracks")
+    return result
+
+
+def _new_playlist(owner, name, description="", public=True, items=()):
+    playlist_id = _spotify_id("playlist", next(_ids), time.time())
+    playlist = {"id": playlist_id, "name": name, "description": description or "", "public": public,
+                "owner": owner, "items": list(items), "snapshot": 1}
+    _PLAYLISTS[playlist_id] = playlist
+    return playlist
+
+
+def _limit(value, default, ceiling):
+    return max(1, min(int(value or default), ceiling))
+
+
+@app.get("/v1/me")
+@app.get("/v1/me/")
+def me(request: Request):
+    user = _user_of(request)
+    return {"id": user, "display_name": f"Fake {user}", "country": "US", "product": "premium",
+            "images": [], "followers": {"total": 0}, "uri": f"spotify:user:{user}"}
+
+
+@app.get("/v1/me/tracks")
+def saved_tracks(request: Request, limit: int = 20, offset: int = 0):
+    user = _user_of(request)
+    limit = _limit(limit, 20, 50)
+    total = CONFIG["saved_tracks"]
+    genres = ["pop", "rock", "phonk", "hip-hop", "lo-fi"]
+    items = [{"added_at": "2024-01-01T00:00:00Z",
+              "track": _track(genres[_hash("saved", user, i) % len(genres)], _hash("saved", user, i) % CONFIG["genre_size"])}
+             for i in range(offset, min(offset + limit, total))]
+    return _page(items, offset, limit, total, "/v1/me/tracks")
+
+
+def _user_playlists(user, limit, offset, url):
+    limit = _limit(limit, 20, 50)
+    with _lock:
+        owned = [p for p in _PLAYLISTS.values() if p["owner"] == user]
+    items = [_playlist_object(p) for p in owned[offset:offset + limit]]
+    return _page(items, offset, limit, len(owned), url)
+
+
+@app.get("/v1/me/playlists")
+def my_playlists(request: Request, limit: int = 20, offset: int = 0):
+    return _user_playlists(_user_of(request), limit, offset, "/v1/me/playlists")
+
+
+@app.get("/v1/users/{user_id}/playlists")
+def user_playlists(user_id: str, limit: int = 20, offset: int = 0):
+    return _user_playlists(user_id, limit, offset, f"/v1/users/{user_id}/playlists")
+
+
+@app.post("/v1/users/{user_id}/playlists")
+async def create_playlist(user_id: str, request: Request):
+    if user_id != _user_of(request):
+        return _error(403, "You cannot create a playlist for another user")
+    body = await request.json()
+    if not body.get("name"):
+        return _error(400, "Missing required field: name")
+    with _lock:
+        playlist = _new_playlist(user_id, body["name"], body.get("description"), body.get("public", True))
+        return JSONResponse(_playlist_object(playlist, full=True), status_code=201)
+
+
+@app.get("/v1/search")
+def search(q: str, type: str = "track", limit: int = 10, offset: int = 0):
+    limit = _limit(limit, 10, 50)
+    if offset + limit > MAX_RESULTS:
+        return _error(400, "Bad request: offset + limit over 1000")
+    if type == "playlist":
+        # Editorial playlists of the genre, filled with its catalog on first sight
+        genre = _genre_of(q)
+        items = []
+        with _lock:
+            for i in range(offset, offset + limit):
+                playlist_id = _spotify_id("editorial", genre, i)
+                if playlist_id not in _PLAYLISTS:
+                    tracks = [_track(genre, _hash("editorial", genre, i, j) % CONFIG["genre_size"]) for j in range(100)]
+                    for track in tracks:
+                        _TRACKS[track["uri"]] = track
+                    _PLAYLISTS[playlist_id] = {
+                        "id": playlist_id, "name": f"{genre.title()} Mix {i + 1}", "description": "",
+                        "public": True, "owner": "spotify", "items": [t["uri"] for t in tracks], "snapshot": 1,
+                    }
+                items.append(_playlist_object(_PLAYLISTS[playlist_id]))
+        return {"playlists": _page(items, offset, limit, MAX_RESULTS, "/v1/search")}
+    tracks, total = _results(q, offset, limit)
+    return {"tracks": _page(_remember(tracks), offset, limit, total, "/v1/search")}
+
+
+@app.get("/v1/recommendations")
+def recommendations(seed_genres: str = "", limit: int = 20, min_popularity: int = 0,
+                    max_popularity: int = 100, market: str = None):
+    genres = [g for g in seed_genres.split(",") if g]
+    if not genres or len(genres) > 5:
+        return _error(400, "Between 1 and 5 seeds are required")
+    limit = _limit(limit, 20, 100)
+    tracks = []
+    for i in range(limit * 5):
+        genre = genres[i % len(genres)]
+        track = _track(genre, _hash("rec", seed_genres, min_popularity, max_popularity, i) % CONFIG["genre_size"])
+        if min_popularity <= track["popularity"] <= max_popularity:
+            tracks.append(track)
+            if len(tracks) == limit:
+                break
+    return {"tracks": _remember(tracks), "seeds": [{"id": g, "type": "GENRE"} for g in genres]}
+
+
+def _playlist_or_error(playlist_id, request=None):
+    playlist = _PLAYLISTS.get(playlist_id)
+    if playlist is None:
+        return None, _error(404, "Resource not found")
+    if request is not None and playlist["owner"] != _user_of(request):
+        return None, _error(403, "You cannot modify a playlist you don't own")
+    return playlist, None
+
+
+@app.get("/v1/playlists/{playlist_id}")
+def get_playlist(playlist_id: str):
+    with _lock:
+        playlist, error = _playlist_or_error(playlist_id)
+        return error or _playlist_object(playlist, full=True)
+
+
+@app.put("/v1/playlists/{playlist_id}")
+async def change_playlist(playlist_id: str, request: Request):
+    body = await request.json()
+    with _lock:
+        playlist, error = _playlist_or_error(playlist_id, request)
+        if error:
+            return error
+        for key in ("name", "description", "public"):
+            if key in body:
+                playlist[key] = body[key]
+    return JSONResponse(None, status_code=200)
+
+
+@app.get("/v1/playlists/{playlist_id}/tracks")
+@app.get("/v1/playlists/{playlist_id}/items")
+def playlist_items(playlist_id: str, limit: int = 100, offset: int = 0):
+    limit = _limit(limit, 100, 100)
+    with _lock:
+        playlist, error = _playlist_or_error(playlist_id)
+        if error:
+            return error
+        uris = playlist["items"][offset:offset + limit]
+        total = len(playlist["items"])
+    items = [{"added_at": "2024-01-01T00:00:00Z", "track": _track_for_uri(uri)} for uri in uris]
+    return _page(items, offset, limit, total, f"/v1/playlists/{playlist_id}/tracks")
+
+
+@app.post("/v1/playlists/{playlist_id}/tracks")
+@app.post("/v1/playlists/{playlist_id}/items")
+async def add_items(playlist_id: str, request: Request, position: int = None):
+    body = await request.json()
+    uris = body if isinstance(body, list) else (body or {}).get("uris") or []
+    if not uris or len(uris) > 100:
+        return _error(400, "Between 1 and 100 URIs per request")
+    bad = [uri for uri in uris if not URI_PATTERN.match(str(uri))]
+    if bad:
+        return _error(400, f"Invalid track uri: {bad[0]}")
+    with _lock:
+        playlist, error = _playlist_or_error(playlist_id, request)
+        if error:
+            return error
+        if len(playlist["items"]) + len(uris) > PLAYLIST_LIMIT:
+            return _error(400, "Playlist size limit reached")
+        if position is None:
+            playlist["items"].extend(uris)
+        else:
+            playlist["items"][position:position] = uris
+        playlist["snapshot"] += 1
+        return JSONResponse({"snapshot_id": str(playlist["snapshot"])}, status_code=201)
+
+
+@app.delete("/v1/playlists/{playlist_id}/tracks")
+@app.delete("/v1/playlists/{playlist_id}/items")
+async def remove_items(playlist_id: str, request: Request):
+    body = await request.json()
+    entries = body.get("items") or body.get("tracks") or []
+    if not entries or len(entries) > 100:
+        return _error(400, "Between 1 and 100 items per request")
+    remove = {entry["uri"] for entry in entries}
+    with _lock:
+        playlist, error = _playlist_or_error(playlist_id, request)
+        if error:
+            return error
+        playlist["items"] = [uri for uri in playlist["items"] if uri not in remove]
+        playlist["snapshot"] += 1
+        return {"snapshot_id": str(playlist["snapshot"])}
+
+
+# ==========================================
+# CONTROL
+# ==========================================
+@app.get("/_fake/config")
+def get_config():
+    return CONFIG
+
+
+@app.post("/_fake/config")
+async def set_config(request: Request):
+    CONFIG.update(await request.json())
+    return CONFIG
+
+
+@app.get("/_fake/stats")
+def get_stats():
+    with _lock:
+        stats = {endpoint: dict(values) for endpoint, values in sorted(_STATS.items())}
+        return {
+            "endpoints": stats,
+            "calls": sum(v["calls"] for v in stats.values()),
+            "throttled": sum(v["throttled"] for v in stats.values()),
+            "errors": sum(v["errors"] for v in stats.values()),
+            "playlists": len(_PLAYLISTS),
+        }
+
+
+@app.post("/_fake/reset")
+def reset():
+    with _lock:
+        _PLAYLISTS.clear()
+        _STATS.clear()
+        _TRACKS.clear()
+        _rng.seed(CONFIG["seed"])
+    return {"status": "ok"}
+
+
+def parse_latency(spec):
+    """'search=0.08,default=0.03' (or a bare number for every endpoint) -> {endpoint: seconds}."""
+    if not spec:
+        return {"default": 0.0}
+    if "=" not in spec:
+        return {"default": float(spec)}
+    return {key.strip(): float(value) for key, value in (part.split("=", 1) for part in spec.split(","))}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local Spotify Web API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--seed", type=int, default=CONFIG["seed"])
+    parser.add_argument("--latency", default="", help="Seconds per endpoint: search=0.08,default=0.03")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Sustained calls/s before 429s (0: off)")
+    parser.add_argument("--retry-after", type=int, default=CONFIG["retry_after"])
+    parser.add_argument("--burst-every", type=float, default=0.0, help="Seconds between 429 lockouts (0: off)")
+    parser.add_argument("--burst-seconds", type=float, default=0.0, help="Length of each lockout")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls answered with a 5xx")
+    parser.add_argument("--saved-tracks", type=int, default=CONFIG["saved_tracks"])
+    parser.add_argument("--genre-size", type=int, default=CONFIG["genre_size"], help="Tracks per genre catalog")
+    return parser.parse_args(argv)
+
+
+def configure(args):
+    CONFIG.update(
+        seed=args.seed, latency=parse_latency(args.latency), rate_limit=args.rate_limit,
+        retry_after=args.retry_after, burst_every=args.burst_every, burst_seconds=args.burst_seconds,
+        error_rate=args.error_rate, saved_tracks=args.saved_tracks,
+        genre_size=args.genre_size,
+    )
+    _rng.seed(args.seed)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    args = parse_args()
+    configure(args)
+    print(f"Fake Spotify API on http://{args.host}:{args.port}/v1/ (SPOTIFY_API_BASE)")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
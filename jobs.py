@@ -0,0 +1,287 @@
+"""
+Background job subsystem for long-running mixes.
+
+`POST /jobs` submits a mix to a bounded worker pool and returns a job ID at
+once; the HTTP worker is free again while the job runs for minutes or hours.
+Jobs report their phase and counters (tracks found/written, API calls) and an
+ETA extrapolated from the progress so far. Cancellation is cooperative: the
+job raises JobCancelled at its next progress checkpoint.
+
+Each job also keeps a bounded log of structured events (genre started, page
+fetched, volume created, batch written, throttled, done) that
+`GET /jobs/{id}/events` streams to clients as Server-Sent Events.
+
+Scheduling is fair at two levels. Queued jobs are admitted to a free worker
+by the same policy the FairScheduler (scheduler.py) applies to running jobs'
+API calls: users with the fewest running jobs first (and at most
+JOB_MAX_PER_USER each), then the smallest mix. Queued jobs report their queue
+position and an estimated start time.
+"""
+import heapq
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from scheduler import FairScheduler
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_TTL = int(os.getenv("JOB_TTL", 3600))  # Seconds a finished job stays queryable
+# Workers one user may hold at once, so a burst of whales never takes every slot
+JOB_MAX_PER_USER = int(os.getenv("JOB_MAX_PER_USER", max(1, JOB_WORKERS // 2)))
+JOB_MAX_EVENTS = 5000  # Events kept per job for late/reconnecting stream clients
+SECONDS_PER_TRACK = 0.05  # Duration prior for start estimates, until jobs have finished
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, target_count, user=None, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.user = user
+        self.target_count = target_count
+        self.status = "queued"   # queued | running | success | error | cancelled
+        self.phase = "queued"    # queued | authenticating | searching | writing | done
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.tracks_found = 0
+        self.tracks_written = 0
+        self.volumes = {}        # num -> {"num", "name", "url", "planned", "written"}
+        self.limiter = None      # ScopedLimiter, source of the API call counters
+        self.tracer = None       # tracing.Tracer of the run (GET /jobs/{id}/trace)
+        self.result = None
+        self._cancel = threading.Event()
+        self._events = deque(maxlen=JOB_MAX_EVENTS)
+        self._seq = 0
+        self._cond = threading.Condition()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def checkpoint(self):
+        """Called from the job's progress callbacks; aborts a cancelled job."""
+        if self._cancel.is_set():
+            raise JobCancelled(f"Job {self.id} cancelled")
+
+    def set_phase(self, phase):
+        self.checkpoint()
+        self.phase = phase
+        self.emit("phase", phase=phase)
+
+    def add_found(self, count):
+        self.tracks_found = min(self.tracks_found + count, self.target_count)
+        self.checkpoint()
+
+    def set_written(self, count):
+        self.tracks_written = count
+        self.checkpoint()
+
+    # --- Event log (written from any job thread, read by stream clients) ---
+
+    def emit(self, event, **data):
+        with self._cond:
+            self._seq += 1
+            self._events.append({"seq": self._seq, "event": event, "time": round(time.time(), 3), **data})
+            self._cond.notify_all()
+
+    def finish(self, status):
+        with self._cond:
+            self.status = status
+            self.phase = "done"
+            self.finished = time.time()
+            # Same critical section: a reader that sees `finished` also sees "done"
+            self.emit("done", status=status, result=self.result)
+
+    def wait_events(self, after=0, timeout=15):
+        """
+        Events with seq > `after`, blocking up to `timeout` seconds for new ones.
+        An empty list after the job finished means the stream is over.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after or self.finished, timeout)
+            return [event for event in self._events if event["seq"] > after]
+
+    @property
+    def remaining_work(self):
+        """Tracks still to find plus tracks still to write (the scheduler's job size)."""
+        return max(0, 2 * self.target_count - self.tracks_found - self.tracks_written)
+
+    @property
+    def eta(self):
+        """Seconds left, extrapolated from search + write progress (None if unknown)."""
+        if self.status != "running" or not self.started:
+            return None
+        done = self.tracks_found + self.tracks_written
+        total = 2 * self.target_count
+        if done <= 0:
+            return None
+        elapsed = time.time() - self.started
+        return round(elapsed * (total - done) / done, 1)
+
+    def to_dict(self):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "phase": self.phase,
+            "target_count": self.target_count,
+            "tracks_found": self.tracks_found,
+            "tracks_written": self.tracks_written,
+            "api_calls": self.limiter.calls if self.limiter else 0,
+            "eta_seconds": self.eta,
+            "volumes": [self.volumes[num] for num in sorted(self.volumes)],
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if self.result is not None:
+            data["result"] = self.result
+        return data
+
+
+class JobManager:
+    def __init__(self, max_workers=JOB_WORKERS, ttl=JOB_TTL, max_per_user=JOB_MAX_PER_USER):
+        self.max_workers = max_workers
+        self.max_per_user = max_per_user
+        self.ttl = ttl
+        self.scheduler = FairScheduler()
+        self.seconds_per_track = SECONDS_PER_TRACK
+        self._jobs = {}
+        self._queue = []    # (job, run) waiting for a worker
+        self._running = []
+        self._lock = threading.Condition()
+        for i in range(max_workers):
+            threading.Thread(target=self._worker, name=f"job-{i}", daemon=True).start()
+
+    def submit(self, run, target_count, user=None, job_id=None):
+        """
+        Queues `run(job)`; its return value becomes job.result. A `job_id`
+        reuses the ID of a finished job (resume), replacing its record.
+        """
+        self._expire()
+        job = Job(target_count, user, job_id)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._queue.append((job, run))
+            self._lock.notify()
+        return job
+
+    # --- Admission ---
+
+    def _ordered(self):
+        """Queued (job, run) pairs in admission order."""
+        running = {}
+        for job in self._running:
+            running[job.user] = running.get(job.user, 0) + 1
+        def key(item):
+            held = running.get(item[0].user, 0)
+            return held >= self.max_per_user, held, item[0].target_count, item[0].created
+        return sorted(self._queue, key=key)
+
+    def _next(self):
+        """The next (job, run) to admit, or None if every queued user is at its cap."""
+        ordered = self._ordered()
+        if not ordered:
+            return None
+        held = sum(1 for job in self._running if job.user == ordered[0][0].user)
+        return ordered[0] if held < self.max_per_user else None
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                self._lock.wait_for(self._next)
+                item = self._next()
+                self._queue.remove(item)
+                self._running.append(item[0])
+            try:
+                self._run(*item)
+            finally:
+                with self._lock:
+                    self._running.remove(item[0])
+                    self._lock.notify_all()  # A capped user may be admissible now
+
+    def _run(self, job, run):
+        if job.cancelled:
+            job.finish("cancelled")
+            return
+        job.status = "running"
+        job.started = time.time()
+        job.emit("started")
+        try:
+            job.result = run(job)
+            status = job.result.get("status", "success") if isinstance(job.result, dict) else "success"
+            job.finish("success" if status == "success" else "error")
+            if status == "success" and job.target_count:
+                # Moving average of the observed cost, for start estimates
+                observed = (job.finished - job.started) / job.target_count
+                self.seconds_per_track = 0.8 * self.seconds_per_track + 0.2 * observed
+        except JobCancelled:
+            job.finish("cancelled")
+        except Exception as e:
+            job.result = {"status": "error", "message": str(e)}
+            job.finish("error")
+
+    def _estimated_duration(self, job):
+        return job.target_count * self.seconds_per_track
+
+    def queue_info(self, job):
+        """(1-based queue position, estimated seconds until start) of a queued job."""
+        with self._lock:
+            ordered = [queued for queued, _ in self._ordered()]
+            if job not in ordered:
+                return None, None
+            # Workers free up when their running job ends; queued jobs take them in order
+            free_at = [running.eta if running.eta is not None else self._estimated_duration(running)
+                       for running in self._running]
+            free_at += [0.0] * (self.max_workers - len(free_at))
+            heapq.heapify(free_at)
+            for position, queued in enumerate(ordered, 1):
+                start = heapq.heappop(free_at)
+                if queued is job:
+                    return position, round(start, 1)
+                heapq.heappush(free_at, start + self._estimated_duration(queued))
+
+    def status(self, job):
+        """job.to_dict(), plus queue position and estimated start while queued."""
+        data = job.to_dict()
+        if job.status == "queued":
+            position, start = self.queue_info(job)
+            data["queue_position"] = position
+            data["estimated_start_seconds"] = start
+        return data
+
+    # --- Lookup ---
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if not job:
+            return None
+        job.cancel()
+        with self._lock:
+            queued = [item for item in self._queue if item[0] is job]
+            for item in queued:
+                self._queue.remove(item)
+        if queued:
+            job.finish("cancelled")
+        return job
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for job_id in [j.id for j in self._jobs.values() if j.finished and j.finished < cutoff]:
+                del self._jobs[job_id]
@@ -0,0 +1,199 @@
+"""
+Durable write journal for mixes (SQLite, next to the other .mixer/ stores).
+
+The pipeline records every track it accepts (in order), every volume it
+creates (playlist ID, name, last snapshot_id) and every batch it commits. If
+the process dies, is redeployed or the token expires halfway through a 100k
+mix, a resume (`POST /jobs/{id}/resume`, `spotify_filler.py --resume ID`)
+restores the volumes and continues from the first unwritten track without
+searching again (or, if the search itself was cut short, only searches the
+shortfall).
+"""
+import json
+import threading
+import time
+
+from storage import connect, data_path
+
+PENDING, WRITTEN, FAILED = 0, 1, 2
+
+
+class WriteJournal:
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._conn = connect(path or data_path("journal.sqlite3"))
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS mixes (
+                id TEXT PRIMARY KEY,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                search_done INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS mix_tracks (
+                mix_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                uri TEXT NOT NULL,
+                volume INTEGER,
+                state INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (mix_id, seq)
+            );
+            CREATE INDEX IF NOT EXISTS mix_tracks_state ON mix_tracks (mix_id, state);
+            CREATE INDEX IF NOT EXISTS mix_tracks_uri ON mix_tracks (mix_id, uri);
+            CREATE TABLE IF NOT EXISTS mix_volumes (
+                mix_id TEXT NOT NULL,
+                num INTEGER NOT NULL,
+                playlist_id TEXT NOT NULL,
+                url TEXT,
+                name TEXT,
+                description TEXT,
+                snapshot_id TEXT,
+                batches INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (mix_id, num)
+            );
+            """
+        )
+
+    def open(self, mix_id, params):
+        """Journal for a new mix (or the existing one with this ID)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO mixes (id, params, status, created, updated) VALUES (?, ?, 'running', ?, ?)",
+                (mix_id, json.dumps(params), now, now),
+            )
+        return self.load(mix_id)
+
+    def load(self, mix_id):
+        """Journal of an existing mix, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT params, status, search_done FROM mixes WHERE id = ?", (mix_id,)
+            ).fetchone()
+        if not row:
+            return None
+        return MixJournal(self, mix_id, json.loads(row[0]), row[1], bool(row[2]))
+
+    def incomplete(self):
+        """IDs of mixes that never reached 'done' (crashed, interrupted or running)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM mixes WHERE status != 'done' ORDER BY updated DESC"
+            ).fetchall()
+        return [mix_id for (mix_id,) in rows]
+
+    def _write(self, statements):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for sql, params in statements:
+                    if params and isinstance(params[0], tuple):
+                        self._conn.executemany(sql, params)
+                    else:
+                        self._conn.execute(sql, params)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _read(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+
+class MixJournal:
+    """The journal of one mix; every method commits before returning."""
+
+    def __init__(self, store, mix_id, params, status, search_done):
+        self.store = store
+        self.id = mix_id
+        self.params = params
+        self.status = status
+        self.search_done = search_done
+
+    def _touch(self, **fields):
+        sets = "".join(f"{key} = ?, " for key in fields)
+        return (f"UPDATE mixes SET {sets}updated = ? WHERE id = ?",
+                (*fields.values(), time.time(), self.id))
+
+    def add_tracks(self, uris):
+        """Appends accepted URIs (pending) in acceptance order."""
+        start = self.store._read("SELECT COALESCE(MAX(seq), 0) FROM mix_tracks WHERE mix_id = ?", (self.id,))[0][0]
+        rows = tuple((self.id, start + i, uri) for i, uri in enumerate(uris, 1))
+        if rows:
+            self.store._write([("INSERT INTO mix_tracks (mix_id, seq, uri) VALUES (?, ?, ?)", rows)])
+
+    def save_volume(self, volume):
+        self.store._write([(
+            "INSERT INTO mix_volumes (mix_id, num, playlist_id, url, name, description) VALUES (?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(mix_id, num) DO UPDATE SET name = excluded.name, description = excluded.description",
+            (self.id, volume['num'], volume['id'], volume['url'], volume['name'], volume['description']),
+        )])
+
+    def assign(self, volume, uris):
+        """Records the volume pending URIs were assigned to, so a resume writes them there."""
+        self.store._write([("UPDATE mix_tracks SET volume = ? WHERE mix_id = ? AND uri = ?",
+                            tuple((volume['num'], self.id, uri) for uri in uris))])
+
+    def _mark(self, volume, uris, state):
+        return ("UPDATE mix_tracks SET volume = ?, state = ? WHERE mix_id = ? AND uri = ?",
+                tuple((volume['num'], state, self.id, uri) for uri in uris))
+
+    def commit_batch(self, volume, uris, snapshot_id=None):
+        """Marks a batch written to `volume` and records the playlist's new snapshot."""
+        self.store._write([
+            self._mark(volume, uris, WRITTEN),
+            ("UPDATE mix_volumes SET batches = batches + 1, snapshot_id = COALESCE(?, snapshot_id)"
+             " WHERE mix_id = ? AND num = ?", (snapshot_id, self.id, volume['num'])),
+            self._touch(),
+        ])
+
+    def fail_batch(self, volume, uris):
+        """Marks a batch Spotify rejected; a resume does not retry it."""
+        self.store._write([self._mark(volume, uris, FAILED), self._touch()])
+
+    def mark_search_done(self):
+        self.search_done = True
+        self.store._write([self._touch(search_done=1)])
+
+    def finish(self, status):
+        self.status = status
+        self.store._write([self._touch(status=status)])
+
+    def volumes(self):
+        """
+        Journaled volumes (creation order) with the URIs assigned to each, the
+        written count and the assigned URIs still pending.
+        """
+        tracks, written, pending = {}, {}, {}
+        for num, uri, state in self.store._read(
+                "SELECT volume, uri, state FROM mix_tracks WHERE mix_id = ? AND volume IS NOT NULL ORDER BY seq",
+                (self.id,)):
+            tracks.setdefault(num, []).append(uri)
+            written[num] = written.get(num, 0) + (state == WRITTEN)
+            if state == PENDING:
+                pending.setdefault(num, []).append(uri)
+        volumes = []
+        for num, playlist_id, url, name, desc, snapshot_id, batches in self.store._read(
+                "SELECT num, playlist_id, url, name, description, snapshot_id, batches FROM mix_volumes"
+                " WHERE mix_id = ? ORDER BY num", (self.id,)):
+            volumes.append({
+                "num": num, "id": playlist_id, "url": url, "name": name, "description": desc,
+                "snapshot_id": snapshot_id, "batches": batches, "tracks": tracks.get(num, []),
+                "written": written.get(num, 0), "pending": pending.get(num, []),
+            })
+        return volumes
+
+    def counts(self):
+        """{'pending', 'written', 'failed'} track counts."""
+        rows = dict(self.store._read(
+            "SELECT state, COUNT(*) FROM mix_tracks WHERE mix_id = ? GROUP BY state", (self.id,)))
+        return {"pending": rows.get(PENDING, 0), "written": rows.get(WRITTEN, 0), "failed": rows.get(FAILED, 0)}
+
+    def pending(self):
+        """URIs accepted but not assigned to a volume yet, in acceptance order."""
+        return [uri for (uri,) in self.store._read(
+            "SELECT uri FROM mix_tracks WHERE mix_id = ? AND state = ? AND volume IS NULL ORDER BY seq",
+            (self.id, PENDING))]
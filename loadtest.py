@@ -0,0 +1,303 @@
+"""
+Concurrent /execute load test and capacity report for one server.py process.
+
+    python loadtest.py                                  # ramp 1,2,4,8,16,32,64 virtual users
+    python loadtest.py --users 1,10,50,100 --step-seconds 60 --track-count 200 --out capacity.json
+
+Starts fake_spotify.py unless --api-base points at a running one, and a fresh
+`uvicorn server:app` (one process, empty MIXER_DATA_DIR) for every step, so
+no step is served by the catalog and search cache an earlier step filled.
+With --server (a running server) that can't be reset, executes are sent with
+use_catalog off instead; its search cache still carries over. Each step runs
+N virtual users for --step-seconds; every user has its own token (its own
+Spotify user) and loops authenticate -> genres -> execute, picking genres
+from a seed of its own for that step. A probe
+requests GET /genres twice a second during each step: /execute handlers
+sleep inside FastAPI's threadpool, so when the pool is exhausted even that
+trivial request queues.
+
+Per step the report gives p50/p95/p99 latency per endpoint, throughput,
+error rate (HTTP errors and non-success results), the share of stand-in calls
+answered with 429/5xx, and server memory (RSS sampled from /proc, Linux) per
+in-flight /execute. The saturation point is the first step whose probe p95
+exceeds --saturation-factor x the single-user probe p95, or whose completed
+executes/s stops growing (< 10% over the previous step).
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+from bench import BENCH_GENRES, fake_request, free_port, start_fake
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PROBE_INTERVAL = 0.5
+RSS_INTERVAL = 0.5
+
+
+def http(base, method, path, body=None, timeout=600):
+    """(status, parsed body, seconds)."""
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(base + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+    started = time.monotonic()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status, payload = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, payload = e.code, e.read()
+    except OSError as e:
+        return None, {"error": str(e)}, time.monotonic() - started
+    elapsed = time.monotonic() - started
+    try:
+        return status, json.loads(payload), elapsed
+    except ValueError:
+        return status, None, elapsed
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))], 3)
+
+
+def summarize(latencies):
+    return {"count": len(latencies), "p50": percentile(latencies, 50), "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99), "max": round(max(latencies), 3) if latencies else None}
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+class Step:
+    """One load level: N virtual users plus the /genres probe and the RSS sampler."""
+
+    def __init__(self, base, users, seconds, track_count, genres_per_mix, server_pid, use_catalog=True):
+        self.base = base
+        self.users = users
+        self.seconds = seconds
+        self.track_count = track_count
+        self.genres_per_mix = genres_per_mix
+        self.server_pid = server_pid
+        self.use_catalog = use_catalog
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.latencies = {"authenticate": [], "genres": [], "execute": [], "probe": []}
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.rss = []  # (in-flight executes, RSS MB)
+
+    def record(self, endpoint, status, body, seconds):
+        with self.lock:
+            self.requests += 1
+            self.latencies[endpoint].append(seconds)
+            result = body.get("status") if isinstance(body, dict) else None
+            if status != 200 or result in ("error", "auth_error", "forbidden", "bad_request"):
+                self.errors += 1
+            elif result == "rate_limit":
+                self.rate_limited += 1
+
+    def user(self, index):
+        token = f"load-{self.users}-{index}"
+        rng = random.Random(f"{self.users}-{index}")  # Other genres than this user's in other steps
+        while not self.stop.is_set():
+            self.record("authenticate", *http(self.base, "POST", "/authenticate", {"token": token}))
+            self.record("genres", *http(self.base, "GET", "/genres"))
+            with self.lock:
+                self.in_flight += 1
+            try:
+                self.record("execute", *http(self.base, "POST", "/execute", {
+                    "token": token, "genres": rng.sample(BENCH_GENRES, self.genres_per_mix),
+                    "track_count": self.track_count, "use_catalog": self.use_catalog,
+                }))
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
+
+    def probe(self):
+        while not self.stop.wait(PROBE_INTERVAL):
+            status, _, seconds = http(self.base, "GET", "/genres", timeout=120)
+            with self.lock:
+                self.latencies["probe"].append(seconds)
+
+    def sample_rss(self):
+        while not self.stop.wait(RSS_INTERVAL):
+            value = rss_mb(self.server_pid) if self.server_pid else None
+            if value is not None:
+                with self.lock:
+                    self.rss.append((self.in_flight, value))
+
+    def run(self, idle_rss):
+        threads = [threading.Thread(target=self.user, args=(i,), daemon=True) for i in range(self.users)]
+        threads += [threading.Thread(target=self.probe, daemon=True),
+                    threading.Thread(target=self.sample_rss, daemon=True)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        time.sleep(self.seconds)
+        self.stop.set()
+        for thread in threads:
+            thread.join()  # Users finish the iteration they are in
+        elapsed = time.monotonic() - started
+
+        busy = [(jobs, mb) for jobs, mb in self.rss if jobs]
+        per_job = None
+        if busy and idle_rss:
+            per_job = round(max((mb - idle_rss) / jobs for jobs, mb in busy), 2)
+        return {
+            "users": self.users,
+            "seconds": round(elapsed, 1),
+            "idle_rss_mb": round(idle_rss, 1) if idle_rss else None,
+            "latency": {endpoint: summarize(values) for endpoint, values in self.latencies.items()},
+            "executes_per_second": round(len(self.latencies["execute"]) / elapsed, 3),
+            "requests": self.requests,
+            "error_rate": round(self.errors / self.requests, 4) if self.requests else None,
+            "rate_limited_results": self.rate_limited,
+            "peak_rss_mb": round(max(mb for _, mb in self.rss), 1) if self.rss else None,
+            "rss_per_execute_mb": per_job,
+        }
+
+
+def saturation_point(steps, factor):
+    """Users of the first saturated step (see module docstring), or None."""
+    if not steps:
+        return None
+    baseline = steps[0]["latency"]["probe"]["p95"]
+    for previous, step in zip(steps, steps[1:]):
+        probe = step["latency"]["probe"]["p95"]
+        if baseline and probe and probe > factor * baseline:
+            return step["users"]
+        if step["executes_per_second"] < previous["executes_per_second"] * 1.1:
+            return step["users"]
+    return None
+
+
+def start_server(api_base):
+    port = free_port()
+    data_dir = tempfile.mkdtemp(prefix="loadtest-")
+    env = dict(os.environ, SPOTIFY_API_BASE=api_base, MIXER_DATA_DIR=data_dir)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        if http(base, "GET", "/", timeout=2)[0] == 200:
+            return process, base, data_dir
+        time.sleep(0.1)
+    stop_server(process, data_dir)
+    raise RuntimeError("server did not start")
+
+
+def stop_server(process, data_dir):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def print_report(report):
+    print("users | exec/s | execute p50/p95/p99 | probe p95 | errors | stand-in 429/5xx | RSS/execute MB")
+    for step in report["steps"]:
+        execute, probe = step["latency"]["execute"], step["latency"]["probe"]
+        api = step["api"]
+        print(f"{step['users']} | {step['executes_per_second']} | "
+              f"{execute['p50']}/{execute['p95']}/{execute['p99']} | {probe['p95']} | "
+              f"{step['error_rate']} | {api['throttled_rate']}/{api['error_rate']} | {step['rss_per_execute_mb']}")
+    saturation = report["saturation_users"]
+    print(f"Saturation point: {saturation} users" if saturation else "Saturation point: not reached")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="/execute load test against fake_spotify.py")
+    parser.add_argument("--users", default="1,2,4,8,16,32,64", help="Virtual users per step")
+    parser.add_argument("--step-seconds", type=float, default=30.0)
+    parser.add_argument("--track-count", type=int, default=200, help="Tracks per /execute")
+    parser.add_argument("--genres-per-mix", type=int, default=2)
+    parser.add_argument("--server", help="Use a running server (e.g. http://127.0.0.1:8000)")
+    parser.add_argument("--server-pid", type=int, help="PID of --server, for memory sampling")
+    parser.add_argument("--api-base", help="Use a running stand-in (e.g. http://127.0.0.1:8900/v1/)")
+    parser.add_argument("--latency", default="search=0.08,recommendations=0.1,default=0.05")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Stand-in calls/s before 429s (0: off)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--genre-size", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--saturation-factor", type=float, default=5.0)
+    parser.add_argument("--out", help="Write the JSON report here")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    fake, api_base = (None, args.api_base) if args.api_base else start_fake(args)
+    server = data_dir = None
+    try:
+        steps = []
+        for users in [int(n) for n in args.users.split(",")]:
+            print(f"▶ {users} virtual user(s) for {args.step_seconds:.0f}s...", flush=True)
+            if args.server:
+                base, server_pid = args.server, args.server_pid
+            else:
+                server, base, data_dir = start_server(api_base)
+                server_pid = server.pid
+            fake_request(api_base, "/_fake/reset")
+            idle_rss = rss_mb(server_pid) if server_pid else None
+            step = Step(base, users, args.step_seconds, args.track_count, args.genres_per_mix, server_pid,
+                        use_catalog=not args.server)
+            result = step.run(idle_rss)
+            if server:
+                stop_server(server, data_dir)
+                server = None
+            api = fake_request(api_base, "/_fake/stats")
+            result["api"] = {
+                "calls": api["calls"],
+                "throttled_rate": round(api["throttled"] / api["calls"], 4) if api["calls"] else None,
+                "error_rate": round(api["errors"] / api["calls"], 4) if api["calls"] else None,
+            }
+            steps.append(result)
+    finally:
+        if server:
+            stop_server(server, data_dir)
+        if fake:
+            fake.terminate()
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "config": {key: getattr(args, key) for key in
+                   ("step_seconds", "track_count", "genres_per_mix", "latency", "rate_limit", "error_rate")},
+        "steps": steps,
+        "saturation_users": saturation_point(steps, args.saturation_factor),
+    }
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
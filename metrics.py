@@ -0,0 +1,222 @@
+"""
+Process metrics in the Prometheus text format (served by `GET /metrics`).
+
+Counters, gauges and histograms with labels, plus collectors: functions
+read at scrape time for values other objects already keep (the rate
+limiter's sleep time, the job queue). Spotify calls are measured by
+wrapping the client (`InstrumentedSpotify`, installed by the session pool),
+so every endpoint the mixer uses is counted, timed and has its 429s and
+Retry-After seconds recorded without touching the call sites.
+
+No prometheus_client dependency: the exposition format is a few lines of text.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from rate_limiter import retry_after_from
+
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TRACK_BUCKETS = (10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+        if not self.label_names:
+            self._values[()] = self._zero()
+
+    def _zero(self):
+        return 0
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labels)
+
+    def _zero(self):
+        return [0] * (len(self.buckets) + 1), 0.0
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or self._zero()
+            counts = list(counts)  # render() reads the old list outside the lock
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self, key, value):
+        counts, total = value
+        names = self.label_names + ("le",)
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_labels(names, key + (_number(bound),))} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(round(total, 6))}")
+        lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class _Collector(_Metric):
+    """Values computed at scrape time: `collect()` returns {label tuple: value}."""
+
+    def __init__(self, name, help, kind, collect, labels=()):
+        super().__init__(name, help, labels)
+        self.kind = kind
+        self.collect = collect
+
+    def render(self):
+        with self._lock:
+            self._values = dict(self.collect())
+        return super().render()
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def collector(self, name, help, kind, collect, labels=()):
+        return self._add(_Collector(name, help, kind, collect, labels))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class SpotifyMetrics:
+    """The per-endpoint Spotify call metrics, recorded by InstrumentedSpotify."""
+
+    def __init__(self, registry):
+        self.requests = registry.counter(
+            "spotify_requests_total", "Spotify API calls by client method and outcome "
+            "(ok, or the HTTP status of the error; 'error' when there was none).", ("endpoint", "status"))
+        self.latency = registry.histogram(
+            "spotify_request_duration_seconds", "Duration of Spotify API calls.", ("endpoint",))
+        self.throttled = registry.counter(
+            "spotify_throttled_total", "Spotify API calls answered with 429.", ("endpoint",))
+        self.retry_after = registry.counter(
+            "spotify_retry_after_seconds_total", "Retry-After seconds requested by 429 answers.", ("endpoint",))
+
+    def instrument(self, client):
+        return InstrumentedSpotify(client, self)
+
+    def record(self, endpoint, seconds, error=None):
+        self.latency.observe(seconds, endpoint=endpoint)
+        if error is None:
+            self.requests.inc(endpoint=endpoint, status="ok")
+            return
+        status = getattr(error, "http_status", None)
+        self.requests.inc(endpoint=endpoint, status=status or "error")
+        retry_after = retry_after_from(error)
+        if retry_after is not None:
+            self.throttled.inc(endpoint=endpoint)
+            self.retry_after.inc(retry_after, endpoint=endpoint)
+
+
+class InstrumentedSpotify:
+    """
+    Proxy of a spotipy.Spotify whose public methods record a SpotifyMetrics
+    sample per call (labelled with the method name: search, recommendations,
+    playlist_add_items, ...). Attributes pass through unchanged.
+    """
+
+    def __init__(self, client, metrics):
+        self._client = client
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            started = time.monotonic()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                self._metrics.record(name, time.monotonic() - started, e)
+                raise
+            self._metrics.record(name, time.monotonic() - started)
+            return result
+        call.__name__ = name
+        return call
@@ -0,0 +1,332 @@
+"""
+Streaming search-to-write pipeline.
+
+The search engine (producer, on the calling thread) feeds deduplicated URIs
+into a bounded queue as soon as it finds them; a dispatcher thread (consumer)
+opens volume 1 on the first full window and hands tracks to it while the
+search is still running, so the first playlist exists seconds after the start
+instead of after the whole search phase.
+
+Each volume has its own writer thread and FIFO queue: volumes fill
+concurrently under the shared rate budget (a 100k mix no longer waits for
+volume 1 before writing volume 2), while the order inside each playlist is
+the order its tracks were assigned in.
+
+Shuffle guarantee: URIs are shuffled inside windows of `window` tracks before
+being written (genres are searched concurrently, so each window already mixes
+them). Volume boundaries still follow `playlist_limit`. Volumes are named for
+the planned total (ceil(target / playlist_limit)); if the search comes up
+short, names/descriptions are corrected at the end via playlist_change_details.
+
+With a `journal` (journal.MixJournal) every accepted URI, created volume,
+volume assignment and committed batch is recorded durably; `restore()`
+rebuilds the volumes of an interrupted mix so `run()` sends each unwritten
+track back to the volume it was assigned to (unassigned ones are dispatched
+as usual).
+Batches go through batch_writer.BatchWriter (100 URIs per call while the
+budget is healthy, transient errors retried, bad URIs isolated and listed in
+`failures`). Authentication errors (401/403, e.g. an expired token) and a
+deleted (404) or full playlist abort the run instead, so those tracks stay
+pending for a resume.
+
+With a `tracer` (tracing.Tracer) each volume is a span (lane "volume-N", under
+the span current when run() was called) holding its create_playlist call
+and one "batch_write" span per batch.
+"""
+import math
+import queue
+import random
+import threading
+import time
+
+from batch_writer import BatchWriter, MAX_ITEMS_PER_CALL
+from tracing import NULL_TRACER
+
+
+class MixPipeline:
+    """
+    `describe(vol_num, total_vols, count)` returns the (name, description) of a
+    volume, so each entry point keeps its own naming. `on_volume(volume)` and
+    `on_batch(volume)` are progress callbacks, called from the dispatcher and
+    volume writer threads (`prepare_thread(thread)` runs before each of them
+    starts, e.g. to attach a Streamlit script context). Each volume carries
+    its own `written` count and `planned` size for per-volume progress.
+    """
+
+    def __init__(self, sp, user_id, target_count, describe, limiter, batch_size=50,
+                 max_batch=MAX_ITEMS_PER_CALL, playlist_limit=10000, window=500, queue_size=64, on_volume=None,
+                 on_batch=None, prepare_thread=None, log=None, journal=None, tracer=None):
+        self.sp = sp
+        self.user_id = user_id
+        self.target_count = target_count
+        self.describe = describe
+        self.limiter = limiter
+        self.writer = BatchWriter(sp, limiter, batch_size=batch_size, max_batch=max_batch, log=log)
+        self.playlist_limit = playlist_limit
+        self.window = window
+        self.on_volume = on_volume
+        self.on_batch = on_batch
+        self.prepare_thread = prepare_thread
+        self.log = log or (lambda message: None)
+        self.journal = journal
+        self.tracer = tracer or NULL_TRACER
+
+        self.planned_vols = max(1, math.ceil(target_count / playlist_limit))
+        self.volumes = []  # dicts: num, id, url, name, description, planned, tracks, written
+        self.failed = 0
+        self.failures = []  # (uri, error message) of tracks Spotify rejected
+        self.error = None
+        self.time_to_first_playlist = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._accepted = 0
+        self._start = None
+        self._known = set()   # URIs already journaled by the run being resumed
+        self._pending = []
+        self._requeue = []    # (volume, URIs assigned to it but not written) of a resumed mix
+        self._volume_queues = {}   # num -> queue of URI chunks for that volume's writer
+        self._volume_threads = []
+        self._lock = threading.Lock()  # Counters shared by the volume writers
+        self._trace_parent = None
+        self._volume_spans = {}    # num -> trace span of the volume
+
+    # --- Producer side ---
+
+    def feed(self, uris):
+        """Queues new URIs (capped at target_count). Raises if the writer failed."""
+        if self.error:
+            raise self.error
+        if self._known:
+            uris = [uri for uri in uris if uri not in self._known]
+        chunk = list(uris)[:self.target_count - self._accepted]
+        if not chunk:
+            return
+        self._accepted += len(chunk)
+        if self.journal:
+            self.journal.add_tracks(chunk)
+        self._put(chunk)
+
+    def _put(self, item, writer=None):
+        while True:
+            if writer is not None:
+                if not writer.is_alive():
+                    return
+            elif self.error:
+                raise self.error
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    # --- Consumer side ---
+
+    def _planned_count(self, vol_num):
+        return min(self.playlist_limit, self.target_count - (vol_num - 1) * self.playlist_limit)
+
+    def _start_thread(self, target, name, *args):
+        thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+        if self.prepare_thread:
+            self.prepare_thread(thread)
+        thread.start()
+        return thread
+
+    def _current_volume(self):
+        if self.volumes and len(self.volumes[-1]['tracks']) < self.playlist_limit:
+            return self.volumes[-1]
+        vol_num = len(self.volumes) + 1
+        planned = self._planned_count(vol_num)
+        name, desc = self.describe(vol_num, max(self.planned_vols, vol_num), planned)
+        span = self._volume_span(vol_num, planned=planned)
+        with self.tracer.span("create_playlist", span):
+            playlist = self.limiter.call(self.sp.user_playlist_create, user=self.user_id,
+                                         name=name, public=True, description=desc)
+        volume = {
+            "num": vol_num, "id": playlist['id'], "url": playlist['external_urls']['spotify'],
+            "name": name, "description": desc, "planned": planned, "tracks": [], "written": 0,
+        }
+        self.volumes.append(volume)
+        if self.journal:
+            self.journal.save_volume(volume)
+        if self.time_to_first_playlist is None:
+            self.time_to_first_playlist = time.monotonic() - self._start
+        if self.on_volume:
+            self.on_volume(volume)
+        return volume
+
+    def _volume_span(self, vol_num, **attrs):
+        span = self._volume_spans.get(vol_num)
+        if span is None:
+            span = self._volume_spans[vol_num] = self.tracer.start(
+                "volume", self._trace_parent, lane=f"volume-{vol_num}", volume=vol_num, **attrs)
+        return span
+
+    def _volume_queue(self, volume):
+        """The queue of `volume`'s writer thread (started on first use)."""
+        chunks = self._volume_queues.get(volume['num'])
+        if chunks is None:
+            chunks = self._volume_queues[volume['num']] = queue.Queue()
+            self._volume_threads.append(
+                self._start_thread(self._fill_volume, f"volume-{volume['num']}", volume, chunks))
+        return chunks
+
+    def _assign(self, uris):
+        """Shuffles a window and splits it across volumes at their limit."""
+        random.shuffle(uris)
+        i = 0
+        while i < len(uris):
+            volume = self._current_volume()
+            chunk = uris[i:i + self.playlist_limit - len(volume['tracks'])]
+            i += len(chunk)
+            volume['tracks'].extend(chunk)
+            if self.journal:
+                self.journal.assign(volume, chunk)
+            self._volume_queue(volume).put(chunk)
+
+    def _fill_volume(self, volume, chunks):
+        """Writer thread of one volume: appends its chunks in arrival order."""
+        span = self._volume_span(volume['num'], planned=volume['planned'])  # Restored volumes start here
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    return
+                if self.error:
+                    continue  # Another writer failed: drain without writing
+                i = 0
+                while i < len(chunk):
+                    batch = chunk[i:i + self.writer.next_size()]
+                    i += len(batch)
+                    with self.tracer.span("batch_write", span, size=len(batch)) as batch_span:
+                        result = self.writer.write(volume['id'], batch)
+                        batch_span.set(written=len(result.written), failed=len(result.failures),
+                                       calls=result.calls)
+                    volume['written'] += len(result.written)
+                    with self._lock:
+                        self.failed += len(result.failures)
+                        self.failures.extend(result.failures)
+                    if self.journal:
+                        if result.written:
+                            self.journal.commit_batch(volume, result.written, result.snapshot_id)
+                        if result.failures:
+                            self.journal.fail_batch(volume, [uri for uri, _ in result.failures])
+                    if self.on_batch:
+                        self.on_batch(volume)
+        except Exception as e:
+            self.error = e
+            span.set(error=str(e)[:200])
+            while chunks.get() is not None:
+                pass
+        finally:
+            span.set(written=volume['written'])
+            span.finish()
+
+    def _dispatcher(self):
+        buffer = []
+        try:
+            while True:
+                chunk = self._queue.get()
+                if chunk is None:
+                    break
+                if self.error:
+                    continue  # Keep draining so the producer never blocks
+                buffer.extend(chunk)
+                if len(buffer) >= self.window:
+                    self._assign(buffer)
+                    buffer = []
+            if not self.error:
+                self._assign(buffer)
+        except Exception as e:
+            self.error = e
+        finally:
+            for chunks in self._volume_queues.values():
+                chunks.put(None)
+            for thread in self._volume_threads:
+                thread.join()
+
+    def _finalize(self):
+        """Fixes names/descriptions planned for a total the search didn't reach."""
+        total_vols = len(self.volumes)
+        for volume in self.volumes:
+            name, desc = self.describe(volume['num'], total_vols, len(volume['tracks']))
+            if (name, desc) == (volume['name'], volume['description']):
+                continue
+            try:
+                self.limiter.call(self.sp.playlist_change_details, volume['id'], name=name, description=desc)
+                volume['name'], volume['description'] = name, desc
+                if self.journal:
+                    self.journal.save_volume(volume)
+            except Exception as e:
+                self.log(f"Error renaming volume {volume['num']}: {e}")
+
+    # --- Driver ---
+
+    def restore(self):
+        """
+        Loads the journaled state of an interrupted mix: its volumes, counters
+        and the URIs still to write. Returns True if the journal's search had
+        finished (the caller then has nothing left to search).
+        """
+        for volume in self.journal.volumes():
+            volume.pop('snapshot_id')
+            volume.pop('batches')
+            volume['planned'] = self._planned_count(volume['num'])
+            pending = volume.pop('pending')
+            if pending:
+                self._requeue.append((volume, pending))
+            self.volumes.append(volume)
+        counts = self.journal.counts()
+        self.failed = counts['failed']
+        self._pending = self.journal.pending()
+        self._known = set(self.tracks) | set(self._pending)
+        self._accepted = len(self._known)
+        return self.journal.search_done
+
+    def run(self, search):
+        """
+        Runs `search(feed)` on the calling thread while the writer fills the
+        volumes. Returns the [{"name", "url"}] links of the created playlists.
+        """
+        self._start = time.monotonic()
+        self._trace_parent = self.tracer.current()
+        for volume, uris in self._requeue:
+            self._volume_queue(volume).put(uris)  # Before the dispatcher: it owns the queues from then on
+        self._requeue = []
+        writer = self._start_thread(self._dispatcher, "playlist-writer")
+        try:
+            if self._pending:
+                self._put(self._pending)
+            search(self.feed)
+            if self.journal:
+                self.journal.mark_search_done()
+        except BaseException:
+            if self.journal:
+                self.journal.finish("interrupted")
+            raise
+        finally:
+            self._put(None, writer)
+            writer.join()
+        if self.error:
+            if self.journal:
+                self.journal.finish("interrupted")
+            raise self.error
+        self._finalize()
+        if self.journal:
+            self.journal.finish("done")
+        return self.links
+
+    @property
+    def accepted(self):
+        """URIs taken in so far (including those restored from the journal)."""
+        return self._accepted
+
+    @property
+    def links(self):
+        return [{"name": volume['name'], "url": volume['url']} for volume in self.volumes]
+
+    @property
+    def tracks(self):
+        return [uri for volume in self.volumes for uri in volume['tracks']]
+
+    @property
+    def written(self):
+        return sum(volume['written'] for volume in self.volumes)
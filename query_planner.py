@@ -0,0 +1,80 @@
+"""
+Query planning: search sharding for large mixes and recommendation seed batching.
+
+Spotify serves at most ~1,000 results per search query (offset + limit <= 1000),
+so a single `genre:"x"` term caps a genre at about 1,000 tracks no matter how
+large MAX_TRACKS is. The planner splits the genre into disjoint `year:` ranges
+(each with its own 1,000-result window) followed by `tag:` combinations that
+re-rank the catalogue (newest releases, least popular tracks).
+
+The search engine walks the shards in order until the genre quota is met, and
+moves past a shard as soon as its first page comes back empty; the empty page
+is cached, so later runs skip dead shards without an API call.
+"""
+from datetime import datetime
+
+FIRST_YEAR = 1900
+SINGLE_YEARS = 10          # Most recent years get one shard each (densest catalogue)
+FIVE_YEAR_UNTIL = 2000     # Then 5-year ranges back to this year, then decades
+DECADES_UNTIL = 1950       # Everything older shares a single shard
+TAG_SHARDS = ["tag:new", "tag:hipster"]
+
+
+def year_ranges(current_year=None):
+    """Disjoint `year:` filter values, newest first."""
+    current_year = current_year or datetime.now().year
+    ranges = [str(year) for year in range(current_year, current_year - SINGLE_YEARS, -1)]
+    end = current_year - SINGLE_YEARS
+    while end >= FIVE_YEAR_UNTIL:
+        start = max(end - 4, FIVE_YEAR_UNTIL)
+        ranges.append(f"{start}-{end}")
+        end = start - 1
+    while end >= DECADES_UNTIL:
+        start = max(end - 9, DECADES_UNTIL)
+        ranges.append(f"{start}-{end}")
+        end = start - 1
+    if end >= FIRST_YEAR:
+        ranges.append(f"{FIRST_YEAR}-{end}")
+    return ranges
+
+
+def shard_terms(base_term, current_year=None):
+    """Sub-queries of `base_term`: one per year range, then one per tag."""
+    shards = [f"{base_term} year:{years}" for years in year_ranges(current_year)]
+    shards += [f"{base_term} {tag}" for tag in TAG_SHARDS]
+    return shards
+
+
+def fresh_terms(genre, current_year=None):
+    """
+    The shards where new releases show up first (`tag:new`, this year and
+    last year): a refresh pages these from the top before resuming anything.
+    """
+    current_year = current_year or datetime.now().year
+    base_term = f"genre:\"{genre}\""
+    return [f"{base_term} tag:new"] + [f"{base_term} year:{year}" for year in (current_year, current_year - 1)]
+
+
+def sharded(terms_fn):
+    """Wraps a terms function so its terms are followed by the genre's shards."""
+    def terms(genre):
+        return terms_fn(genre) + shard_terms(f"genre:\"{genre}\"")
+    return terms
+
+
+# ==========================================
+# RECOMMENDATION SEED BATCHING
+# ==========================================
+# /recommendations accepts up to 5 seeds and 100 results per call. Genres are
+# grouped into multi-seed calls; the returned tracks are attributed to the
+# least-served genre of the group, and genres still short of their quota get
+# follow-up calls over different popularity bands (which return different
+# tracks for the same seeds).
+MAX_SEED_GENRES = 5
+REC_BATCH_LIMIT = 100
+POPULARITY_BANDS = [(0, 100), (67, 100), (34, 66), (0, 33)]
+
+
+def seed_batches(genres, max_seeds=MAX_SEED_GENRES):
+    """Splits genres into groups of at most `max_seeds` recommendation seeds."""
+    return [genres[i:i + max_seeds] for i in range(0, len(genres), max_seeds)]
@@ -0,0 +1,113 @@
+"""
+Backends for the rate limiter's shared state (token bucket + AIMD rate).
+
+The whole deployment shares one Spotify app quota, so with several uvicorn
+workers (or hosts) every process must draw from the same bucket. A backend
+only stores a small state dict ({"tat", "blocked_until", "rate"}, wall-clock
+seconds) and applies `transact(fn)` atomically; the bucket logic itself stays
+in rate_limiter.AdaptiveRateLimiter.
+
+- MemoryBudget: one process (the default; what the CLI and Streamlit app use).
+- SQLiteBudget: every process on one host, through a row in MIXER_DATA_DIR.
+- RedisBudget: processes on several hosts (needs the optional `redis` package).
+
+Select one with RATE_BUDGET=memory|sqlite|redis://host:port/db.
+"""
+import os
+import threading
+
+from storage import connect, data_path
+
+RATE_BUDGET = os.getenv("RATE_BUDGET", "sqlite")
+STATE_KEYS = ("tat", "blocked_until", "rate")
+
+
+class MemoryBudget:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def transact(self, fn):
+        """Runs fn(state) -> (new_state, result) atomically; returns result."""
+        with self._lock:
+            self._state, result = fn(dict(self._state))
+        return result
+
+    def read(self):
+        with self._lock:
+            return dict(self._state)
+
+
+class SQLiteBudget:
+    def __init__(self, path=None, name="spotify"):
+        self.name = name
+        self._lock = threading.Lock()  # One connection, shared by this process' threads
+        self._conn = connect(path or data_path("rate_budget.sqlite3"))
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_budget ("
+            " name TEXT PRIMARY KEY, tat REAL, blocked_until REAL, rate REAL)"
+        )
+
+    def _load(self):
+        row = self._conn.execute(
+            "SELECT tat, blocked_until, rate FROM rate_budget WHERE name = ?", (self.name,)
+        ).fetchone()
+        return dict(zip(STATE_KEYS, row)) if row else {}
+
+    def transact(self, fn):
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock up front: other processes
+            # wait (busy timeout) instead of reading a state about to change
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                state, result = fn(self._load())
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_budget (name, tat, blocked_until, rate) VALUES (?, ?, ?, ?)",
+                    (self.name, *(state.get(key) for key in STATE_KEYS)),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def read(self):
+        with self._lock:
+            return self._load()
+
+
+class RedisBudget:
+    def __init__(self, url, name="spotify"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RATE_BUDGET=redis://... needs the 'redis' package (pip install redis)")
+        self.key = f"mixer:rate_budget:{name}"
+        self._redis = redis.Redis.from_url(url)
+
+    def _decode(self, raw):
+        return {key.decode(): float(value) for key, value in raw.items()}
+
+    def transact(self, fn):
+        def run(pipe):
+            # WATCH/MULTI: retried by redis-py if another process wrote the key meanwhile
+            state, result = fn(self._decode(pipe.hgetall(self.key)))
+            pipe.multi()
+            pipe.hset(self.key, mapping={key: state[key] for key in STATE_KEYS if state.get(key) is not None})
+            return result
+        return self._redis.transaction(run, self.key, value_from_callable=True)
+
+    def read(self):
+        return self._decode(self._redis.hgetall(self.key))
+
+
+def budget_from_env(spec=None):
+    """The backend named by `spec` (default: the RATE_BUDGET env var)."""
+    spec = spec or RATE_BUDGET
+    if spec == "memory":
+        return MemoryBudget()
+    if spec == "sqlite":
+        return SQLiteBudget()
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBudget(spec)
+    raise ValueError(f"Unknown RATE_BUDGET backend: {spec!r}")
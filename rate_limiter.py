@@ -0,0 +1,239 @@
+"""
+Adaptive rate limiter shared by every Spotify call.
+
+A token bucket (implemented as GCRA "virtual scheduling", so it needs no
+background refill thread) whose rate follows AIMD: each healthy response adds
+`increase` calls/s, each 429 multiplies the rate by `decrease` and blocks all
+callers until the `Retry-After` delay has passed. This replaces the fixed
+random `smart_sleep()` pauses: a run only waits when Spotify asks it to.
+
+The bucket state lives in a rate_budget backend, so several processes can
+share one budget (the server's uvicorn workers all draw from the same quota).
+
+With a `tracer` (tracing.Tracer; per job on a ScopedLimiter), every wait is
+recorded as a "sleep" span and every 429 as a "throttled" event under the
+calling thread's current span (the page or batch being sent).
+"""
+import threading
+import time
+
+from rate_budget import MemoryBudget
+
+DEFAULT_RETRY_AFTER = 2  # Seconds, when a 429 comes without Retry-After
+
+
+def retry_after_from(e):
+    """Returns the Retry-After delay of a 429 error, or None for other errors."""
+    status_code = getattr(e, 'http_status', None)
+    if status_code != 429:
+        return None
+    headers = getattr(e, 'headers', None) or {}
+    try:
+        return max(0.0, float(headers.get('Retry-After', DEFAULT_RETRY_AFTER)))
+    except (TypeError, ValueError):
+        return float(DEFAULT_RETRY_AFTER)
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket with AIMD rate control.
+
+    `call(fn, *args, **kwargs)` waits for a token, runs `fn` and retries it up
+    to `max_retries` times when Spotify answers 429. A Retry-After longer than
+    `max_retry_after` is not waited out: the error is raised so the caller can
+    report the lockout (see server.handle_spotify_error).
+
+    `budget` is the backend holding the bucket state (rate_budget.MemoryBudget
+    by default); `rate` is the starting rate of a budget nobody has used yet.
+    Call counters and throttle stats stay per process.
+    """
+
+    def __init__(self, rate=2.0, min_rate=0.2, max_rate=10.0, burst=4,
+                 increase=0.05, decrease=0.5, max_retries=3, max_retry_after=120,
+                 budget=None, tracer=None):
+        self.initial_rate = rate
+        self.budget = budget or MemoryBudget()
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.tracer = tracer
+
+        self._lock = threading.Lock()  # Guards the local counters only
+
+        self.calls = 0
+        self.throttle_events = 0
+        self.throttled_seconds = 0.0    # All time spent waiting in the limiter
+        self.retry_after_seconds = 0.0  # Part of it imposed by Retry-After
+        self.network_seconds = 0.0      # Time inside the Spotify calls themselves
+
+    def _state(self, state):
+        state.setdefault("rate", self.initial_rate)
+        state.setdefault("tat", 0.0)            # Theoretical arrival time of the next call
+        state.setdefault("blocked_until", 0.0)  # Set by Retry-After
+        return state
+
+    def acquire(self):
+        """Blocks until the bucket grants a call. Returns the seconds waited."""
+        def reserve(state):
+            state = self._state(state)
+            # Wall clock, not monotonic: the timestamps are shared between processes
+            now = time.time()
+            interval = 1.0 / state["rate"]
+            tat = max(state["tat"], now, state["blocked_until"])
+            slot = max(now, tat - (self.burst - 1) * interval, state["blocked_until"])
+            state["tat"] = tat + interval
+            return state, slot - now
+
+        delay = self.budget.transact(reserve)
+        with self._lock:
+            self.calls += 1
+        if delay > 0:
+            time.sleep(delay)
+            with self._lock:
+                self.throttled_seconds += delay
+            return delay
+        return 0.0
+
+    def on_success(self):
+        def increase(state):
+            state = self._state(state)
+            state["rate"] = min(self.max_rate, state["rate"] + self.increase)
+            return state, None
+        self.budget.transact(increase)
+
+    def on_throttle(self, retry_after):
+        def decrease(state):
+            state = self._state(state)
+            state["rate"] = max(self.min_rate, state["rate"] * self.decrease)
+            state["blocked_until"] = max(state["blocked_until"], time.time() + retry_after)
+            return state, None
+        self.budget.transact(decrease)
+        with self._lock:
+            self.throttle_events += 1
+            self.retry_after_seconds += retry_after
+
+    @property
+    def rate(self):
+        """Current shared rate (calls/s)."""
+        return self._state(self.budget.read())["rate"]
+
+    @property
+    def healthy(self):
+        """True while no Retry-After block is active and the rate is above its floor."""
+        state = self._state(self.budget.read())
+        return time.time() >= state["blocked_until"] and state["rate"] > self.min_rate
+
+    def _record_network(self, scope, seconds):
+        with self._lock:
+            self.network_seconds += seconds
+        if scope:
+            with scope._lock:
+                scope.network_seconds += seconds
+
+    def _call(self, scope, fn, args, kwargs):
+        tracer = scope.tracer if scope else self.tracer
+        attempt = 0
+        while True:
+            waited = scope.acquire() if scope else self.acquire()
+            if scope:
+                scope._record(waited=waited)
+            if tracer and waited:
+                now = time.perf_counter()
+                tracer.record("sleep", now - waited, now, seconds=round(waited, 3), attempt=attempt)
+            started = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self._record_network(scope, time.monotonic() - started)
+                retry_after = retry_after_from(e)
+                if (retry_after is None or attempt >= self.max_retries
+                        or retry_after > self.max_retry_after):
+                    raise
+                print(f"Rate limited (429): backing off {retry_after:.1f}s, "
+                      f"rate now {self.rate * self.decrease:.2f}/s")
+                if tracer:
+                    tracer.event("throttled", http_status=429, retry_after=retry_after, attempt=attempt)
+                self.on_throttle(retry_after)
+                if scope:
+                    scope._record(retry_after=retry_after)
+                attempt += 1
+                continue
+            self._record_network(scope, time.monotonic() - started)
+            self.on_success()
+            return result
+
+    def call(self, fn, *args, **kwargs):
+        return self._call(None, fn, args, kwargs)
+
+    def scoped(self, on_throttle=None, scheduler=None, owner=None, tracer=None):
+        """
+        A view that shares this bucket but keeps its own counters (one per job).
+        `on_throttle(seconds)` is called whenever one of its calls is blocked by
+        a Retry-After. With a `scheduler` (scheduler.FairScheduler) its calls
+        wait for `owner`'s turn before taking a token. Its waits and 429s are
+        traced into `tracer`.
+        """
+        return ScopedLimiter(self, on_throttle, scheduler, owner, tracer)
+
+    def stats(self):
+        return {
+            "api_calls": self.calls,
+            "throttle_events": self.throttle_events,
+            "throttled_seconds": round(self.throttled_seconds, 2),
+            "retry_after_seconds": round(self.retry_after_seconds, 2),
+            "network_seconds": round(self.network_seconds, 2),
+            "rate": round(self.rate, 2),
+        }
+
+
+class ScopedLimiter:
+    """Per-job counters on top of a shared AdaptiveRateLimiter."""
+
+    def __init__(self, parent, on_throttle=None, scheduler=None, owner=None, tracer=None):
+        self.parent = parent
+        self.on_throttle = on_throttle
+        self.scheduler = scheduler
+        self.owner = owner
+        self.tracer = tracer
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.throttle_events = 0
+        self.throttled_seconds = 0.0
+        self.retry_after_seconds = 0.0
+        self.network_seconds = 0.0
+
+    def _record(self, waited=0.0, retry_after=None):
+        with self._lock:
+            if retry_after is None:
+                self.calls += 1
+                self.throttled_seconds += waited
+            else:
+                self.throttle_events += 1
+                self.retry_after_seconds += retry_after
+        if retry_after is not None and self.on_throttle:
+            self.on_throttle(retry_after)
+
+    def acquire(self):
+        if self.scheduler:
+            return self.scheduler.acquire(self.owner, self.parent.acquire)
+        return self.parent.acquire()
+
+    @property
+    def healthy(self):
+        return self.parent.healthy
+
+    def call(self, fn, *args, **kwargs):
+        return self.parent._call(self, fn, args, kwargs)
+
+    def stats(self):
+        return {
+            "api_calls": self.calls,
+            "throttle_events": self.throttle_events,
+            "throttled_seconds": round(self.throttled_seconds, 2),
+            "retry_after_seconds": round(self.retry_after_seconds, 2),
+            "network_seconds": round(self.network_seconds, 2),
+        }
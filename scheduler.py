@@ -0,0 +1,95 @@
+"""
+Fair interleaving of API calls across concurrent jobs.
+
+Every job draws from the same rate budget; without a scheduler whichever job
+has the most threads waiting gets most of the tokens, so one 100k-track mix
+starves everyone else. FairScheduler sits in front of the bucket: one caller
+at a time takes a token, and when several jobs are waiting the next token
+goes to
+
+1. the user who has been served the fewest calls (per-user fair share; a user
+   who becomes active starts from the current minimum, not from zero), then
+2. the job with the least remaining work (shortest-remaining-work-first), so
+   small mixes finish quickly even while whales are running.
+
+Counters of idle users are dropped once they are no longer above the
+active users' minimum (on their return they would be lifted to it anyway),
+and all of them when nobody is waiting, so the table only holds users with
+calls in flight or a lead still to pay back.
+
+Owners are duck-typed: anything with `user` and `remaining_work` (jobs.Job).
+"""
+import itertools
+import threading
+
+
+class FairScheduler:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._waiting = {}   # owner -> [waiting calls, arrival seq]
+        self._served = {}    # user -> calls granted
+        self._busy = False
+        self._seq = itertools.count()
+        self.grants = 0
+
+    def _user(self, owner):
+        return getattr(owner, "user", None) or id(owner)
+
+    def _activate(self, owner):
+        user = self._user(owner)
+        active = {self._user(o) for o in self._waiting}
+        if user in active:
+            return
+        # Start-time fairness: idle time is not banked as credit
+        floor = min((self._served.get(u, 0) for u in active), default=0)
+        self._served[user] = max(self._served.get(user, 0), floor)
+
+    def _prune(self):
+        """Drops the counters of idle users that no longer record a lead."""
+        active = {self._user(o) for o in self._waiting}
+        if not active:
+            self._served.clear()
+            return
+        floor = min(self._served.get(u, 0) for u in active)
+        for user in [u for u, served in self._served.items() if served <= floor and u not in active]:
+            del self._served[user]
+
+    def _pick(self):
+        return min(
+            self._waiting,
+            key=lambda o: (self._served.get(self._user(o), 0), o.remaining_work, self._waiting[o][1]),
+        )
+
+    def acquire(self, owner, grant):
+        """Waits for `owner`'s turn, then runs `grant()` (the bucket acquire) and returns its result."""
+        with self._cond:
+            if owner in self._waiting:
+                self._waiting[owner][0] += 1
+            else:
+                self._activate(owner)
+                self._waiting[owner] = [1, next(self._seq)]
+            self._cond.wait_for(lambda: not self._busy and self._pick() is owner)
+            self._busy = True
+            entry = self._waiting[owner]
+            entry[0] -= 1
+            if not entry[0]:
+                del self._waiting[owner]
+            user = self._user(owner)
+            self._served[user] = self._served.get(user, 0) + 1
+            self._prune()
+            self.grants += 1
+        try:
+            return grant()
+        finally:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+    def tracked_users(self):
+        """Users holding a fair-share counter (waiting, or idle with a lead)."""
+        with self._cond:
+            return len(self._served)
+
+    def waiting(self):
+        with self._cond:
+            return sum(count for count, _ in self._waiting.values())
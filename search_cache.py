@@ -0,0 +1,125 @@
+"""
+Persistent cache for Spotify read responses (search pages, recommendations).
+
+Entries are keyed by (endpoint, query, offset, limit, market), expire after
+`ttl` seconds and are evicted least-recently-used once the table grows past
+`max_entries`. Only the fields the mixers use are stored (see slim_track), so
+a page costs a few KB on disk and a hit costs a single indexed SELECT instead
+of an API call plus a rate-limiter wait.
+"""
+import json
+import os
+import threading
+import time
+
+from storage import connect, data_path
+
+DEFAULT_TTL = int(os.getenv("SEARCH_CACHE_TTL", 24 * 3600))  # Seconds; 0 disables the cache
+DEFAULT_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 20000))
+
+
+def slim_track(track):
+    """Keeps only the track fields the search/filter/catalog code reads."""
+    album = track.get('album') or {}
+    return {
+        'uri': track.get('uri'),
+        'id': track.get('id'),
+        'name': track.get('name', ''),
+        'popularity': track.get('popularity'),
+        'artists': [{'id': a.get('id'), 'name': a.get('name', '')} for a in track.get('artists') or []],
+        'album': {'release_date': album.get('release_date')},
+    }
+
+
+class SearchCache:
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = connect(path or data_path("search_cache.sqlite3"))
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, created REAL NOT NULL, accessed REAL NOT NULL, payload TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    @staticmethod
+    def _key(endpoint, query, offset, limit, market):
+        return json.dumps([endpoint, query, offset, limit, market])
+
+    def get(self, endpoint, query, offset=0, limit=0, market=None, max_age=None):
+        """
+        Returns the cached payload, or None on a miss or expired entry. With
+        `max_age` (seconds), older entries are misses for this call too.
+        """
+        if not self.enabled:
+            return None
+        key = self._key(endpoint, query, offset, limit, market)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created, payload FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[0] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None or (max_age is not None and now - row[0] > max_age):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[1])
+
+    def put(self, endpoint, query, offset, limit, market, payload):
+        if not self.enabled:
+            return
+        key = self._key(endpoint, query, offset, limit, market)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, created, accessed, payload) VALUES (?, ?, ?, ?)",
+                (key, now, now, json.dumps(payload, separators=(',', ':'))),
+            )
+            self._evict()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed LIMIT ?)", (excess,)
+            )
+            self.evictions += excess
+
+    def fetch(self, endpoint, query, offset, limit, market, loader, max_age=None):
+        """get() or, on a miss, loader() + put(). Returns (payload, hit)."""
+        payload = self.get(endpoint, query, offset, limit, market, max_age)
+        if payload is not None:
+            return payload, True
+        payload = loader()
+        self.put(endpoint, query, offset, limit, market, payload)
+        return payload, False
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "ttl": self.ttl,
+            "max_entries": self.max_entries,
+        }
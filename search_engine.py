@@ -0,0 +1,463 @@
+"""
+Concurrent genre search engine shared by server.py, spotify_filler.py and app.py.
+
+Genres and their result pages are fetched in parallel on a bounded thread pool,
+while the calling thread acts as the coordinator: it owns the per-genre sets,
+decides which page to request next and stops a genre as soon as its quota is
+met. Every worker draws from one shared AdaptiveRateLimiter, so adding workers
+overlaps network latency instead of multiplying the request rate.
+"""
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from rate_limiter import AdaptiveRateLimiter
+from search_cache import slim_track
+from catalog import RECOMMENDATIONS_QUERY
+from query_planner import POPULARITY_BANDS, REC_BATCH_LIMIT, fresh_terms, seed_batches
+from tracing import NULL_TRACER
+
+FRESH_PAGE_MAX_AGE = 600  # Seconds a cached fresh-shard page may still serve a refresh
+
+
+def strict_genre_terms(genre):
+    """Only the exact `genre:` filter (the server's anti-pollution strategy)."""
+    return [f"genre:\"{genre}\""]
+
+
+def broad_genre_terms(genre):
+    """The five terms used by the CLI and the Streamlit app."""
+    return [
+        f"genre:\"{genre}\"",
+        f"tag:{genre}",
+        f"{genre} playlist",
+        f"{genre} mix",
+        genre,
+    ]
+
+
+class _GenreState:
+    def __init__(self, genre, terms, start_offsets=None):
+        self.genre = genre
+        self.terms = terms
+        self.start_offsets = start_offsets or {}  # term -> first offset to page (refresh)
+        self.fresh = set()  # Fresh shards of a refresh: cached pages of them go stale fast
+        self.term_idx = 0
+        self.offset = self.start_offsets.get(self.term, 0)
+        self.in_flight = 0
+        self.rec_pending = False
+        self.tracks = set()
+        self.reported = False
+        self.term_stats = {}  # term -> [pages, items, new unique tracks]
+        self.harvested = {}   # term -> offset after the last page fetched
+        self.exhausted = set()
+        self.span = None        # Trace spans: the genre and its current term
+        self.term_span = None
+        self.traced_term = None
+
+    @property
+    def term(self):
+        return self.terms[self.term_idx] if self.term_idx < len(self.terms) else None
+
+    def next_term(self):
+        self.term_idx += 1
+        self.offset = self.start_offsets.get(self.term, 0)
+
+
+class _RecBatch:
+    """A group of up to 5 genres sharing multi-seed recommendation calls."""
+
+    def __init__(self, states):
+        self.states = states
+        self.band = 0
+        self.received = {state.genre: 0 for state in states}
+
+
+class SearchEngine:
+    """
+    Runs the recommendation + search strategies for several genres at once.
+
+    Seed genres get up to `rec_quota` tracks each from batched multi-seed
+    recommendation calls (see query_planner.seed_batches); the rest of each
+    genre's quota comes from paging its search terms.
+
+    `terms(genre)` returns the ordered search terms for a genre, `track_filter`
+    (track, genre) -> bool rejects unwanted tracks, `seed_genres` is the set of
+    genres that may be used as recommendation seeds and `on_genre_done`
+    (genre, count) is called from the coordinator thread when a genre finishes.
+    With a `cache` (search_cache.SearchCache), pages and recommendations already
+    seen are served locally without touching the limiter. With a `catalog`
+    (catalog.TrackCatalog), every track seen is recorded and, if `catalog_first`,
+    each genre starts from its catalog tracks and only searches the shortfall.
+
+    A term stops being paged once a page's yield (share of its items that became
+    new unique tracks after filtering) drops below `min_yield`. With a
+    `yield_store` (yield_stats.TermYieldStore) the per-term totals of pages
+    fetched from Spotify (not the cache) are saved and later runs try each
+    genre's most productive terms first.
+
+    `on_tracks(uris)` receives each batch of URIs that are new across all
+    genres as soon as they are found (see pipeline.MixPipeline).
+    `on_event(event, data)` receives structured progress events from the
+    coordinator thread: "genre_started", "page_fetched" (with its yield) and
+    "genre_done".
+
+    With a `single_flight` (single_flight.SingleFlight, shared by concurrent
+    engines), identical pages/recommendations already being fetched by another
+    job are awaited and shared instead of fetched again.
+
+    With a `cursor` (cursors.MixCursor) the offsets paged for each term are
+    saved for the mix. With `refresh` too, the run only looks for new
+    material: fresh shards (query_planner.fresh_terms) from the top, served
+    from the cache only when cached in the last FRESH_PAGE_MAX_AGE seconds,
+    the other terms from their first unvisited offset (dead ones skipped),
+    and URIs the mix already delivered are rejected.
+
+    URIs in `exclude` (any container, e.g. library.BloomFilter of the user's
+    library) are rejected before they count toward a genre's quota.
+
+    With a `tracer` (tracing.Tracer) each genre, term, page request and
+    recommendation call is recorded as a span (offset, items, new uniques,
+    cache hit, HTTP status) under the caller's current span.
+    """
+
+    def __init__(self, sp, limiter=None, max_workers=4, page_window=2,
+                 search_limit=20, max_offset=950, rec_quota=50, market=None,
+                 seed_genres=None, terms=strict_genre_terms, track_filter=None,
+                 on_genre_done=None, log=None, cache=None, catalog=None,
+                 catalog_first=False, min_yield=0.1, yield_store=None,
+                 on_tracks=None, on_event=None, single_flight=None, cursor=None, refresh=False,
+                 exclude=None, tracer=None):
+        self.sp = sp
+        self.limiter = limiter or AdaptiveRateLimiter()
+        self.max_workers = max_workers
+        self.page_window = page_window
+        self.search_limit = search_limit
+        self.max_offset = max_offset
+        self.rec_quota = rec_quota
+        self.market = market
+        self.seed_genres = set(seed_genres or [])
+        self.terms = terms
+        self.track_filter = track_filter
+        self.on_genre_done = on_genre_done
+        self.log = log or (lambda message: None)
+        self.cache = cache
+        self.catalog = catalog
+        self.catalog_first = catalog_first
+        self.min_yield = min_yield
+        self.yield_store = yield_store
+        self.on_tracks = on_tracks
+        self.on_event = on_event
+        self.single_flight = single_flight
+        self.cursor = cursor
+        self.refresh = refresh and cursor is not None
+        self.exclude = exclude
+        self.tracer = tracer or NULL_TRACER
+        self._delivered = set()
+        self._stats_lock = threading.Lock()
+        self.stats = {"cache_hits": 0, "cache_misses": 0, "catalog_tracks": 0,
+                      "rec_calls": 0, "pages": 0, "empty_terms": 0, "low_yield_terms": 0,
+                      "coalesced_calls": 0, "skipped_delivered": 0,
+                      "skipped_owned": 0}
+
+    # --- Worker side (runs on the pool, only talks to Spotify) ---
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + n
+
+    def _cached(self, endpoint, query, offset, limit, loader, span, max_age=None):
+        if self.single_flight:
+            key = (endpoint, query, offset, limit, self.market)
+            load = loader
+
+            def loader():
+                items, shared = self.single_flight.do(key, load)
+                if shared:
+                    self._count("coalesced_calls")
+                    span.set(coalesced=True)
+                return items
+        if not self.cache:
+            return loader(), False
+        items, hit = self.cache.fetch(endpoint, query, offset, limit, self.market, loader, max_age)
+        self._count("cache_hits" if hit else "cache_misses")
+        span.set(cached=hit)
+        return items, hit
+
+    def _fetch_recommendations(self, genres, band, span):
+        low, high = POPULARITY_BANDS[band]
+
+        def load():
+            results = self.limiter.call(self.sp.recommendations, seed_genres=genres,
+                                        limit=REC_BATCH_LIMIT, min_popularity=low,
+                                        max_popularity=high, market=self.market)
+            span.set(http_status=200)
+            return [slim_track(t) for t in results.get('tracks', []) if t]
+        query = f"seed_genres={','.join(genres)}&min_popularity={low}&max_popularity={high}"
+        with span:
+            items, _ = self._cached('recommendations', query, 0, REC_BATCH_LIMIT, load, span)
+            span.set(items=len(items))
+        return items
+
+    def _fetch_page(self, term, offset, span, max_age=None):
+        """(items, served from the cache)."""
+        def load():
+            results = self.limiter.call(self.sp.search, q=term, type='track',
+                                        limit=self.search_limit, offset=offset,
+                                        market=self.market)
+            span.set(http_status=200)
+            return [slim_track(t) for t in results.get('tracks', {}).get('items', []) if t]
+        with span:
+            items, cached = self._cached('search', term, offset, self.search_limit, load, span, max_age)
+            span.set(items=len(items))
+        return items, cached
+
+    # --- Coordinator side (runs on the calling thread, owns all state) ---
+
+    def _emit(self, event, **data):
+        if self.on_event:
+            self.on_event(event, data)
+
+    def _prefill_from_catalog(self, state, quota):
+        queries = list(state.terms) + [RECOMMENDATIONS_QUERY]
+        before = len(state.tracks)
+        self._accept(state, self.catalog.tracks_for_genre(state.genre, quota, queries=queries))
+        self._count("catalog_tracks", len(state.tracks) - before)
+
+    def _accept(self, state, tracks):
+        fresh = []
+        for track in tracks:
+            if not track or not track.get('uri'):
+                continue
+            if self.track_filter and not self.track_filter(track, state.genre):
+                continue
+            uri = track['uri']
+            if self.refresh and uri in self.cursor.delivered:
+                self._count("skipped_delivered")
+                continue
+            if self.exclude is not None and uri in self.exclude:
+                self._count("skipped_owned")
+                continue
+            state.tracks.add(uri)
+            if uri not in self._delivered:
+                self._delivered.add(uri)
+                fresh.append(uri)
+        if fresh and self.on_tracks:
+            self.on_tracks(fresh)
+
+    def _terms_for(self, genre):
+        terms = self.terms(genre)
+        if self.yield_store:
+            terms = self.yield_store.order(genre, terms)
+        return terms
+
+    def _new_state(self, genre):
+        terms = self._terms_for(genre)
+        if not self.refresh:
+            return _GenreState(genre, terms)
+        # New releases surface in the fresh shards; elsewhere only unvisited offsets can hold new tracks
+        fresh = fresh_terms(genre)
+        rest = [term for term in terms if term not in fresh and not self.cursor.exhausted(genre, term)]
+        state = _GenreState(genre, fresh + rest, {term: self.cursor.offset(genre, term) for term in rest})
+        state.fresh = set(fresh)
+        return state
+
+    def _save_cursor(self, states):
+        self.cursor.save_terms(
+            (state.genre, term, offset, term in state.exhausted)
+            for state in states for term, offset in state.harvested.items()
+        )
+
+    def _record_yield(self, state, term, items, new):
+        stats = state.term_stats.setdefault(term, [0, 0, 0])
+        stats[0] += 1
+        stats[1] += items
+        stats[2] += new
+
+    def _save_yields(self, states):
+        for state in states:
+            for term, (pages, items, new) in state.term_stats.items():
+                self.yield_store.record(state.genre, term, pages, items, new)
+
+    def _submit_recommendations(self, pool, pending, batch, quota):
+        """Next call for `batch`, seeded by its genres still short of their quota."""
+        needy = [s for s in batch.states
+                 if batch.received[s.genre] < self.rec_quota and len(s.tracks) < quota]
+        if not needy or batch.band >= len(POPULARITY_BANDS):
+            for state in batch.states:
+                state.rec_pending = False
+            return
+        genres = [s.genre for s in needy]
+        span = self.tracer.span("recommendations", self._trace_parent, genres=genres, band=batch.band)
+        future = pool.submit(self._fetch_recommendations, genres, batch.band, span)
+        pending[future] = (batch, None, batch.band, span)
+        self._count("rec_calls")
+        for state in batch.states:
+            state.rec_pending = True
+
+    def _handle_recommendations(self, pool, pending, batch, items, quota, span):
+        """
+        Spreads the tracks over the batch's genres (least-served first) to fill
+        their quotas. With several seeds that genre is a guess, so only
+        single-genre batches are recorded in the catalog.
+        """
+        before = sum(len(s.tracks) for s in batch.states)
+        for track in items or []:
+            needy = [s for s in batch.states if batch.received[s.genre] < self.rec_quota]
+            if not needy:
+                break
+            state = min(needy, key=lambda s: batch.received[s.genre])
+            if self.catalog and len(batch.states) == 1:
+                self.catalog.record([track], state.genre, RECOMMENDATIONS_QUERY)
+            had = len(state.tracks)
+            self._accept(state, [track])
+            batch.received[state.genre] += len(state.tracks) - had
+        span.set(new=sum(len(s.tracks) for s in batch.states) - before)
+
+        batch.band += 1
+        if items:
+            self._submit_recommendations(pool, pending, batch, quota)
+        else:
+            # Error or nothing left for these seeds: stop this batch.
+            for state in batch.states:
+                state.rec_pending = False
+
+    def _handle_result(self, state, term, offset, page, span):
+        """Processes one finished search page (None when it failed)."""
+        items, cached = page or (None, False)
+        before = len(state.tracks)
+        if items:
+            if self.catalog:
+                self.catalog.record(items, state.genre, term)
+            self._accept(state, items)
+        new = len(state.tracks) - before
+        if items is not None:
+            state.harvested[term] = max(state.harvested.get(term, 0), offset + self.search_limit)
+            if not items:
+                state.exhausted.add(term)
+            self._count("pages")
+            if not cached:
+                # A cached page's tracks are usually in the catalog prefill already:
+                # its near-zero yield says nothing about the term
+                self._record_yield(state, term, len(items), new)
+            span.set(new=new)
+            self._emit("page_fetched", genre=state.genre, term=term, offset=offset, items=len(items),
+                       new=new, page_yield=round(new / len(items), 3) if items else 0.0)
+        if term != state.term:
+            return  # A late page of a term we already moved past
+
+        if not items:
+            # Empty page or error: this term (or shard) is exhausted.
+            if offset == 0:
+                self._count("empty_terms")
+            state.next_term()
+        elif new / len(items) < self.min_yield:
+            # Mostly duplicates/filtered: later pages won't do better.
+            self._count("low_yield_terms")
+            state.next_term()
+
+    def _trace_term(self, state):
+        """Moves `state`'s open term span to its current term (none once reported)."""
+        term = None if state.reported else state.term
+        if state.term_span and state.traced_term != term:
+            state.term_span.finish()
+            state.term_span = None
+        if term is not None and state.term_span is None:
+            state.term_span = self.tracer.start("term", state.span, lane=f"genre {state.genre}", term=term)
+            state.traced_term = term
+        return state.term_span
+
+    def _end_genre_trace(self, state):
+        if state.term_span:
+            state.term_span.finish()
+            state.term_span = None
+        state.span.set(tracks=len(state.tracks))
+        state.span.finish()
+
+    def _schedule(self, pool, pending, state, quota):
+        while state.in_flight < self.page_window and len(state.tracks) < quota:
+            term = state.term
+            if term is None:
+                break
+            if state.offset >= self.max_offset:
+                state.next_term()
+                continue
+            span = self.tracer.span("page", self._trace_term(state), term=term, offset=state.offset)
+            max_age = FRESH_PAGE_MAX_AGE if term in state.fresh else None
+            future = pool.submit(self._fetch_page, term, state.offset, span, max_age)
+            pending[future] = (state, term, state.offset, span)
+            state.offset += self.search_limit
+            state.in_flight += 1
+
+    def _maybe_report(self, state, quota):
+        if state.reported or state.in_flight or state.rec_pending:
+            return
+        if len(state.tracks) >= quota or state.term is None:
+            state.reported = True
+            self._end_genre_trace(state)
+            self._emit("genre_done", genre=state.genre, tracks=len(state.tracks))
+            if self.on_genre_done:
+                self.on_genre_done(state.genre, len(state.tracks))
+
+    def search(self, genres, target_count):
+        """Returns up to `target_count` deduplicated, shuffled track URIs."""
+        if not genres:
+            return []
+        quota = int(target_count / len(genres)) + 1
+        self._delivered = set()
+        states = [self._new_state(genre) for genre in genres]
+        pending = {}
+        self._trace_parent = self.tracer.current()
+
+        for state in states:
+            state.span = self.tracer.start("genre", self._trace_parent, lane=f"genre {state.genre}",
+                                           genre=state.genre, quota=quota, terms=len(state.terms))
+            self._emit("genre_started", genre=state.genre, quota=quota, terms=len(state.terms))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers,
+                                thread_name_prefix="search") as pool:
+            if self.catalog and self.catalog_first:
+                for state in states:
+                    self._prefill_from_catalog(state, quota)
+            seeded = [s for s in states if s.genre in self.seed_genres and len(s.tracks) < quota]
+            for group in seed_batches(seeded):
+                self._submit_recommendations(pool, pending, _RecBatch(group), quota)
+            for state in states:
+                self._schedule(pool, pending, state, quota)
+                self._maybe_report(state, quota)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    owner, term, offset, span = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        if term is None:
+                            self.log(f"Rec Error: {e}")
+                        else:
+                            self.log(f"Search error for '{term}': {e}")
+                        result = None
+
+                    if term is None:
+                        self._handle_recommendations(pool, pending, owner, result, quota, span)
+                        touched = owner.states
+                    else:
+                        owner.in_flight -= 1
+                        self._handle_result(owner, term, offset, result, span)
+                        touched = [owner]
+                    for state in touched:
+                        self._schedule(pool, pending, state, quota)
+                        self._maybe_report(state, quota)
+
+        for state in states:
+            if not state.reported:
+                self._end_genre_trace(state)
+        if self.yield_store:
+            self._save_yields(states)
+        if self.cursor:
+            self._save_cursor(states)
+
+        track_list = list(self._delivered)
+        random.shuffle(track_list)
+        return track_list[:target_count]
@@ -1,14 +1,34 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
 from typing import List, Optional
-import spotipy
 from spotipy.oauth2 import SpotifyOAuth
-import random
+import asyncio
 import time
+import json
 import re # Added for text filtering
 from datetime import datetime
 import os
+from concurrent.futures import ThreadPoolExecutor
+from search_engine import SearchEngine, strict_genre_terms
+from query_planner import sharded
+from rate_limiter import AdaptiveRateLimiter
+from rate_budget import budget_from_env
+from search_cache import SearchCache
+from single_flight import SingleFlight
+from catalog import TrackCatalog
+from yield_stats import TermYieldStore
+from pipeline import MixPipeline
+from batch_writer import BatchWriter
+from journal import WriteJournal
+from sync import SyncStore, sync_playlist, playlist_id_from
+from cursors import CursorStore, cursor_key
+from library import LibraryStore
+from jobs import JobManager, JobCancelled
+from sessions import SpotifySessionPool, token_key
+from metrics import MetricsRegistry, SpotifyMetrics, TRACK_BUCKETS
+from tracing import Tracer, NULL_TRACER
 
 app = FastAPI()
 
@@ -28,7 +48,14 @@ MAX_TRACKS = 100000
 PLAYLIST_LIMIT = 10000
 TRACKS_PER_REQUEST = 50
 SEARCH_LIMIT = 20
-SAFE_MODE_DELAY = 1  # Seconds to sleep between calls
+RATE_LIMIT_START = 2.0   # Calls/s at startup (grows while responses are healthy)
+RATE_LIMIT_MIN = 0.2     # Floor after repeated 429s
+RATE_LIMIT_MAX = 10.0    # Ceiling for additive increase
+SEARCH_WORKERS = 4  # Concurrent search requests (genres/pages)
+MAX_REPORTED_FAILURES = 100  # Per-URI write failures listed in a mix result
+NO_NEW_TRACKS = "No new tracks for these genres since this mix's last run."
+SSE_POLL_SECONDS = 0.25       # Event stream check interval (sleeps on the event loop)
+SSE_KEEPALIVE_SECONDS = 15.0  # Comment line sent on a quiet stream
 
 AVAILABLE_GENRES = [
     "acoustic", "alt-rock", "alternative", "alternative-metal", "ambient",
@@ -71,12 +98,70 @@ class ExecuteRequest(BaseModel):
     playlist_name: Optional[str] = None
     description: Optional[str] = None
     track_count: int
+    use_catalog: bool = True  # Fill from the local catalog first, search only the shortfall
+    sync_playlist_id: Optional[str] = None  # Refresh this playlist (ID or link) in place instead of creating new ones
+    refresh: bool = False  # Only tracks this mix never delivered, from fresh shards and unvisited offsets
+    only_new_to_me: bool = False  # Skip tracks in the user's saved tracks and own playlists (see library.py)
+    trace: bool = False  # Add the run's span timeline (Chrome trace-event format) to the result
 
 # ==========================================
 # HELPER FUNCTIONS (LOGIC MIGRATED FROM APP.PY)
 # ==========================================
-def smart_sleep():
-    time.sleep(random.uniform(1, 3))
+# One adaptive budget shared by every Spotify call of every worker process
+# (RATE_BUDGET=sqlite by default, redis://... across hosts; see rate_budget.py)
+RATE_LIMITER = AdaptiveRateLimiter(rate=RATE_LIMIT_START, min_rate=RATE_LIMIT_MIN, max_rate=RATE_LIMIT_MAX,
+                                   budget=budget_from_env())
+
+# Persistent search/recommendation response cache (TTL + LRU, see search_cache.py)
+SEARCH_CACHE = SearchCache()
+
+# Concurrent jobs asking for the same page share one upstream call
+SINGLE_FLIGHT = SingleFlight()
+
+# Every track seen by the engine; repeat mixes are filled from here first
+TRACK_CATALOG = TrackCatalog()
+
+# Per-term yield history: productive terms/shards are tried first on later runs
+TERM_YIELDS = TermYieldStore()
+
+# Durable record of each job's tracks, volumes and committed batches (resume)
+WRITE_JOURNAL = WriteJournal()
+
+# Contents each sync left in a playlist (by snapshot_id): unchanged playlists aren't re-read
+SYNC_STORE = SyncStore()
+
+# Per-mix search cursors (offsets harvested, URIs delivered) for refresh runs
+SEARCH_CURSORS = CursorStore()
+
+# Per-user Bloom filters of saved tracks + own playlists ("only new to me")
+USER_LIBRARIES = LibraryStore()
+
+# Everything GET /metrics exposes (Prometheus text format, see metrics.py)
+METRICS = MetricsRegistry()
+
+# Calls, latency, 429s and Retry-After per Spotify endpoint, recorded by the pooled clients
+SPOTIFY_METRICS = SpotifyMetrics(METRICS)
+
+# Keep-alive Spotify clients and cached /me profiles, keyed by token hash
+SPOTIFY_SESSIONS = SpotifySessionPool(instrument=SPOTIFY_METRICS.instrument)
+
+# Background mixes submitted through /jobs (bounded worker pool with fair
+# admission; running jobs interleave their API calls, see jobs.py/scheduler.py)
+JOBS = JobManager()
+
+# Mix-level metrics
+MIXES_IN_FLIGHT = METRICS.gauge("mixer_mixes_in_flight", "Mixes running now (/execute or a /jobs worker).", ("kind",))
+TRACKS_FOUND = METRICS.histogram("mixer_mix_tracks_found", "Tracks found per mix.", buckets=TRACK_BUCKETS)
+TRACKS_WRITTEN = METRICS.histogram("mixer_mix_tracks_written", "Tracks written per mix.", buckets=TRACK_BUCKETS)
+TRACKS_FILTERED = METRICS.counter("mixer_tracks_filtered_total",
+                                  "Tracks dropped by is_safe_text (non-Latin name or artist).")
+METRICS.collector("mixer_throttle_sleep_seconds_total", "Seconds calls waited in the rate limiter.", "counter",
+                  lambda: {(): round(RATE_LIMITER.throttled_seconds, 3)})
+METRICS.collector("mixer_rate_limit_calls_per_second", "Current shared rate of the adaptive limiter.", "gauge",
+                  lambda: {(): round(RATE_LIMITER.rate, 3)})
+METRICS.collector("mixer_jobs", "Background jobs by status.", "gauge",
+                  lambda: {(status,): sum(1 for job in JOBS.list() if job.status == status)
+                           for status in ("queued", "running")}, ("status",))
 
 def is_safe_text(text, genre=None):
     """
@@ -105,115 +190,119 @@ def is_safe_text(text, genre=None):
     
     return True
 
-def search_tracks_logic(sp, genres, target_count):
-    track_uris = set()
-    tracks_per_genre = int(target_count / len(genres)) + 1
-    
+def is_safe_track(track, genre=None):
+    """Filter: Must not have Cyrillic/Russian text in name or artist"""
+    t_name = track.get('name', '')
+    a_name = track['artists'][0]['name'] if track.get('artists') else ''
+    if is_safe_text(t_name, genre) and is_safe_text(a_name, genre):
+        return True
+    TRACKS_FILTERED.inc()
+    return False
+
+def search_tracks_logic(sp, genres, target_count, limiter=None, stats=None, use_catalog=True, on_tracks=None, on_event=None,
+                        cursor=None, refresh=False, exclude=None, tracer=None):
     print(f"Starting search for: {genres}")
-    
-    for genre in genres:
-        genre_tracks = set()
-        print(f"Processing genre: {genre}")
-        
-        # Strategy 1: Recommendations
-        if genre in AVAILABLE_GENRES:
-            try:
-                results = sp.recommendations(seed_genres=[genre], limit=TRACKS_PER_REQUEST, min_popularity=0, market='US')
-                for track in results.get('tracks', []):
-                    # Filter: Must not have Cyrillic/Russian text in name or artist
-                    t_name = track.get('name', '')
-                    a_name = track['artists'][0]['name'] if track.get('artists') else ''
-                    
-                    if track.get('uri') and is_safe_text(t_name, genre) and is_safe_text(a_name, genre):
-                         genre_tracks.add(track['uri'])
-                smart_sleep()
-            except Exception as e:
-                print(f"Rec Error: {e}")
-
-        # Strategy 2: Strict Search (Deep Dive using 'genre:' tag only)
-        # We removed broad terms like "mix" or raw strings to prevent genre pollution.
-        search_terms = [f"genre:\"{genre}\""]
-        
-        for term in search_terms:
-            if len(genre_tracks) >= tracks_per_genre: break
-            
-            offset = 0
-            # Sudo-Infinite Search: Increased limit from 100 to 950 to find more valid tracks
-            while offset < 950 and len(genre_tracks) < tracks_per_genre:
-                try:
-                    results = sp.search(q=term, type='track', limit=SEARCH_LIMIT, offset=offset, market='US')
-                    items = results.get('tracks', {}).get('items', [])
-                    if not items: break
-                    
-                    for track in items:
-                         # Filter: Must not have Cyrillic/Russian text in name or artist
-                        t_name = track.get('name', '')
-                        a_name = track['artists'][0]['name'] if track.get('artists') else ''
-                        if track.get('uri') and is_safe_text(t_name, genre) and is_safe_text(a_name, genre):
-                            genre_tracks.add(track['uri'])
-                    
-                    offset += SEARCH_LIMIT
-                    smart_sleep()
-                    
-                    if len(genre_tracks) >= tracks_per_genre: break
-                except Exception: break
-        
-        track_uris.update(genre_tracks)
-    
+
+    # Strategy 1: Recommendations (official genres only)
+    # Strategy 2: Strict Search (Deep Dive using 'genre:' tag only)
+    # We removed broad terms like "mix" or raw strings to prevent genre pollution.
+    # Past the ~1,000-result window of one query, the genre is split into
+    # disjoint year:/tag: shards (query_planner.py) until the quota is met.
     # Strategy 3 (Fallback) REMOVED to prevent contaminating playlist with other genres.
-    # We now rely exclusively on Recommendations and Strict Genre Search.
+    # Genres and their pages run concurrently, sharing RATE_LIMITER.
+    engine = SearchEngine(
+        sp,
+        limiter=limiter or RATE_LIMITER,
+        max_workers=SEARCH_WORKERS,
+        search_limit=SEARCH_LIMIT,
+        max_offset=950,  # Sudo-Infinite Search: up to 950 to find more valid tracks
+        rec_quota=TRACKS_PER_REQUEST,
+        market='US',
+        seed_genres=AVAILABLE_GENRES,
+        terms=sharded(strict_genre_terms),
+        track_filter=is_safe_track,
+        on_genre_done=lambda genre, count: print(f"Processed genre: {genre} ({count} tracks)"),
+        log=print,
+        cache=SEARCH_CACHE,
+        catalog=TRACK_CATALOG,
+        catalog_first=use_catalog,
+        yield_store=TERM_YIELDS,
+        on_tracks=on_tracks,
+        on_event=on_event,
+        single_flight=SINGLE_FLIGHT,
+        cursor=cursor,
+        refresh=refresh,
+        exclude=exclude,
+        tracer=tracer,
+    )
+    tracks = engine.search(genres, target_count)
+    if stats is not None:
+        stats.update(engine.stats)
+    return tracks
 
-    track_list = list(track_uris)
-    random.shuffle(track_list)
-    return track_list[:target_count]
+def playlist_details(genres, base_name, base_desc, vol_num, total_vols, count):
+    # Name formatting
+    name = base_name
+    if not name or name.strip() == "":
+        title_genres = ", ".join(genres[:2]).title()
+        if len(genres) > 2: title_genres += " & More"
+        name = f"🎵 {title_genres} Mix"
+        
+    if total_vols > 1: name += f" - Vol. {vol_num}/{total_vols}"
+    
+    desc = base_desc
+    if not desc or desc.strip() == "":
+        desc = f"Generated with {', '.join(genres)}. {count} tracks."
+    if total_vols > 1: desc += f" (Part {vol_num}/{total_vols})"
+    return name, desc
 
-def create_playlists_logic(sp, user_id, genres, all_tracks, base_name, base_desc):
+def create_playlists_logic(sp, user_id, genres, all_tracks, base_name, base_desc, limiter=None, on_batch=None):
+    limiter = limiter or RATE_LIMITER
     total_found = len(all_tracks)
     if total_found == 0:
         return []
 
-    links = []
-    
     # Calculate volumes
     total_vols = (total_found // PLAYLIST_LIMIT) + (1 if total_found % PLAYLIST_LIMIT > 0 else 0)
     
+    # 1. Create every volume up front
+    links = []
+    volumes = []
     for i in range(0, total_found, PLAYLIST_LIMIT):
         vol_tracks = all_tracks[i : i + PLAYLIST_LIMIT]
         vol_num = (i // PLAYLIST_LIMIT) + 1
         
-        # Name formatting
-        name = base_name
-        if not name or name.strip() == "":
-            title_genres = ", ".join(genres[:2]).title()
-            if len(genres) > 2: title_genres += " & More"
-            name = f"🎵 {title_genres} Mix"
-            
-        if total_vols > 1: name += f" - Vol. {vol_num}/{total_vols}"
-        
-        desc = base_desc
-        if not desc or desc.strip() == "":
-            desc = f"Generated with {', '.join(genres)}. {len(vol_tracks)} tracks."
-        if total_vols > 1: desc += f" (Part {vol_num}/{total_vols})"
+        name, desc = playlist_details(genres, base_name, base_desc, vol_num, total_vols, len(vol_tracks))
         
         try:
-            # Create
-            playlist = sp.user_playlist_create(user=user_id, name=name, public=True, description=desc)
-            playlist_id = playlist['id']
-            playlist_url = playlist['external_urls']['spotify']
-            links.append({"name": name, "url": playlist_url})
-            
-            # Add Tracks
-            for j in range(0, len(vol_tracks), TRACKS_PER_REQUEST):
-                batch = vol_tracks[j:j + TRACKS_PER_REQUEST]
-                try:
-                    sp.playlist_add_items(playlist_id, batch)
-                    smart_sleep()
-                except Exception as e:
-                    print(f"Error adding batch: {e}")
-                    
+            playlist = limiter.call(sp.user_playlist_create, user=user_id, name=name, public=True, description=desc)
         except Exception as e:
             print(f"Critical error creating playlist: {e}")
             raise e
+        volumes.append((vol_num, playlist['id'], vol_tracks))
+        links.append({"name": name, "url": playlist['external_urls']['spotify']})
+
+    # 2. Fill them concurrently under the shared budget; one thread per volume
+    # keeps the order inside each playlist (100 per call while healthy;
+    # retries, bad URIs isolated)
+    def fill(vol_num, playlist_id, vol_tracks):
+        writer = BatchWriter(sp, limiter, batch_size=TRACKS_PER_REQUEST, log=print)
+        written = 0
+        j = 0
+        while j < len(vol_tracks):
+            batch = vol_tracks[j:j + writer.next_size()]
+            j += len(batch)
+            result = writer.write(playlist_id, batch)
+            written += len(result.written)
+            for uri, error in result.failures:
+                print(f"Failed to add {uri}: {error}")
+            print(f"Vol. {vol_num}/{total_vols}: {written}/{len(vol_tracks)} tracks")
+            if on_batch:
+                on_batch(vol_num, written, len(vol_tracks))
+
+    with ThreadPoolExecutor(max_workers=total_vols, thread_name_prefix="volume") as pool:
+        for future in [pool.submit(fill, *volume) for volume in volumes]:
+            future.result()
             
     return links
 
@@ -272,6 +361,22 @@ def read_root():
 def get_genres():
     return {"genres": sorted(AVAILABLE_GENRES)}
 
+@app.get("/cache")
+def get_cache_stats():
+    return {**SEARCH_CACHE.stats(), "single_flight": SINGLE_FLIGHT.stats()}
+
+@app.get("/catalog")
+def get_catalog_stats():
+    return TRACK_CATALOG.stats()
+
+@app.get("/sessions")
+def get_session_stats():
+    return SPOTIFY_SESSIONS.stats()
+
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/authenticate")
 def authenticate(req: TokenRequest):
     start_time = time.time()
@@ -283,9 +388,9 @@ def authenticate(req: TokenRequest):
         clean_token = clean_token.replace("'", "").replace('"', "").replace("\\", "").strip()
 
         print(f"DEBUG: Authenticating token (len: {len(clean_token)})...")
-        # Set short timeout and no retries for initial auth to respond fast to UI
-        sp = spotipy.Spotify(auth=clean_token, requests_timeout=5, status_retries=0)
-        user = sp.current_user()
+        # No retries for initial auth to respond fast to UI; the pooled client
+        # and profile are reused by the mixes this user starts next
+        user = SPOTIFY_SESSIONS.profile(clean_token)
         
         duration = time.time() - start_time
         print(f"DEBUG: Auth successful for {user['display_name']} in {duration:.2f}s")
@@ -300,31 +405,275 @@ def authenticate(req: TokenRequest):
     except Exception as e:
         duration = time.time() - start_time
         print(f"DEBUG: Auth failed after {duration:.2f}s: {str(e)}")
+        SPOTIFY_SESSIONS.discard(clean_token)
         return handle_spotify_error(e)
 
+def mix_params(req):
+    """The ExecuteRequest fields a resume needs (everything but the token)."""
+    return {"genres": req.genres, "playlist_name": req.playlist_name, "description": req.description,
+            "track_count": req.track_count, "use_catalog": req.use_catalog,
+            "sync_playlist_id": req.sync_playlist_id, "refresh": req.refresh,
+            "only_new_to_me": req.only_new_to_me, "trace": req.trace}
+
+def run_mix(req, job=None, resume=False):
+    """
+    Search + streaming write for one ExecuteRequest. With a `job`, progress
+    (phase, tracks found/written, API calls) and stream events are reported on
+    it, a cancelled job stops at its next batch, and the writes are journaled
+    under the job ID. `resume` continues the journaled mix of that ID.
+    Every run is traced (see tracing.py): jobs keep their trace for
+    GET /jobs/{id}/trace, `req.trace` adds it to the result.
+    """
+    kind = "job" if job else "execute"
+    tracer = Tracer(kind, genres=req.genres, track_count=req.track_count, job_id=job.id if job else None)
+    if job:
+        job.tracer = tracer
+    MIXES_IN_FLIGHT.inc(kind=kind)
+    try:
+        with tracer.root:
+            result = _run_mix(req, job, resume, tracer)
+    finally:
+        MIXES_IN_FLIGHT.dec(kind=kind)
+    if req.trace:
+        result["trace"] = tracer.to_chrome()
+    return result
+
+def _run_mix(req, job, resume, tracer):
+    # Pooled client (429s with their Retry-After reach RATE_LIMITER, see sessions.http_session)
+    sp = SPOTIFY_SESSIONS.client(req.token)
+    on_throttle = (lambda seconds: job.emit("throttled", seconds=round(seconds, 1))) if job else None
+    # Jobs take turns on the shared budget (fair share + shortest remaining work)
+    limiter = RATE_LIMITER.scoped(on_throttle=on_throttle, scheduler=JOBS.scheduler if job else None, owner=job,
+                                  tracer=tracer)
+    if job:
+        job.limiter = limiter
+        job.set_phase("authenticating")
+    user = SPOTIFY_SESSIONS.profile(req.token, limiter)
+    user_id = user['id']
+    # Every run records where its search stopped; refresh runs continue from there
+    playlist_id = playlist_id_from(req.sync_playlist_id) if req.sync_playlist_id else None
+    cursor = SEARCH_CURSORS.cursor(cursor_key(user_id, req.genres, playlist_id))
+    exclude = None
+    if req.only_new_to_me:
+        if job:
+            job.set_phase("reading_library")
+        with tracer.span("library"):
+            exclude = USER_LIBRARIES.filter(sp, limiter, user_id, log=print)
+    if playlist_id:
+        return run_sync(req, sp, limiter, playlist_id, cursor, exclude, job, tracer)
+
+    # 1. Search, streaming into 2. Create: volume 1 is opened and filled
+    # while the search is still running (see pipeline.py)
+    print("Searching and creating (streaming)...")
+    def describe(vol_num, total_vols, count):
+        return playlist_details(req.genres, req.playlist_name, req.description, vol_num, total_vols, count)
+    def on_volume(volume):
+        print(f"Created volume {volume['num']}: {volume['name']}")
+        if job:
+            job.volumes[volume['num']] = {"num": volume['num'], "name": volume['name'], "url": volume['url'],
+                                          "planned": volume['planned'], "written": volume['written']}
+            job.emit("volume_created", volume=volume['num'], name=volume['name'], url=volume['url'])
+    def on_batch(volume):
+        # Volumes fill concurrently: each reports its own progress
+        if job:
+            job.volumes[volume['num']].update(planned=volume['planned'], written=volume['written'])
+            job.emit("batch_written", volume=volume['num'], volume_written=volume['written'],
+                     volume_planned=volume['planned'], written=pipeline.written, failed=pipeline.failed)
+            job.set_written(pipeline.written)
+    pipeline = MixPipeline(
+        sp, user_id, req.track_count, describe, limiter,
+        batch_size=TRACKS_PER_REQUEST,
+        playlist_limit=PLAYLIST_LIMIT,
+        on_volume=on_volume,
+        on_batch=on_batch,
+        log=print,
+        journal=WRITE_JOURNAL.open(job.id, mix_params(req)) if job else None,
+        tracer=tracer,
+    )
+    search_done = False
+    if resume:
+        search_done = pipeline.restore()
+        job.add_found(pipeline.accepted)
+        job.set_written(pipeline.written)
+        print(f"Resuming job {job.id}: {pipeline.written} written, {pipeline.accepted - len(pipeline.tracks)} pending")
+    search_stats = {}
+    def search(feed):
+        if search_done:
+            # The journal holds the final track list: only the writes are left
+            job.set_phase("writing")
+            return
+        if job:
+            job.set_phase("searching")
+            def on_tracks(uris):
+                job.add_found(len(uris))
+                feed(uris)
+            def on_event(event, data):
+                job.emit(event, **data)
+        else:
+            on_tracks, on_event = feed, None
+        search_tracks_logic(sp, req.genres, req.track_count, limiter, search_stats, req.use_catalog,
+                            on_tracks=on_tracks, on_event=on_event, cursor=cursor, refresh=req.refresh,
+                            exclude=exclude, tracer=tracer)
+        if job:
+            job.set_phase("writing")
+    links = pipeline.run(search)
+    tracks = pipeline.tracks
+    cursor.add_delivered(tracks)
+    TRACKS_FOUND.observe(len(tracks))
+    TRACKS_WRITTEN.observe(pipeline.written)
+
+    if not tracks:
+        return {"status": "error", "message": NO_NEW_TRACKS if req.refresh else "No tracks found for these genres."}
+
+    stats = limiter.stats()
+    if pipeline.time_to_first_playlist is not None:  # None when a resume created no volume
+        stats["time_to_first_playlist"] = round(pipeline.time_to_first_playlist, 2)
+    stats["api_calls_per_track"] = round(stats["api_calls"] / len(tracks), 4)
+    print(f"Done: {stats['api_calls']} API calls ({stats['api_calls_per_track']}/track), {stats['throttled_seconds']}s throttled")
+    failures = [{"uri": uri, "error": error} for uri, error in pipeline.failures[:MAX_REPORTED_FAILURES]]
+    return {"status": "success", "links": links, "total_tracks": len(tracks), "failed": pipeline.failed,
+            "failed_tracks": failures, **stats, **search_stats}
+
+def run_sync(req, sp, limiter, playlist_id, cursor, exclude=None, job=None, tracer=None):
+    """
+    Sync mode of run_mix: searches the new track set (one playlist's worth),
+    then updates the existing playlist with only the removals/additions the
+    diff needs (see sync.py). A refresh rotates the new tracks in for the
+    oldest ones instead. Not journaled: running it again finishes it.
+    """
+    tracer = tracer or NULL_TRACER
+    target = min(req.track_count, PLAYLIST_LIMIT)
+    search_stats = {}
+    on_tracks = on_event = None
+    if job:
+        job.set_phase("searching")
+        on_tracks = lambda uris: job.add_found(len(uris))
+        on_event = lambda event, data: job.emit(event, **data)
+    tracks = search_tracks_logic(sp, req.genres, target, limiter, search_stats, req.use_catalog,
+                                 on_tracks=on_tracks, on_event=on_event, cursor=cursor, refresh=req.refresh,
+                                 exclude=exclude, tracer=tracer)
+    TRACKS_FOUND.observe(len(tracks))
+    if not tracks:
+        return {"status": "error", "message": NO_NEW_TRACKS if req.refresh else "No tracks found for these genres."}
+
+    def on_progress(result):
+        if job:
+            job.emit("sync_progress", removed=result.removed, added=result.added, failed=len(result.failures))
+            job.set_written(result.added)
+    if job:
+        job.set_phase("syncing")
+    print(f"Syncing {len(tracks)} tracks into playlist {playlist_id}...")
+    with tracer.span("sync", playlist_id=playlist_id) as span:
+        result = sync_playlist(sp, limiter, playlist_id, tracks, batch_size=TRACKS_PER_REQUEST,
+                               store=SYNC_STORE, rotate_limit=PLAYLIST_LIMIT if req.refresh else None,
+                               log=print, on_progress=on_progress)
+        span.set(**result.to_dict())
+    cursor.add_delivered(tracks)
+    TRACKS_WRITTEN.observe(result.added)
+    playlist = limiter.call(sp.playlist, playlist_id, fields="name,external_urls")
+
+    stats = limiter.stats()
+    stats["api_calls_per_track"] = round(stats["api_calls"] / len(tracks), 4)
+    print(f"Synced: {result.kept} kept, {result.removed} removed, {result.added} added ({result.calls} calls)")
+    failures = [{"uri": uri, "error": error} for uri, error in result.failures[:MAX_REPORTED_FAILURES]]
+    return {"status": "success", "links": [{"name": playlist['name'], "url": playlist['external_urls']['spotify']}],
+            "total_tracks": len(tracks), "failed_tracks": failures, **result.to_dict(), **stats, **search_stats}
+
+def run_job(req, resume=False):
+    def run(job):
+        try:
+            return run_mix(req, job, resume)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            return handle_spotify_error(e)
+    return run
+
 @app.post("/execute")
 def execute(req: ExecuteRequest):
     try:
-        sp = spotipy.Spotify(auth=req.token, requests_timeout=10, status_retries=0)
-        user = sp.current_user()
-        user_id = user['id']
-        
-        # 1. Search
-        print("Step 1: Searching...")
-        tracks = search_tracks_logic(sp, req.genres, req.track_count)
-        
-        if not tracks:
-            return {"status": "error", "message": "No tracks found for these genres."}
-            
-        # 2. Create
-        print("Step 2: Creating...")
-        links = create_playlists_logic(sp, user_id, req.genres, tracks, req.playlist_name, req.description)
-        
-        return {"status": "success", "links": links, "total_tracks": len(tracks)}
-        
+        return run_mix(req)
     except Exception as e:
         return handle_spotify_error(e)
 
+# Long mixes: returns a job ID at once, the mix runs on JOBS' worker pool
+@app.post("/jobs")
+def create_job(req: ExecuteRequest):
+    job = JOBS.submit(run_job(req), req.track_count, user=token_key(req.token))
+    return JOBS.status(job)
+
+# Continues an interrupted job (crash, redeploy, expired token) from its journal
+@app.post("/jobs/{job_id}/resume")
+def resume_job(job_id: str, req: TokenRequest):
+    journal = WRITE_JOURNAL.load(job_id)
+    if not journal:
+        raise HTTPException(status_code=404, detail="No journal for this job")
+    job = JOBS.get(job_id)
+    if job and job.status in ("queued", "running"):
+        raise HTTPException(status_code=409, detail="Job is still running")
+    if journal.status == "done":
+        return {"status": "success", "job_id": job_id, "message": "Mix already complete.", **journal.counts()}
+    mix = ExecuteRequest(token=req.token, **journal.params)
+    job = JOBS.submit(run_job(mix, resume=True), mix.track_count, user=token_key(req.token), job_id=job_id)
+    return JOBS.status(job)
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = JOBS.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JOBS.status(job)
+
+# Span timeline of a job: Chrome trace-event JSON (open in Perfetto) or ?format=tree
+@app.get("/jobs/{job_id}/trace")
+def get_job_trace(job_id: str, format: str = "chrome"):
+    job = JOBS.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not job.tracer:
+        raise HTTPException(status_code=404, detail="Job has not started yet")
+    return job.tracer.to_tree() if format == "tree" else job.tracer.to_chrome()
+
+async def job_event_stream(job, after=0):
+    """
+    Server-Sent Events for `job`, from seq `after` until its "done" event.
+    Polls without blocking, so an open stream doesn't hold a threadpool thread.
+    """
+    quiet = 0.0
+    while True:
+        finished = job.finished  # Read first: Job.finish() emits "done" before it returns
+        events = job.wait_events(after, timeout=0)
+        if not events:
+            if finished:
+                return
+            if quiet >= SSE_KEEPALIVE_SECONDS:
+                quiet = 0.0
+                yield ": keepalive\n\n"
+            await asyncio.sleep(SSE_POLL_SECONDS)
+            quiet += SSE_POLL_SECONDS
+            continue
+        quiet = 0.0
+        for event in events:
+            yield f"id: {event['seq']}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+            after = event['seq']
+
+# Live progress: EventSource reconnects resume from the Last-Event-ID header
+@app.get("/jobs/{job_id}/events")
+def stream_job_events(job_id: str, last_event_id: Optional[str] = Header(None)):
+    job = JOBS.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    after = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+    return StreamingResponse(job_event_stream(job, after), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = JOBS.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JOBS.status(job)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
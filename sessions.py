@@ -0,0 +1,150 @@
+"""
+Pooled Spotify clients, keyed by a hash of the access token.
+
+Each spotipy client owns a keep-alive requests.Session, so reusing it across
+/authenticate, /execute and /jobs calls from the same user skips the TCP/TLS
+handshake; the /me profile is cached for `profile_ttl` seconds so repeat
+requests skip that round trip too. Idle sessions are evicted LRU-first.
+Raw tokens are never stored as keys.
+
+Every entry point builds its clients through `spotify_client()`, which points
+them at SPOTIFY_API_BASE when it is set (e.g. the local stand-in,
+`python fake_spotify.py` -> http://127.0.0.1:8900/v1/) and gives them an
+HTTP session without status retries (see http_session()). The pool's
+`instrument` hook wraps each new client (the server's metrics proxy, see
+metrics.py).
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+import spotipy
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+SESSION_MAX = int(os.getenv("SESSION_MAX", 256))
+SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", 1800))  # Seconds unused before eviction
+PROFILE_TTL = int(os.getenv("PROFILE_TTL", 300))             # Seconds a cached /me stays valid
+CONNECT_RETRIES = 3  # Connection failures only: the request never reached Spotify
+
+
+def http_session():
+    """
+    A requests.Session that hands every 429/5xx to the caller as it came.
+    spotipy's own session retries them inside urllib3 (status_retries=0 does
+    not turn that off) and then raises a header-less SpotifyException(429, -1):
+    Retry-After is lost and a 503 looks like a rate limit. Statuses are left
+    to rate_limiter (429 + Retry-After) and batch_writer (5xx).
+    """
+    session = requests.Session()
+    # urllib3 retries a 429/503 carrying Retry-After even without a status_forcelist
+    retry = Retry(total=CONNECT_RETRIES, read=0, status=0, backoff_factor=0.3,
+                  respect_retry_after_header=False, raise_on_status=False)
+    adapter = HTTPAdapter(max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def spotify_client(**kwargs):
+    """
+    spotipy.Spotify(**kwargs) on an http_session(), aimed at SPOTIFY_API_BASE
+    instead of api.spotify.com when set.
+    """
+    kwargs.setdefault("requests_session", http_session())
+    client = spotipy.Spotify(**kwargs)
+    base = os.getenv("SPOTIFY_API_BASE")
+    if base:
+        client.prefix = base.rstrip("/") + "/"
+    return client
+
+
+def token_key(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class _Session:
+    def __init__(self, client):
+        self.client = client
+        self.profile = None
+        self.profile_time = 0.0
+        self.used = time.monotonic()
+
+
+class SpotifySessionPool:
+    def __init__(self, max_sessions=SESSION_MAX, idle_ttl=SESSION_IDLE_TTL,
+                 profile_ttl=PROFILE_TTL, requests_timeout=10, instrument=None):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.profile_ttl = profile_ttl
+        self.requests_timeout = requests_timeout
+        self.instrument = instrument
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.profile_hits = 0
+        self.evictions = 0
+
+    def _session(self, token):
+        key = token_key(token)
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(key)
+            if session:
+                self._sessions.move_to_end(key)
+                self.hits += 1
+            else:
+                # 429s are waited out by the rate limiter (see http_session)
+                client = spotify_client(auth=token, requests_timeout=self.requests_timeout)
+                if self.instrument:
+                    client = self.instrument(client)
+                session = self._sessions[key] = _Session(client)
+                self.misses += 1
+            session.used = now
+            self._evict(now)
+        return session
+
+    def _evict(self, now):
+        while self._sessions:
+            key, oldest = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - oldest.used < self.idle_ttl:
+                break
+            del self._sessions[key]
+            self.evictions += 1
+
+    def client(self, token):
+        """The pooled spotipy client for `token` (created on first use)."""
+        return self._session(token).client
+
+    def profile(self, token, limiter=None):
+        """
+        The /me profile for `token`, cached for profile_ttl seconds. With a
+        `limiter` the lookup (on a miss) goes through it.
+        """
+        session = self._session(token)
+        if session.profile and time.monotonic() - session.profile_time < self.profile_ttl:
+            self.profile_hits += 1
+            return session.profile
+        fetch = session.client.current_user
+        profile = limiter.call(fetch) if limiter else fetch()
+        session.profile, session.profile_time = profile, time.monotonic()
+        return profile
+
+    def discard(self, token):
+        """Drops the session of a token Spotify rejected (e.g. expired)."""
+        with self._lock:
+            self._sessions.pop(token_key(token), None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "hits": self.hits,
+                "misses": self.misses,
+                "profile_hits": self.profile_hits,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,68 @@
+"""
+Single-flight coalescing of identical in-flight reads.
+
+Genre popularity is skewed: during peaks several jobs page the same
+`genre:"phonk"` term at the same offsets at the same time. The first caller
+for a key makes the upstream call; callers arriving while it is in flight
+wait for it and share its result instead of spending their own token. Only
+successes are shared: keys carry no token, so a leader's error (a 401 for
+its token, a 429 on its budget) may not apply to the waiters, and each of
+them then makes its own call. Only concurrent calls are merged; anything
+later is served by the search cache.
+"""
+import threading
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.upstream = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """
+        Runs `fn()` once for all concurrent callers of `key`. Returns
+        (result, shared): shared is True when another caller made the call.
+        If that call failed, the waiter runs its own `fn()` instead.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.upstream += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is None:
+                return flight.result, True
+            with self._lock:
+                self.coalesced -= 1
+                self.upstream += 1
+            return fn(), False
+
+        try:
+            flight.result = fn()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+    def stats(self):
+        with self._lock:
+            return {"upstream_calls": self.upstream, "calls_saved": self.coalesced,
+                    "in_flight": len(self._flights)}
@@ -7,18 +7,34 @@ Autor: Antigravity AI
 import os
 import sys
 import time
+import argparse
+import json
+import uuid
 import random
 from datetime import datetime
 from dotenv import load_dotenv
 
 try:
-    import spotipy
     from spotipy.oauth2 import SpotifyOAuth
 except ImportError:
     print("❌ Biblioteca spotipy não encontrada.")
     print("Execute: pip install spotipy python-dotenv")
     sys.exit(1)
 
+from search_engine import SearchEngine, broad_genre_terms
+from query_planner import sharded
+from rate_limiter import AdaptiveRateLimiter
+from search_cache import SearchCache, slim_track
+from catalog import TrackCatalog
+from yield_stats import TermYieldStore
+from pipeline import MixPipeline
+from sync import SyncStore, sync_playlist, playlist_id_from
+from cursors import CursorStore, cursor_key
+from library import LibraryStore
+from journal import WriteJournal
+from sessions import spotify_client
+from tracing import Tracer, NULL_TRACER
+
 # Carregar variáveis de ambiente
 load_dotenv()
 
@@ -27,8 +43,10 @@ MAX_TRACKS = 100000        # Aumentado para 100k (via múltiplos volumes)
 PLAYLIST_LIMIT = 10000     # Limite máximo do Spotify por playlist
 TRACKS_PER_REQUEST = 50    # Reduzido de 100 para 50 para ser mais seguro
 SEARCH_LIMIT = 20          # Reduzido de 50 para 20
-SAFE_MODE_DELAY_MIN = 3
-SAFE_MODE_DELAY_MAX = 5
+RATE_LIMIT_START = 1.0     # Chamadas/s no início (sobe enquanto não houver 429)
+RATE_LIMIT_MIN = 0.2       # Piso após 429 repetidos
+RATE_LIMIT_MAX = 5.0       # Teto do modo seguro
+SEARCH_WORKERS = 4         # Buscas simultâneas (gêneros/páginas)
 
 # Lista de gêneros disponíveis no Spotify
 AVAILABLE_GENRES = [
@@ -54,16 +72,30 @@ AVAILABLE_GENRES = [
 ]
 
 class SpotifyPlaylistFiller:
-    def __init__(self):
+    def __init__(self, use_catalog=True, only_new=False, trace=False):
         self.sp = None
         self.user_id = None
-
-    def smart_sleep(self):
-        """Pausa inteligente para evitar bloqueios"""
-        delay = random.uniform(SAFE_MODE_DELAY_MIN, SAFE_MODE_DELAY_MAX)
-        print(f"   ⏳ Aguardando {delay:.1f}s...", end="\r")
-        time.sleep(delay)
-        print(" " * 20, end="\r") # Limpa a linha
+        self.use_catalog = use_catalog
+        self.only_new = only_new
+        # Linha do tempo (--trace): gênero → termo → página → espera, volume → lote
+        self.tracer = Tracer("spotify_filler") if trace else NULL_TRACER
+        # Limitador adaptativo (429/Retry-After) compartilhado por todas as chamadas
+        self.limiter = AdaptiveRateLimiter(rate=RATE_LIMIT_START, min_rate=RATE_LIMIT_MIN, max_rate=RATE_LIMIT_MAX,
+                                           tracer=self.tracer)
+        # Cache local das buscas (TTL + LRU): gêneros repetidos não gastam chamadas
+        self.cache = SearchCache()
+        # Catálogo local: toda música vista fica indexada para os próximos mixes
+        self.catalog = TrackCatalog()
+        # Histórico de rendimento por termo: termos produtivos são tentados primeiro
+        self.term_yields = TermYieldStore()
+        # Journal das gravações: mixes interrompidos podem ser retomados (--resume)
+        self.journal = WriteJournal()
+        # Conteúdo deixado por cada sincronização (--sync): playlists sem mudanças não são relidas
+        self.sync_store = SyncStore()
+        # Cursores de busca por mix: --refresh só busca material novo
+        self.cursors = CursorStore()
+        # Filtro (Bloom) da biblioteca do usuário: --only-new pula músicas que ele já tem
+        self.library = LibraryStore()
     
     def authenticate(self):
         """Autentica o usuário no Spotify"""
@@ -78,14 +110,14 @@ class SpotifyPlaylistFiller:
         if client_id and client_secret and client_id != "your_client_id_here":
             scope = "playlist-modify-public playlist-modify-private playlist-read-private user-library-read"
             try:
-                self.sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
+                self.sp = spotify_client(auth_manager=SpotifyOAuth(
                     client_id=client_id,
                     client_secret=client_secret,
                     redirect_uri=redirect_uri,
                     scope=scope,
                     cache_path=".spotify_cache"
-                ))
-                user_info = self.sp.current_user()
+                ))  # 429/Retry-After tratado pelo self.limiter
+                user_info = self.limiter.call(self.sp.current_user)
                 self.user_id = user_info['id']
                 print(f"✅ Autenticado via App como: {user_info['display_name']} ({self.user_id})")
                 return True
@@ -117,8 +149,8 @@ class SpotifyPlaylistFiller:
         
         if len(token) > 10:
             try:
-                self.sp = spotipy.Spotify(auth=token)
-                user_info = self.sp.current_user()
+                self.sp = spotify_client(auth=token)  # 429/Retry-After tratado pelo self.limiter
+                user_info = self.limiter.call(self.sp.current_user)
                 self.user_id = user_info['id']
                 print(f"✅ Autenticado via Token como: {user_info['display_name']} ({self.user_id})")
                 return True
@@ -181,89 +213,96 @@ class SpotifyPlaylistFiller:
             except ValueError:
                 print("❌ Digite um número válido")
 
-    def search_tracks_by_keywords(self, genres_list, target_count):
-        """Busca músicas por uma lista de gêneros/tags"""
-        track_uris = set()
+    def cached_playlist_ids(self, genre):
+        """IDs das playlists encontradas para o gênero (via cache quando possível)"""
+        def load():
+            results = self.limiter.call(self.sp.search, q=genre, type='playlist', limit=5) # Limite reduzido
+            return [p['id'] for p in results.get('playlists', {}).get('items', []) if p and p.get('id')]
+        playlist_ids, _ = self.cache.fetch('playlist_search', genre, 0, 5, None, load)
+        return playlist_ids
+
+    def cached_playlist_tracks(self, playlist_id):
+        """Primeiras músicas de uma playlist (via cache quando possível)"""
+        def load():
+            # Reduzido para pegar menos músicas por playlist (mais variedade, menos chance de erro)
+            results = self.limiter.call(self.sp.playlist_tracks, playlist_id, limit=30)
+            return [slim_track(item['track']) for item in results.get('items', []) if item.get('track')]
+        tracks, _ = self.cache.fetch('playlist_tracks', playlist_id, 0, 30, None, load)
+        return tracks
+
+    def search_tracks_by_keywords(self, genres_list, target_count, on_tracks=None, cursor=None, refresh=False):
+        """
+        Busca músicas por uma lista de gêneros/tags (on_tracks recebe as novas assim que aparecem).
+        Com refresh, só músicas que o mix (cursor) ainda não entregou.
+        """
         tracks_per_genre = int(target_count / len(genres_list)) + 1
         
         print(f"\n🔍 Buscando músicas para: {', '.join(genres_list)}")
         print(f"   (Aproximadamente {tracks_per_genre} músicas por estilo)")
-        print(f"   🛡️ MODO SEGURO ATIVADO: Buscas mais lentas para evitar bloqueios.\n")
+        print(f"   🛡️ MODO SEGURO ATIVADO: O ritmo se ajusta aos limites do Spotify (429/Retry-After).\n")
 
-        for genre in genres_list:
-            print(f"\n👉 Processando gênero: '{genre}'...")
-            
-            genre_tracks = set()
-            
-            # Estratégia 1: Recomendações (Apenas se for gênero oficial)
-            if genre in AVAILABLE_GENRES:
-                print("   📡 Obtendo recomendações oficiais...")
-                try:
-                    results = self.sp.recommendations(seed_genres=[genre], limit=TRACKS_PER_REQUEST, min_popularity=0)
-                    for track in results.get('tracks', []):
-                        if track.get('uri'): genre_tracks.add(track['uri'])
-                    print(f"     → {len(genre_tracks)} encontradas via recomendações")
-                    self.smart_sleep()
-                except Exception: pass
-            
-            # Estratégia 2: Busca por nome/tag
-            print("   🔎 Buscando por termo/tag...")
-            search_terms = [
-                f"genre:\"{genre}\"",  # Busca exata no gênero
-                f"tag:{genre}",
-                f"{genre} playlist",
-                f"{genre} mix",
-                genre
-            ]
-            
-            for term in search_terms:
-                if len(genre_tracks) >= tracks_per_genre: break
-                
-                offset = 0
-                # Limite menor por termo para variar mais
-                while offset < 100 and len(genre_tracks) < tracks_per_genre:
-                    try:
-                        results = self.sp.search(q=term, type='track', limit=SEARCH_LIMIT, offset=offset)
-                        items = results.get('tracks', {}).get('items', [])
-                        if not items: break
-                        
-                        for track in items:
-                            if track.get('uri'): genre_tracks.add(track['uri'])
-                            
-                        offset += SEARCH_LIMIT
-                        self.smart_sleep()
-                    except Exception as e: 
-                        print(f"     ⚠️ Erro na busca '{term}': {e}")
-                        break
-            
-            print(f"   ✅ Total para '{genre}': {len(genre_tracks)} músicas")
-            track_uris.update(genre_tracks)
-            self.smart_sleep()
+        # Modo "só novidades para mim": músicas salvas e das playlists do usuário não contam
+        owned = None
+        if self.only_new:
+            print("   📚 Lendo sua biblioteca (músicas salvas e playlists)...")
+            with self.tracer.span("library"):
+                owned = self.library.filter(self.sp, self.limiter, self.user_id,
+                                            log=lambda message: print(f"     • {message}"))
+
+        # Estratégias 1 e 2: Recomendações (gêneros oficiais) + busca por termo/tag,
+        # com gêneros e páginas processados em paralelo sob um único orçamento de chamadas
+        def genre_done(genre, count):
+            print(f"   ✅ Total para '{genre}': {count} músicas")
+
+        engine = SearchEngine(
+            self.sp,
+            limiter=self.limiter,
+            max_workers=SEARCH_WORKERS,
+            search_limit=SEARCH_LIMIT,
+            max_offset=100,  # Limite menor por termo para variar mais
+            rec_quota=TRACKS_PER_REQUEST,
+            seed_genres=AVAILABLE_GENRES,
+            terms=sharded(broad_genre_terms),  # + fatias year:/tag: para mixes grandes
+            on_genre_done=genre_done,
+            log=lambda message: print(f"     ⚠️ {message}"),
+            cache=self.cache,
+            catalog=self.catalog,
+            catalog_first=self.use_catalog,
+            yield_store=self.term_yields,
+            on_tracks=on_tracks,
+            cursor=cursor,
+            refresh=refresh,
+            exclude=owned,
+            tracer=self.tracer,
+        )
+        track_uris = set(engine.search(genres_list, target_count))
+        if engine.stats['skipped_delivered']:
+            print(f"   ♻️ {engine.stats['skipped_delivered']} músicas já entregues por este mix foram ignoradas")
+        if engine.stats['skipped_owned']:
+            print(f"   📚 {engine.stats['skipped_owned']} músicas que você já tem foram ignoradas")
+        if engine.stats['catalog_tracks']:
+            print(f"   📚 {engine.stats['catalog_tracks']} músicas vieram do catálogo local")
 
-        
         # Estratégia 3: Buscar playlists do gênero e extrair músicas (Iterar por todos os gêneros)
         print("  📋 Buscando em playlists de usuários...")
         
+        delivered = cursor.delivered if (cursor and refresh) else ()
         for genre in genres_list:
             if len(track_uris) >= target_count: break
             
             try:
-                playlist_results = self.sp.search(q=genre, type='playlist', limit=5) # Limite reduzido
-                self.smart_sleep()
-                
-                for playlist in playlist_results.get('playlists', {}).get('items', []):
+                for playlist_id in self.cached_playlist_ids(genre):
                     if len(track_uris) >= target_count: break
-                    if playlist and playlist.get('id'):
-                        try:
-                            # Reduzido para pegar menos músicas por playlist (mais variedade, menos chance de erro)
-                            playlist_tracks = self.sp.playlist_tracks(playlist['id'], limit=30)
-                            for item in playlist_tracks.get('items', []):
-                                track = item.get('track')
-                                if track and track.get('uri') and not track['uri'].startswith('spotify:local:'):
-                                    track_uris.add(track['uri'])
-                            
-                            self.smart_sleep()
-                        except Exception: continue
+                    try:
+                        fresh = []
+                        for track in self.cached_playlist_tracks(playlist_id):
+                            uri = track.get('uri')
+                            if uri and not uri.startswith('spotify:local:') and uri not in track_uris \
+                                    and uri not in delivered and (owned is None or uri not in owned):
+                                track_uris.add(uri)
+                                fresh.append(uri)
+                        if fresh and on_tracks: on_tracks(fresh)
+                    except Exception: continue
             except Exception: pass
         
         print(f"\n✅ Total de músicas únicas encontradas: {len(track_uris)}")
@@ -274,9 +313,9 @@ class SpotifyPlaylistFiller:
         
         return track_list[:target_count]
     
-    def create_playlist(self, genres_list, track_count, vol_num=1, total_vols=1):
-        """Cria uma nova playlist (com suporte a volumes)"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
+    def playlist_details(self, genres_list, track_count, vol_num=1, total_vols=1, timestamp=None):
+        """Nome e descrição de um volume"""
+        timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M")
         
         # Nome da playlist baseado nos primeiros gêneros
         title_genres = ", ".join(genres_list[:2]).title()
@@ -290,59 +329,151 @@ class SpotifyPlaylistFiller:
         description = f"Super Mix gerado com: {', '.join(genres_list)}. {track_count} músicas. Criado em {timestamp}."
         if total_vols > 1:
             description += f" (Parte {vol_num} de {total_vols})"
+        return name, description
+    
+    def run_mix(self, genres, track_count, timestamp, journal, resume=False, refresh=False):
+        """Busca e grava um mix (registrado no journal) e mostra o resumo"""
+        start_time = time.time()
+        cursor = self.cursors.cursor(cursor_key(self.user_id, genres))
+        
+        def on_volume(volume):
+            print(f"\n💿 Volume {volume['num']} criado: '{volume['name']}'")
+            print(f"   🔗 Link do Vol. {volume['num']}: {volume['url']}")
+        
+        def on_batch(volume):
+            print(f"   📥 Vol. {volume['num']}: {volume['written']} músicas adicionadas")
+        
+        pipeline = MixPipeline(
+            self.sp, self.user_id, track_count,
+            lambda vol_num, vols, count: self.playlist_details(genres, count, vol_num, vols, timestamp),
+            self.limiter,
+            batch_size=TRACKS_PER_REQUEST,
+            playlist_limit=PLAYLIST_LIMIT,
+            on_volume=on_volume,
+            on_batch=on_batch,
+            log=lambda message: print(f"  ⚠️ {message}"),
+            journal=journal,
+            tracer=self.tracer,
+        )
+        search_done = False
+        if resume:
+            search_done = pipeline.restore()
+            print(f"\n♻️  Retomando: {pipeline.written} músicas já gravadas, "
+                  f"{pipeline.accepted - len(pipeline.tracks)} pendentes")
+        
+        def search(feed):
+            # Com a lista final no journal, só faltam as gravações
+            if not search_done:
+                self.search_tracks_by_keywords(genres, track_count, on_tracks=feed, cursor=cursor, refresh=refresh)
         
         try:
-            playlist = self.sp.user_playlist_create(
-                user=self.user_id,
-                name=name,
-                public=True,
-                description=description
-            )
-            
-            print(f"\n✅ Playlist criada: '{name}'")
-            return playlist['id'], playlist['external_urls']['spotify']
-            
+            with self.tracer.span("mix", lane="mix", mix_id=journal.id, genres=genres, track_count=track_count):
+                pipeline.run(search)
         except Exception as e:
             print(f"❌ Erro ao criar playlist: {e}")
-            return None, None
-    
-    def add_tracks_to_playlist(self, playlist_id, track_uris):
-        """Adiciona músicas à playlist em lotes"""
-        print(f"\n📥 Adicionando {len(track_uris)} músicas à playlist...")
+            print(f"   Retome com: python spotify_filler.py --resume {journal.id}")
+            return
         
-        added = 0
-        failed = 0
+        total_found = len(pipeline.tracks)
+        if not total_found:
+            print("❌ Nenhuma música nova encontrada." if refresh else "❌ Nenhuma música encontrada.")
+            return
+        cursor.add_delivered(pipeline.tracks)
+        total_vols = len(pipeline.volumes)
         
-        # Adicionar em lotes de 100 (limite da API)
-        for i in range(0, len(track_uris), TRACKS_PER_REQUEST):
-            batch = track_uris[i:i + TRACKS_PER_REQUEST]
-            
-            try:
-                self.sp.playlist_add_items(playlist_id, batch)
-                added += len(batch)
-                
-                # Mostrar progresso
-                progress = (added / len(track_uris)) * 100
-                bar_length = 30
-                filled = int(bar_length * added / len(track_uris))
-                bar = "█" * filled + "░" * (bar_length - filled)
-                
-                print(f"\r  [{bar}] {progress:.1f}% ({added}/{len(track_uris)})", end="", flush=True)
-                
-                self.smart_sleep()
-                
-            except Exception as e:
-                failed += len(batch)
-                print(f"\n  ⚠️ Erro ao adicionar lote: {e}")
+        # Resumo final
+        elapsed = time.time() - start_time
+        print("\n" + "=" * 60)
+        print("  ✅ COLEÇÃO CONCLUÍDA!")
+        print("=" * 60)
+        print(f"  • Total adicionado: {pipeline.written} músicas")
+        if pipeline.failed > 0:
+            print(f"  • Falhas: {pipeline.failed} músicas")
+            for uri, error in pipeline.failures[:10]:
+                print(f"    • {uri}: {error}")
+        print(f"  • Volumes criados: {total_vols}")
+        for link in pipeline.links:
+            print(f"    🔗 {link['name']}: {link['url']}")
+        print(f"  • Tempo total: {elapsed:.1f} segundos")
+        if pipeline.time_to_first_playlist is not None:
+            print(f"  • Primeira playlist criada em: {pipeline.time_to_first_playlist:.1f} segundos")
+        stats = self.limiter.stats()
+        print(f"  • Chamadas à API: {stats['api_calls']} ({stats['throttled_seconds']:.1f}s em espera, {stats['throttle_events']} bloqueios 429)")
+        print(f"  • Chamadas por música entregue: {stats['api_calls'] / total_found:.3f}")
+        cache_stats = self.cache.stats()
+        print(f"  • Cache de buscas: {cache_stats['hits']} acertos / {cache_stats['misses']} falhas")
+        print("=" * 60)
+    
+    def sync_mix(self, genres, track_count, playlist_id, refresh=False):
+        """
+        Atualiza uma playlist existente só com as remoções/adições necessárias
+        (com refresh, as músicas novas entram no lugar das mais antigas)
+        """
+        start_time = time.time()
+        track_count = min(track_count, PLAYLIST_LIMIT)
+        cursor = self.cursors.cursor(cursor_key(self.user_id, genres, playlist_id))
+        with self.tracer.span("search", lane="sync", genres=genres, track_count=track_count):
+            tracks = self.search_tracks_by_keywords(genres, track_count, cursor=cursor, refresh=refresh)
+        if not tracks:
+            print("❌ Nenhuma música nova encontrada." if refresh else "❌ Nenhuma música encontrada.")
+            return
         
-        print(f"\n\n✅ Adicionadas: {added} músicas")
-        if failed > 0:
-            print(f"⚠️ Falhas: {failed} músicas")
+        print(f"\n🔄 Sincronizando {len(tracks)} músicas com a playlist {playlist_id}...")
+        try:
+            with self.tracer.span("sync", lane="sync", playlist_id=playlist_id):
+                result = sync_playlist(self.sp, self.limiter, playlist_id, tracks, batch_size=TRACKS_PER_REQUEST,
+                                       store=self.sync_store, rotate_limit=PLAYLIST_LIMIT if refresh else None,
+                                       log=lambda message: print(f"  • {message}"))
+        except Exception as e:
+            print(f"❌ Erro ao sincronizar playlist: {e}")
+            print("   Rode o mesmo comando de novo para terminar a sincronização.")
+            return
+        cursor.add_delivered(tracks)
         
-        return added
+        elapsed = time.time() - start_time
+        print("\n" + "=" * 60)
+        print("  ✅ PLAYLIST SINCRONIZADA!")
+        print("=" * 60)
+        print(f"  • Mantidas: {result.kept} músicas")
+        print(f"  • Removidas: {result.removed} músicas")
+        print(f"  • Adicionadas: {result.added} músicas")
+        if result.failures:
+            print(f"  • Falhas: {len(result.failures)} músicas")
+            for uri, error in result.failures[:10]:
+                print(f"    • {uri}: {error}")
+        print(f"  • Chamadas da sincronização: {result.calls}")
+        print(f"  • Tempo total: {elapsed:.1f} segundos")
+        stats = self.limiter.stats()
+        print(f"  • Chamadas à API: {stats['api_calls']} ({stats['throttled_seconds']:.1f}s em espera, {stats['throttle_events']} bloqueios 429)")
+        print("=" * 60)
     
-    def run(self):
-        """Executa o programa principal"""
+    def save_trace(self, path):
+        """Grava a linha do tempo da sessão no formato Chrome trace (abra no Perfetto)"""
+        self.tracer.root.finish()
+        with open(path, "w") as f:
+            json.dump(self.tracer.to_chrome(), f)
+        print(f"\n🧭 Trace gravado em {path} (abra em https://ui.perfetto.dev)")
+    
+    def resume(self, mix_id):
+        """Retoma um mix interrompido a partir do journal"""
+        journal = self.journal.load(mix_id)
+        if not journal:
+            print(f"❌ Mix '{mix_id}' não encontrado no journal.")
+            return
+        if journal.status == "done":
+            print(f"✅ O mix '{mix_id}' já foi concluído.")
+            return
+        if not self.authenticate():
+            return
+        params = journal.params
+        self.run_mix(params['genres'], params['track_count'], params['timestamp'], journal, resume=True,
+                     refresh=params.get('refresh', False))
+    
+    def run(self, sync_playlist_id=None, refresh=False):
+        """
+        Executa o programa principal (com sync_playlist_id, atualiza essa
+        playlist em vez de criar novas; com refresh, só músicas novas)
+        """
         print("=" * 60)
         print("  🎵 SPOTIFY MEGA MIXER")
         print("  Crie coleções gigantes (nós dividimos em volumes para você!)")
@@ -363,9 +494,16 @@ class SpotifyPlaylistFiller:
             print(f"  • Estilos: {', '.join(genres)}")
             print(f"  • Músicas Totais: {track_count}")
             
+            if sync_playlist_id:
+                if track_count > PLAYLIST_LIMIT:
+                    print(f"  • Sincronização: limitado a {PLAYLIST_LIMIT} músicas (uma playlist)")
+                print(f"  • Playlist a sincronizar: {sync_playlist_id}")
+            if refresh:
+                print("  • Modo refresh: só músicas que este mix ainda não entregou")
+            
             # Calcular volumes
             total_vols = (track_count // PLAYLIST_LIMIT) + (1 if track_count % PLAYLIST_LIMIT > 0 else 0)
-            if total_vols > 1:
+            if total_vols > 1 and not sync_playlist_id:
                 print(f"  • Volumes necessários: {total_vols} playlists")
             
             confirm = input("\n🚀 Confirmar e iniciar? (s/n): ").strip().lower()
@@ -373,42 +511,17 @@ class SpotifyPlaylistFiller:
                 print("❌ Operação cancelada")
                 continue
             
-            # Buscar músicas (Busca única para garantir variedade global)
-            start_time = time.time()
-            all_tracks = self.search_tracks_by_keywords(genres, track_count)
-            
-            if not all_tracks:
-                print("❌ Nenhuma música encontrada.")
-                continue
-            
-            total_found = len(all_tracks)
-            
-            # Dividir em volumes de 10.000
-            for i in range(0, total_found, PLAYLIST_LIMIT):
-                vol_tracks = all_tracks[i : i + PLAYLIST_LIMIT]
-                vol_num = (i // PLAYLIST_LIMIT) + 1
-                
-                print(f"\n💿 Processando Volume {vol_num}/{total_vols} ({len(vol_tracks)} músicas)...")
-                
-                # Criar playlist do volume atual
-                playlist_id, playlist_url = self.create_playlist(genres, len(vol_tracks), vol_num, total_vols)
-                
-                if not playlist_id:
-                    continue
-                
-                # Adicionar músicas
-                self.add_tracks_to_playlist(playlist_id, vol_tracks)
-                print(f"   🔗 Link do Vol. {vol_num}: {playlist_url}")
-            
-            # Resumo final
-            elapsed = time.time() - start_time
-            print("\n" + "=" * 60)
-            print("  ✅ COLEÇÃO CONCLUÍDA!")
-            print("=" * 60)
-            print(f"  • Total adicionado: {total_found} músicas")
-            print(f"  • Volumes criados: {total_vols}")
-            print(f"  • Tempo total: {elapsed:.1f} segundos")
-            print("=" * 60)
+            if sync_playlist_id:
+                self.sync_mix(genres, track_count, sync_playlist_id, refresh)
+            else:
+                # Buscar e gravar ao mesmo tempo: o Volume 1 é criado e preenchido
+                # enquanto a busca continua (embaralhado em janelas, ver pipeline.py)
+                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
+                journal = self.journal.open(uuid.uuid4().hex[:12], {
+                    "genres": genres, "track_count": track_count, "timestamp": timestamp, "refresh": refresh,
+                })
+                print(f"\n🧾 ID do mix: {journal.id} (se for interrompido, retome com --resume {journal.id})")
+                self.run_mix(genres, track_count, timestamp, journal, refresh=refresh)
             
             # Continuar?
             again = input("\n🔄 Criar outra coleção? (s/n): ").strip().lower()
@@ -417,6 +530,37 @@ class SpotifyPlaylistFiller:
                 break
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Spotify Mega Mixer (CLI)")
+    parser.add_argument("--no-catalog", action="store_true",
+                        help="Ignora o catálogo local e busca tudo direto no Spotify")
+    parser.add_argument("--resume", metavar="MIX_ID",
+                        help="Retoma um mix interrompido (a partir do primeiro lote não gravado)")
+    parser.add_argument("--sync", metavar="PLAYLIST",
+                        help="Atualiza uma playlist existente (ID ou link) com só as mudanças necessárias, "
+                             "em vez de criar playlists novas")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Só músicas que este mix ainda não entregou (novidades e páginas ainda não visitadas); "
+                             "com --sync, elas entram no lugar das mais antigas")
+    parser.add_argument("--only-new", action="store_true",
+                        help="Só músicas novas para você: ignora as músicas salvas e as das suas playlists")
+    parser.add_argument("--trace", metavar="ARQUIVO",
+                        help="Grava a linha do tempo da execução (gênero → termo → página → espera; "
+                             "volume → lote) em JSON no formato Chrome trace, para abrir no Perfetto")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    filler = SpotifyPlaylistFiller()
-    filler.run()
+    args = parse_args()
+    filler = SpotifyPlaylistFiller(use_catalog=not args.no_catalog, only_new=args.only_new, trace=bool(args.trace))
+    try:
+        if args.resume:
+            filler.resume(args.resume)
+        elif args.sync:
+            filler.run(sync_playlist_id=playlist_id_from(args.sync), refresh=args.refresh)
+        else:
+            filler.run(refresh=args.refresh)
+    finally:
+        # Também ao interromper (Ctrl+C): o trace mostra onde o tempo foi gasto
+        if args.trace:
+            filler.save_trace(args.trace)
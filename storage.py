@@ -0,0 +1,23 @@
+"""
+Local SQLite storage helpers shared by the cache, catalog and job modules.
+
+All files live under MIXER_DATA_DIR (default: .mixer/ next to the scripts).
+Connections run in autocommit + WAL mode so the FastAPI threadpool, the search
+workers and other processes can read while one of them writes.
+"""
+import os
+import sqlite3
+
+DATA_DIR = os.getenv("MIXER_DATA_DIR", ".mixer")
+
+
+def data_path(filename):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, filename)
+
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
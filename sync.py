@@ -0,0 +1,186 @@
+"""
+Diff-based sync of a mix into an existing playlist.
+
+Refreshing "Phonk Mix" used to mean a brand-new playlist (and a full write)
+on every run. `sync_playlist` instead reads the playlist's current URIs
+(paginated `playlist_items`, only the `uri` field, 100 per page), diffs them
+against the new track set and issues only the minimal calls: removals first
+(`playlist_remove_all_occurrences_of_items`, 100 URIs per call, so the
+playlist never goes over its size limit), then the additions through
+batch_writer.BatchWriter. Tracks present in both are left where they are.
+
+With a `SyncStore`, the contents each sync leaves behind are remembered with
+the playlist's snapshot_id; when the playlist is still at that snapshot (no
+one edited it since), the read is a single `snapshot_id` lookup instead of
+~100 pages, so a small refresh of a 10k playlist costs tens of calls instead
+of a new playlist and 100-200 writes.
+
+With `rotate_limit` (incremental refreshes, see cursors.py) `desired` holds
+only the new tracks: they are appended and the oldest tracks rotate out so
+the playlist stays within the limit.
+
+Sync is idempotent: an interrupted sync is finished by running it again.
+"""
+import json
+import re
+import threading
+import time
+
+from batch_writer import BatchWriter, MAX_ITEMS_PER_CALL
+from storage import connect, data_path
+
+ITEM_FIELDS = "items(track(uri)),next"
+PLAYLIST_ID_PATTERN = re.compile(r"[A-Za-z0-9]{22}")
+PLAYLIST_REF_PATTERN = re.compile(r"playlist[/:]([A-Za-z0-9]{22})(?![A-Za-z0-9])")
+
+
+def playlist_id_from(value):
+    """
+    Playlist ID from an ID, a spotify:playlist: URI or an open.spotify.com link.
+    Links and URIs must name the playlist (a /user/<id>/playlist/<id> link
+    gives the playlist's ID, not the user's); a bare ID must be all the input.
+    """
+    value = value.strip()
+    if PLAYLIST_ID_PATTERN.fullmatch(value):
+        return value
+    match = PLAYLIST_REF_PATTERN.search(value)
+    if not match:
+        raise ValueError(f"Not a Spotify playlist ID or link: {value!r}")
+    return match.group(1)
+
+
+def playlist_pages(sp, limiter, playlist_id):
+    """Yields the URIs of each page of the playlist (local/unavailable items skipped)."""
+    offset = 0
+    while True:
+        page = limiter.call(sp.playlist_items, playlist_id, fields=ITEM_FIELDS,
+                            limit=MAX_ITEMS_PER_CALL, offset=offset)
+        items = page.get('items') or []
+        uris = [(item.get('track') or {}).get('uri') for item in items]
+        yield [uri for uri in uris if uri and not uri.startswith('spotify:local:')]
+        if not page.get('next') or not items:
+            return
+        offset += len(items)
+
+
+def playlist_uris(sp, limiter, playlist_id):
+    """Current URIs of the playlist, in playlist order."""
+    return [uri for page in playlist_pages(sp, limiter, playlist_id) for uri in page]
+
+
+def diff(current, desired):
+    """(to_remove, to_add): URIs only in the playlist, URIs only in the new set (its order)."""
+    current_set, desired_set = set(current), set(desired)
+    to_remove = [uri for uri in dict.fromkeys(current) if uri not in desired_set]
+    to_add = [uri for uri in dict.fromkeys(desired) if uri not in current_set]
+    return to_remove, to_add
+
+
+class SyncStore:
+    """Last synced contents of each playlist, keyed by the snapshot_id they belong to."""
+
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._conn = connect(path or data_path("sync.sqlite3"))
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS synced_playlists (
+                playlist_id TEXT PRIMARY KEY,
+                snapshot_id TEXT NOT NULL,
+                uris TEXT NOT NULL,
+                synced REAL NOT NULL
+            )
+            """
+        )
+
+    def get(self, playlist_id, snapshot_id):
+        """URIs recorded for the playlist at `snapshot_id`, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT uris FROM synced_playlists WHERE playlist_id = ? AND snapshot_id = ?",
+                (playlist_id, snapshot_id),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, playlist_id, snapshot_id, uris):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO synced_playlists (playlist_id, snapshot_id, uris, synced) VALUES (?, ?, ?, ?)",
+                (playlist_id, snapshot_id, json.dumps(uris), time.time()),
+            )
+
+
+class SyncResult:
+    def __init__(self):
+        self.kept = 0
+        self.removed = 0
+        self.added = 0
+        self.failures = []  # (uri, error message) of additions Spotify rejected
+        self.snapshot_id = None
+        self.calls = 0
+
+    def to_dict(self):
+        return {"kept": self.kept, "removed": self.removed, "added": self.added,
+                "failed": len(self.failures), "sync_calls": self.calls}
+
+
+def sync_playlist(sp, limiter, playlist_id, desired, batch_size=50, store=None, rotate_limit=None,
+                  log=None, on_progress=None):
+    """
+    Makes the playlist hold exactly the URIs of `desired` (or, with
+    `rotate_limit`, its newest tracks plus `desired`). `on_progress(result)`
+    is called after every write call. Token/permission errors (e.g. syncing a
+    playlist the user doesn't own) are raised.
+    """
+    log = log or (lambda message: None)
+    result = SyncResult()
+    current = None
+    if store:
+        result.snapshot_id = limiter.call(sp.playlist, playlist_id, fields="snapshot_id")['snapshot_id']
+        result.calls += 1
+        current = store.get(playlist_id, result.snapshot_id)
+    if current is None:
+        current = []
+        for page in playlist_pages(sp, limiter, playlist_id):
+            current.extend(page)
+            result.calls += 1
+    else:
+        log(f"Sync {playlist_id}: unchanged since the last sync, contents not re-read")
+    if rotate_limit:
+        current_set = set(current)
+        new = [uri for uri in dict.fromkeys(desired) if uri not in current_set]
+        keep = max(0, rotate_limit - len(new))
+        desired = (current[max(0, len(current) - keep):] if keep else []) + new
+    to_remove, to_add = diff(current, desired)
+    result.kept = len(set(current)) - len(to_remove)
+    log(f"Sync {playlist_id}: {len(current)} current, {result.kept} kept, "
+        f"{len(to_remove)} to remove, {len(to_add)} to add")
+
+    for i in range(0, len(to_remove), MAX_ITEMS_PER_CALL):
+        batch = to_remove[i:i + MAX_ITEMS_PER_CALL]
+        response = limiter.call(sp.playlist_remove_all_occurrences_of_items, playlist_id, batch)
+        result.calls += 1
+        result.removed += len(batch)
+        result.snapshot_id = (response or {}).get('snapshot_id') or result.snapshot_id
+        if on_progress:
+            on_progress(result)
+
+    writer = BatchWriter(sp, limiter, batch_size=batch_size, log=log)
+    added = []
+    i = 0
+    while i < len(to_add):
+        batch = to_add[i:i + writer.next_size()]
+        i += len(batch)
+        written = writer.write(playlist_id, batch)
+        added.extend(written.written)
+        result.calls += written.calls
+        result.added += len(written.written)
+        result.failures.extend(written.failures)
+        result.snapshot_id = written.snapshot_id or result.snapshot_id
+        if on_progress:
+            on_progress(result)
+
+    if store and result.snapshot_id:
+        removed = set(to_remove)
+        store.put(playlist_id, result.snapshot_id, [uri for uri in current if uri not in removed] + added)
+    return result
@@ -0,0 +1,41 @@
+"""
+Shared fixtures: a fake_spotify.py process (one per test session) that the
+clients built by sessions.spotify_client() talk to through SPOTIFY_API_BASE.
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FAKE_DEFAULTS = {"rate_limit": 0.0, "retry_after": 2, "burst_every": 0.0, "burst_seconds": 0.0,
+                 "error_rate": 0.0, "latency": {"default": 0.0}}
+
+
+@pytest.fixture(scope="session")
+def fake_process():
+    pytest.importorskip("fastapi")
+    pytest.importorskip("uvicorn")
+    from bench import start_fake
+
+    args = SimpleNamespace(seed=42, latency="default=0", rate_limit=0.0, error_rate=0.0, genre_size=5000)
+    process, api_base = start_fake(args)
+    yield api_base
+    process.terminate()
+    process.wait()
+
+
+@pytest.fixture
+def fake_api(fake_process, monkeypatch):
+    """The stand-in's API base; `fake_api.configure(**faults)` changes its faults for this test."""
+    from bench import fake_request
+
+    monkeypatch.setenv("SPOTIFY_API_BASE", fake_process)
+    fake_request(fake_process, "/_fake/reset")
+    api = SimpleNamespace(base=fake_process,
+                          configure=lambda **config: fake_request(fake_process, "/_fake/config", config),
+                          stats=lambda: fake_request(fake_process, "/_fake/stats"))
+    yield api
+    api.configure(**FAKE_DEFAULTS)
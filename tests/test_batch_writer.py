@@ -0,0 +1,45 @@
+import pytest
+from spotipy.exceptions import SpotifyException
+
+from batch_writer import BatchWriter, is_fatal, is_transient
+from rate_limiter import AdaptiveRateLimiter
+from sessions import spotify_client
+
+
+def test_5xx_is_retried_not_fatal(fake_api):
+    client = spotify_client(auth="token-a")
+    playlist = client.user_playlist_create(client.me()["id"], "Writer test")
+    uris = [f"spotify:track:{i:022d}" for i in range(40)]
+
+    fake_api.configure(error_rate=0.7)
+    writer = BatchWriter(client, AdaptiveRateLimiter(rate=100), batch_size=10, retries=5, backoff=0)
+    result = writer.write(playlist["id"], uris)
+
+    assert fake_api.stats()["errors"] > 0
+    assert result.written == uris
+    assert result.failures == []
+
+
+def test_header_less_max_retries_429_is_transient():
+    exhausted = SpotifyException(429, -1, "/v1/playlists/x/tracks:\n Max Retries")
+    assert is_transient(exhausted)
+    assert not is_fatal(exhausted)
+
+    throttled = SpotifyException(429, -1, "Too Many Requests", headers={"Retry-After": "3600"})
+    assert is_fatal(throttled)
+    assert not is_transient(throttled)
+
+
+def test_missing_playlist_is_not_bisected(fake_api):
+    client = spotify_client(auth="token-a")
+    writer = BatchWriter(client, AdaptiveRateLimiter(rate=100), retries=0, backoff=0)
+    with pytest.raises(SpotifyException) as error:
+        writer.write("0" * 22, [f"spotify:track:{i:022d}" for i in range(40)])
+    assert error.value.http_status == 404
+    assert fake_api.stats()["calls"] == 1
+
+
+def test_full_playlist_is_fatal():
+    full = SpotifyException(400, -1, "Playlist size limit reached")
+    assert is_fatal(full)
+    assert not is_fatal(SpotifyException(400, -1, "Invalid base62 id"))
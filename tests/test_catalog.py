@@ -0,0 +1,14 @@
+import sqlite3
+
+import pytest
+
+from catalog import TrackCatalog
+
+
+def test_failed_record_leaves_no_open_transaction(tmp_path):
+    catalog = TrackCatalog(path=str(tmp_path / "catalog.sqlite3"))
+    with pytest.raises(sqlite3.IntegrityError):
+        catalog.record([{"uri": "spotify:track:bad", "name": None}], "rock", "genre:\"rock\"")
+
+    catalog.record([{"uri": "spotify:track:good", "name": "Good"}], "rock", "genre:\"rock\"")
+    assert [track["uri"] for track in catalog.tracks_for_genre("rock", 10)] == ["spotify:track:good"]
@@ -0,0 +1,42 @@
+import pytest
+
+from journal import WriteJournal
+from pipeline import MixPipeline
+from rate_limiter import AdaptiveRateLimiter
+from sessions import spotify_client
+
+URIS = [f"spotify:track:{i:022d}" for i in range(250)]
+
+
+def _pipeline(client, journal, on_batch=None):
+    return MixPipeline(client, client.me()["id"], len(URIS), lambda num, total, count: (f"Vol {num}/{total}", ""),
+                       AdaptiveRateLimiter(rate=100), batch_size=10, max_batch=10, playlist_limit=100,
+                       window=50, on_batch=on_batch, journal=journal)
+
+
+def test_resume_writes_pending_tracks_to_their_volumes(fake_api, tmp_path):
+    client = spotify_client(auth="token-a")
+    journal = WriteJournal(path=str(tmp_path / "journal.sqlite3")).open("mix", {})
+    batches = []
+
+    def crash_after_three(volume):
+        batches.append(volume["num"])
+        if len(batches) == 3:
+            raise RuntimeError("process died")
+
+    def search(feed):
+        for i in range(0, len(URIS), 25):
+            feed(URIS[i:i + 25])
+
+    with pytest.raises(RuntimeError):
+        _pipeline(client, journal, crash_after_three).run(search)
+
+    resumed = _pipeline(client, journal)
+    assert resumed.restore()  # The search had finished: only writes are left
+    resumed.run(lambda feed: None)
+
+    assert [len(volume["tracks"]) for volume in resumed.volumes] == [100, 100, 50]
+    assert [volume["written"] for volume in resumed.volumes] == [100, 100, 50]
+    assert sorted(resumed.tracks) == URIS
+    totals = [client.playlist(volume["id"])["tracks"]["total"] for volume in resumed.volumes]
+    assert totals == [100, 100, 50]
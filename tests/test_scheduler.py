@@ -0,0 +1,48 @@
+import threading
+import time
+from scheduler import FairScheduler
+
+
+class Owner:
+    def __init__(self, user, remaining_work):
+        self.user = user
+        self.remaining_work = remaining_work
+
+
+def test_idle_users_are_forgotten():
+    scheduler = FairScheduler()
+    for i in range(1000):
+        owner = Owner(user=f"user-{i}", remaining_work=10)
+        for _ in range(3):
+            scheduler.acquire(owner, lambda: None)
+    assert scheduler.grants == 3000
+    assert scheduler.tracked_users() == 0
+
+
+def test_users_still_take_turns():
+    scheduler = FairScheduler()
+    small = Owner("small", 10)
+    whale = Owner("whale", 100000)
+    holding, release = threading.Event(), threading.Event()
+    order = []
+
+    def hold():
+        holding.set()
+        release.wait()
+
+    blocker = threading.Thread(target=scheduler.acquire, args=(Owner("other", 1), hold))
+    blocker.start()
+    holding.wait()
+    # While "other" holds the slot, both users queue two calls
+    threads = [threading.Thread(target=scheduler.acquire, args=(owner, lambda o=owner: order.append(o.user)))
+               for owner in (whale, whale, small, small)]
+    for thread in threads:
+        thread.start()
+    while scheduler.waiting() < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads + [blocker]:
+        thread.join()
+    # Shortest remaining work breaks the tie; the lead it gives then sends the whale next
+    assert order == ["small", "whale", "small", "whale"]
+    assert scheduler.tracked_users() == 0
@@ -0,0 +1,12 @@
+from search_cache import SearchCache
+
+
+def test_max_age_turns_older_entries_into_misses(tmp_path):
+    cache = SearchCache(path=str(tmp_path / "cache.sqlite3"), ttl=3600)
+    cache.put("search", "genre:\"rock\" tag:new", 0, 20, None, ["cached"])
+
+    assert cache.fetch("search", "genre:\"rock\" tag:new", 0, 20, None, lambda: ["fresh"]) == (["cached"], True)
+    assert cache.fetch("search", "genre:\"rock\" tag:new", 0, 20, None, lambda: ["fresh"],
+                       max_age=0) == (["fresh"], False)
+    # The refetched page replaced the entry for everyone
+    assert cache.get("search", "genre:\"rock\" tag:new", 0, 20) == ["fresh"]
@@ -0,0 +1,25 @@
+from catalog import TrackCatalog
+from rate_limiter import AdaptiveRateLimiter
+from search_cache import SearchCache
+from search_engine import SearchEngine
+from sessions import spotify_client
+from yield_stats import TermYieldStore
+
+
+def test_cache_served_pages_leave_term_yields_alone(fake_api, tmp_path):
+    cache = SearchCache(path=str(tmp_path / "cache.sqlite3"))
+    yields = TermYieldStore(path=str(tmp_path / "yield.sqlite3"))
+
+    def run(catalog):
+        engine = SearchEngine(spotify_client(auth="token-a"), AdaptiveRateLimiter(rate=100), page_window=1,
+                              cache=cache, catalog=catalog, catalog_first=True, yield_store=yields)
+        engine.search(["rock"], 60)
+        return engine.stats
+
+    cold = run(TrackCatalog(path=str(tmp_path / "cold.sqlite3")))
+    learned = yields.totals("rock")
+    assert cold["cache_misses"] and learned
+
+    cached = run(TrackCatalog(path=str(tmp_path / "empty.sqlite3")))  # Same pages, all from the cache
+    assert cached["cache_hits"] == cold["cache_misses"] and not cached["cache_misses"]
+    assert yields.totals("rock") == learned
@@ -0,0 +1,35 @@
+import pytest
+from spotipy.exceptions import SpotifyException
+
+from rate_limiter import AdaptiveRateLimiter, retry_after_from
+from sessions import spotify_client
+
+
+def test_429_keeps_its_retry_after(fake_api):
+    fake_api.configure(rate_limit=0.001, retry_after=82)
+    client = spotify_client(auth="token-a")
+    with pytest.raises(SpotifyException) as error:
+        client.search(q='genre:"rock"', type="track", limit=5)
+    assert error.value.http_status == 429
+    assert retry_after_from(error.value) == 82
+    assert fake_api.stats()["throttled"] == 1  # Not retried behind the caller's back
+
+
+def test_5xx_is_not_reported_as_a_rate_limit(fake_api):
+    fake_api.configure(error_rate=1.0)
+    client = spotify_client(auth="token-a")
+    with pytest.raises(SpotifyException) as error:
+        client.search(q='genre:"rock"', type="track", limit=5)
+    assert error.value.http_status in (500, 502, 503)
+    assert retry_after_from(error.value) is None
+
+
+def test_limiter_waits_the_retry_after_spotify_asks_for(fake_api):
+    fake_api.configure(rate_limit=0.001, retry_after=1)
+    client = spotify_client(auth="token-a")
+    limiter = AdaptiveRateLimiter(rate=10, max_retries=1)
+    with pytest.raises(SpotifyException):
+        limiter.call(client.search, q='genre:"rock"', type="track", limit=5)
+    assert limiter.throttle_events == 1
+    assert limiter.retry_after_seconds == 1.0
+    assert limiter.throttled_seconds >= 0.9
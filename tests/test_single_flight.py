@@ -0,0 +1,54 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def _concurrent(flight, key, leader_fn, waiter_fn):
+    """Runs leader_fn, then waiter_fn while the leader is still in flight."""
+    started, release = threading.Event(), threading.Event()
+    outcomes = {}
+
+    def leader():
+        started.set()
+        release.wait()
+        return leader_fn()
+
+    def run(name, fn):
+        try:
+            outcomes[name] = flight.do(key, fn)
+        except Exception as e:
+            outcomes[name] = e
+
+    first = threading.Thread(target=run, args=("leader", leader))
+    first.start()
+    started.wait()
+    second = threading.Thread(target=run, args=("waiter", waiter_fn))
+    second.start()
+    while flight.stats()["calls_saved"] == 0:
+        time.sleep(0.001)  # Until the waiter is parked on the leader's flight
+    release.set()
+    first.join()
+    second.join()
+    return outcomes
+
+
+def test_waiters_share_a_success():
+    flight = SingleFlight()
+    outcomes = _concurrent(flight, "k", lambda: "items", lambda: pytest.fail("not called"))
+    assert outcomes == {"leader": ("items", False), "waiter": ("items", True)}
+    assert flight.stats()["upstream_calls"] == 1
+
+
+def test_waiter_makes_its_own_call_after_a_failure():
+    flight = SingleFlight()
+
+    def fail():
+        raise RuntimeError("401 for the leader's token")
+
+    outcomes = _concurrent(flight, "k", fail, lambda: "waiter items")
+    assert isinstance(outcomes["leader"], RuntimeError)
+    assert outcomes["waiter"] == ("waiter items", False)
+    assert flight.stats() == {"upstream_calls": 2, "calls_saved": 0, "in_flight": 0}
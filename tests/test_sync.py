@@ -0,0 +1,29 @@
+import pytest
+
+from sync import playlist_id_from
+
+PLAYLIST = "37i9dQZF1DXcBWIGoYBM5M"
+USER = "abcdefghijklmnopqrstuv"
+
+
+@pytest.mark.parametrize("value", [
+    PLAYLIST,
+    f"  {PLAYLIST}\n",
+    f"spotify:playlist:{PLAYLIST}",
+    f"spotify:user:{USER}:playlist:{PLAYLIST}",
+    f"https://open.spotify.com/playlist/{PLAYLIST}?si=0123456789abcdef",
+    f"https://open.spotify.com/user/{USER}/playlist/{PLAYLIST}",
+])
+def test_playlist_id_from(value):
+    assert playlist_id_from(value) == PLAYLIST
+
+
+@pytest.mark.parametrize("value", [
+    f"https://open.spotify.com/user/{USER}",
+    f"https://open.spotify.com/track/{PLAYLIST}",
+    f"spotify:playlist:{PLAYLIST}x",
+    f"{PLAYLIST}x",
+])
+def test_rejects_what_names_no_playlist(value):
+    with pytest.raises(ValueError):
+        playlist_id_from(value)
@@ -0,0 +1,218 @@
+"""
+Per-job span trees, exportable in the Chrome trace-event format (Perfetto,
+chrome://tracing).
+
+A Tracer records the spans of one run: job -> genre -> term -> page request
+-> sleep, and volume -> batch write, each with timestamps and attributes
+(offset, items returned, new uniques, HTTP status, ...). Spans are started
+explicitly on the coordinator threads and entered (`with span:`) on the
+threads that do the work; an entered span is that thread's current span, so
+the rate limiter can hang its sleeps and 429s under whatever request it is
+pacing without being told about pages or batches.
+
+Logical spans (job, genre, term, volume) are drawn on one named lane each;
+work spans on the lane of the thread that ran them. A trace keeps at most
+TRACE_MAX_SPANS spans; later ones still work but are not recorded (counted
+in `dropped`).
+
+Components take `tracer=None` and fall back to NULL_TRACER, which records
+nothing.
+"""
+import os
+import threading
+import time
+
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", 20000))
+
+
+class Span:
+    def __init__(self, tracer, span_id, name, parent_id, lane, attrs):
+        self.tracer = tracer
+        self.id = span_id
+        self.name = name
+        self.parent_id = parent_id
+        self.lane = lane
+        self.attrs = attrs
+        self.start = None
+        self.end = None
+        self.thread = None
+        self.instant = False
+
+    def begin(self):
+        self.start = time.perf_counter()
+        self.thread = threading.current_thread().name
+        return self
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        if self.start is None:
+            self.begin()
+        self.tracer._push(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer._pop(self)
+        if exc is not None:
+            self.attrs["error"] = str(exc)[:200]
+            status = getattr(exc, "http_status", None)
+            if status:
+                self.attrs["http_status"] = status
+        self.finish()
+        return False
+
+
+class Tracer:
+    """
+    Spans of one run under a root span named `name` (started at once, with
+    `attrs`). `span()` creates a span to start or enter later, `start()` a
+    started one; both default their parent to the thread's current span.
+    """
+
+    def __init__(self, name="job", max_spans=TRACE_MAX_SPANS, **attrs):
+        self.max_spans = max_spans
+        self.dropped = 0
+        self.origin = time.perf_counter()
+        self.wall_start = time.time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._spans = []
+        self.root = None
+        self.root = self.start(name, lane=name, **attrs)
+
+    def _new(self, name, parent, lane, attrs):
+        parent = parent or self.current()
+        with self._lock:
+            span = Span(self, len(self._spans) + 1, name, parent.id if parent else None, lane, attrs)
+            if len(self._spans) < self.max_spans:
+                self._spans.append(span)
+            else:
+                self.dropped += 1
+        return span
+
+    def span(self, name, parent=None, lane=None, **attrs):
+        return self._new(name, parent, lane, attrs)
+
+    def start(self, name, parent=None, lane=None, **attrs):
+        return self._new(name, parent, lane, attrs).begin()
+
+    def record(self, name, start, end, parent=None, **attrs):
+        """A span that already happened (`start`/`end` are perf_counter() values)."""
+        span = self._new(name, parent, None, attrs).begin()
+        span.start, span.end = start, end
+        return span
+
+    def event(self, name, parent=None, **attrs):
+        """A zero-length marker (e.g. a 429)."""
+        span = self._new(name, parent, None, attrs).begin()
+        span.end, span.instant = span.start, True
+        return span
+
+    def current(self):
+        stack = getattr(self._local, "stack", None)
+        return stack[-1] if stack else self.root
+
+    def _push(self, span):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        self._local.stack.append(span)
+
+    def _pop(self, span):
+        stack = getattr(self._local, "stack", None)
+        if stack and stack[-1] is span:
+            stack.pop()
+
+    def _snapshot(self):
+        with self._lock:
+            return list(self._spans)
+
+    def to_tree(self):
+        """The span tree as nested dicts (seconds since the trace started)."""
+        now = time.perf_counter()
+        nodes = {}
+        for span in self._snapshot():
+            if span.start is None:
+                continue  # Created but not running yet (e.g. a queued page)
+            end = span.end if span.end is not None else now
+            nodes[span.id] = {
+                "name": span.name, "start": round(span.start - self.origin, 6),
+                "duration": round(end - span.start, 6), "open": span.end is None,
+                "thread": span.thread, **({"attrs": dict(span.attrs)} if span.attrs else {}), "children": [],
+                "_parent": span.parent_id,
+            }
+        roots = []
+        for node in nodes.values():
+            parent = nodes.get(node.pop("_parent"))
+            (parent["children"] if parent else roots).append(node)
+        return {"started": self.wall_start, "dropped": self.dropped, "spans": roots}
+
+    def to_chrome(self):
+        """{"traceEvents": [...]} in the Chrome trace-event format."""
+        now = time.perf_counter()
+        lanes = {}
+        events = []
+        for span in self._snapshot():
+            if span.start is None:
+                continue
+            lane = span.lane or span.thread
+            tid = lanes.setdefault(lane, len(lanes) + 1)
+            event = {
+                "name": span.name, "cat": span.name, "pid": 1, "tid": tid,
+                "ts": round((span.start - self.origin) * 1e6, 1),
+                "args": {**span.attrs, "span_id": span.id, "parent_id": span.parent_id},
+            }
+            if span.instant:
+                event.update(ph="i", s="t")
+            else:
+                end = span.end if span.end is not None else now
+                event.update(ph="X", dur=round((end - span.start) * 1e6, 1))
+            events.append(event)
+        metadata = [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": self.root.name}}]
+        for lane, tid in lanes.items():
+            metadata.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": lane}})
+            metadata.append({"name": "thread_sort_index", "ph": "M", "pid": 1, "tid": tid,
+                             "args": {"sort_index": tid}})
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms",
+                "otherData": {"started": self.wall_start, "dropped_spans": self.dropped}}
+
+
+class _NullSpan:
+    def begin(self):
+        return self
+
+    def finish(self):
+        pass
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class _NullTracer:
+    root = NULL_SPAN = _NullSpan()
+
+    def span(self, name, parent=None, lane=None, **attrs):
+        return self.NULL_SPAN
+
+    start = span
+
+    def record(self, name, start, end, parent=None, **attrs):
+        return self.NULL_SPAN
+
+    def event(self, name, parent=None, **attrs):
+        return self.NULL_SPAN
+
+    def current(self):
+        return self.NULL_SPAN
+
+
+NULL_TRACER = _NullTracer()
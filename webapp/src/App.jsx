@@ -31,23 +31,7 @@ function App() {
   // Progress State
   const [progress, setProgress] = useState(0)
 
-  useEffect(() => {
-    let interval
-    if (view === 'processing') {
-      setProgress(0)
-      interval = setInterval(() => {
-        setProgress(prev => {
-          if (prev >= 95) return prev // Stall at 95% until done
-          // Slow down as we get higher
-          const inc = prev < 50 ? 5 : prev < 80 ? 2 : 1
-          return prev + inc
-        })
-      }, 800)
-    } else {
-      setProgress(0)
-    }
-    return () => clearInterval(interval)
-  }, [view])
+  const [progressText, setProgressText] = useState('')
 
   // Error State
   const [errorData, setErrorData] = useState(null)
@@ -169,29 +153,75 @@ function App() {
     }
   }
 
+  // Real progress: the mix runs as a server job and streams its events (SSE)
+  const describeEvent = (event) => {
+    switch (event.event) {
+      case 'genre_started': return `Searching ${event.genre}...`
+      case 'page_fetched': return `${event.genre}: +${event.new} tracks (${Math.round(event.page_yield * 100)}% new)`
+      case 'volume_created': return `Created ${event.name}`
+      case 'batch_written': return `${event.written} tracks added`
+      case 'throttled': return `Spotify rate limit: waiting ${event.seconds}s`
+      default: return null
+    }
+  }
+
   const handleCreate = async () => {
     setView('processing')
+    setProgress(0)
+    setProgressText('')
     try {
+      const target = parseInt(trackCount)
       const payload = {
         token,
         genres: selectedGenres,
         playlist_name: playlistName,
         description: description,
-        track_count: parseInt(trackCount)
+        track_count: target
       }
-      const res = await axios.post('http://localhost:8000/execute', payload)
-
-      if (res.data.status === 'success') {
-        setResultLinks(res.data.links)
-        setView('success')
-        showNotification("Playlists created successfully!", "success")
-      } else if (res.data.status === 'rate_limit') {
-        setErrorData(res.data)
-        setView('error')
-      } else {
-        showNotification("Error: " + res.data.message, "error")
-        setView('dashboard')
+      const job = await axios.post('http://localhost:8000/jobs', payload)
+      const source = new EventSource(`http://localhost:8000/jobs/${job.data.job_id}/events`)
+      let found = 0
+
+      const onEvent = (e) => {
+        const event = JSON.parse(e.data)
+        if (event.event === 'page_fetched') found += event.new
+        // Search fills the first half of the bar, writing the second
+        const written = event.event === 'batch_written' ? event.written : null
+        setProgress(prev => {
+          const next = written !== null
+            ? 50 + Math.round(50 * written / target)
+            : Math.round(50 * Math.min(found, target) / target)
+          return Math.min(99, Math.max(prev, next))
+        })
+        const text = describeEvent(event)
+        if (text) setProgressText(text)
       }
+      for (const type of ['genre_started', 'page_fetched', 'volume_created', 'batch_written', 'throttled']) {
+        source.addEventListener(type, onEvent)
+      }
+      source.onerror = () => {
+        // Transient drops reconnect on their own (resuming via Last-Event-ID)
+        if (source.readyState === EventSource.CLOSED) {
+          showNotification("Lost connection to the progress stream.", "error")
+          setView('dashboard')
+        }
+      }
+      source.addEventListener('done', (e) => {
+        source.close()
+        const res = JSON.parse(e.data).result || {}
+        setProgress(100)
+        if (res.status === 'success') {
+          setResultLinks(res.links)
+          setView('success')
+          showNotification("Playlists created successfully!", "success")
+        } else if (res.status === 'rate_limit') {
+          setErrorData(res)
+          setView('error')
+        } else {
+          showNotification("Error: " + (res.message || "Job cancelled."), "error")
+          setView('dashboard')
+        }
+      })
     } catch (e) {
       showNotification("Critical Error: " + e.message, "error")
       setView('dashboard')
@@ -484,6 +514,9 @@ function App() {
             </div>
 
             <p style={{ color: 'rgba(255,255,255,0.8)', fontSize: 12, letterSpacing: 1 }}>SEARCHING TRACKS AND FILLING PLAYLISTS.</p>
+            {progressText && (
+              <p style={{ color: 'rgba(255,255,255,0.6)', fontSize: 12 }}>{progressText}</p>
+            )}
           </motion.div>
         )}
 
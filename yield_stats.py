@@ -0,0 +1,59 @@
+"""
+Per-term yield history for the search engine.
+
+The yield of a search page is the share of its items that became new unique
+tracks for the genre after filtering. The engine stops paging a term once a
+page falls below its threshold; this store keeps the totals across runs so the
+next mix for the same genre tries its most productive terms (and shards) first
+and leaves the ones that only returned duplicates or nothing for last.
+"""
+import threading
+import time
+
+from storage import connect, data_path
+
+DEFAULT_YIELD = 0.5  # Prior for terms without history: after proven terms, before dead ones
+
+
+class TermYieldStore:
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._conn = connect(path or data_path("term_yield.sqlite3"))
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS term_yield ("
+            " genre TEXT NOT NULL, term TEXT NOT NULL,"
+            " pages INTEGER NOT NULL, items INTEGER NOT NULL, new_tracks INTEGER NOT NULL,"
+            " updated REAL NOT NULL, PRIMARY KEY (genre, term))"
+        )
+
+    def record(self, genre, term, pages, items, new_tracks):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO term_yield (genre, term, pages, items, new_tracks, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(genre, term) DO UPDATE SET"
+                " pages = pages + excluded.pages, items = items + excluded.items,"
+                " new_tracks = new_tracks + excluded.new_tracks, updated = excluded.updated",
+                (genre, term, pages, items, new_tracks, time.time()),
+            )
+
+    def totals(self, genre):
+        """{term: (pages, items, new_tracks)} recorded for `genre`."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT term, pages, items, new_tracks FROM term_yield WHERE genre = ?", (genre,)
+            ).fetchall()
+        return {term: (pages, items, new_tracks) for term, pages, items, new_tracks in rows}
+
+    def yields(self, genre):
+        """{term: new_tracks per page slot} from the stored history of `genre`."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT term, pages, items, new_tracks FROM term_yield WHERE genre = ?", (genre,)
+            ).fetchall()
+        # An empty first page (items == 0) still counts as a page with zero yield
+        return {term: new_tracks / max(items, pages) for term, pages, items, new_tracks in rows}
+
+    def order(self, genre, terms):
+        """`terms` sorted by historical yield, best first; ties keep their order."""
+        history = self.yields(genre)
+        return sorted(terms, key=lambda term: -history.get(term, DEFAULT_YIELD))